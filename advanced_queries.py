@@ -1,31 +1,13 @@
-import configparser
 import pandas as pd
-from monkdb import client
+from database import connect, DB_SCHEMA, RASTER_TABLE
+import metrics
 import os
 import time
 import re
 
-# Load configuration
-config = configparser.ConfigParser()
-config.read("config.ini", encoding="utf-8")
-
-DB_HOST = config['database']['DB_HOST']
-DB_PORT = config['database']['DB_PORT']
-DB_USER = config['database']['DB_USER']
-DB_PASSWORD = config['database']['DB_PASSWORD']
-DB_SCHEMA = config['database']['DB_SCHEMA']
-RASTER_TABLE = config['database']['RASTER_GEO_SHAPE_TABLE_V2']
-
 results_dir = os.path.join(os.getcwd(), "results", "v3")
-os.makedirs(results_dir, exist_ok=True)
 summary_path = os.path.join(results_dir, "query_adv_v3.txt")
 
-conn = client.connect(
-    f"http://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}",
-    username=DB_USER
-)
-cursor = conn.cursor()
-
 
 def safe_filename(title: str) -> str:
     return re.sub(r'\W+', '_', title.lower()).strip('_') + ".csv"
@@ -104,35 +86,51 @@ queries = {
     """
 }
 
-with open(summary_path, "w", encoding="utf-8") as summary:
-    for name, sql in queries.items():
-        summary.write(f"\n\n### {name}\n")
-        start = time.perf_counter()
-        try:
-            cursor.execute(sql)
-            rows = cursor.fetchall()
-            duration = round(time.perf_counter() - start, 3)
-
-            if rows:
-                df = pd.DataFrame(rows)
-                file_name = safe_filename(name)
-                csv_path = os.path.join(results_dir, file_name)
-                df.to_csv(csv_path, index=False)
-                summary.write(f"✅ Query succeeded. Rows: {len(df)}\n")
-                summary.write(f"⏱️ Duration: {duration} sec\n")
-                summary.write(f"📁 Saved to: {csv_path}\n")
-            else:
-                summary.write("⚠️ No results returned.\n")
+
+def main():
+    os.makedirs(results_dir, exist_ok=True)
+
+    metrics.instrument_database()
+    conn = connect()
+    cursor = conn.cursor()
+
+    query_seconds = metrics.histogram("query_seconds", "End-to-end time per named query")
+    with open(summary_path, "w", encoding="utf-8") as summary, metrics.span("queries.advanced"):
+        for name, sql in queries.items():
+            summary.write(f"\n\n### {name}\n")
+            start = time.perf_counter()
+            try:
+                cursor.execute(sql)
+                rows = cursor.fetchall()
+                duration = round(time.perf_counter() - start, 3)
+                query_seconds.observe(duration, query=name)
+
+                if rows:
+                    df = pd.DataFrame(rows)
+                    file_name = safe_filename(name)
+                    csv_path = os.path.join(results_dir, file_name)
+                    df.to_csv(csv_path, index=False)
+                    summary.write(f"✅ Query succeeded. Rows: {len(df)}\n")
+                    summary.write(f"⏱️ Duration: {duration} sec\n")
+                    summary.write(f"📁 Saved to: {csv_path}\n")
+                else:
+                    summary.write("⚠️ No results returned.\n")
+                    summary.write(f"⏱️ Duration: {duration} sec\n")
+
+                print(f"✅ Completed: {name}")
+
+            except Exception as e:
+                duration = round(time.perf_counter() - start, 3)
+                query_seconds.observe(duration, query=name)
+                summary.write(f"❌ Query failed: {e}\n")
                 summary.write(f"⏱️ Duration: {duration} sec\n")
+                print(f"❌ Failed: {name} — {e}")
 
-            print(f"✅ Completed: {name}")
+    cursor.close()
+    conn.close()
+    metrics.export("advanced_queries")
+    print(f"\n🎯 All queries completed. Results saved to: {results_dir}")
 
-        except Exception as e:
-            duration = round(time.perf_counter() - start, 3)
-            summary.write(f"❌ Query failed: {e}\n")
-            summary.write(f"⏱️ Duration: {duration} sec\n")
-            print(f"❌ Failed: {name} — {e}")
 
-cursor.close()
-conn.close()
-print(f"\n🎯 All queries completed. Results saved to: {results_dir}")
+if __name__ == "__main__":
+    main()
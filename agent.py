@@ -1,19 +1,96 @@
 import os
-import torch
+import time
+import logging
+import threading
+from contextlib import contextmanager
 import pandas as pd
-from transformers import pipeline
 from dotenv import load_dotenv
 from mcp_monkdb.mcp_server import run_select_query
 
 load_dotenv()
 
-# === Load TinyLlama ===
-pipe = pipeline(
-    "text-generation",
-    model="TinyLlama/TinyLlama-1.1B-Chat-v1.0",
-    torch_dtype=torch.bfloat16,
-    device_map="auto",
-)
+# llm_backends reads its settings from the environment, so import after .env
+from llm_backends import load_backend  # noqa: E402
+from chat_scheduler import BatchScheduler, QueueFullError  # noqa: E402
+from insight_cache import InsightCache, normalize_sql, table_version  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# === Model backend (loaded lazily on first use or by warm_up) ===
+LLM_BACKEND = os.getenv("LLM_BACKEND", "transformers")
+_backend = None
+_backend_lock = threading.Lock()
+_scheduler = None
+# Separate from _backend_lock, which warm_up holds for the whole model load
+_scheduler_lock = threading.Lock()
+
+MAX_NEW_TOKENS = int(os.getenv("CHAT_MAX_NEW_TOKENS", "512"))
+
+# === Answer cache for repeated SQL (INSIGHT_CACHE_SIZE / INSIGHT_CACHE_TTL) ===
+insight_cache = InsightCache()
+
+
+class StageTimings:
+    """
+    Wall-clock seconds and token counts for the stages of one chat reply.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.tokens = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "stages_sec": {k: round(v, 4) for k, v in self.stages.items()},
+            "tokens": dict(self.tokens),
+        }
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend = load_backend(LLM_BACKEND)
+                logger.info("Loaded %s backend in %.2fs",
+                            backend.name, backend.load_seconds)
+                _backend = backend
+    return _backend
+
+
+def get_scheduler() -> BatchScheduler:
+    """
+    Shared request scheduler in front of the model (created on first use).
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = BatchScheduler(get_backend)
+    return _scheduler
+
+
+def warm_up(background: bool = True):
+    """
+    Load the model ahead of the first request, optionally off-thread so the
+    UI can start serving immediately.
+    """
+    if not background:
+        return get_backend()
+    thread = threading.Thread(target=get_backend, name="llm-warmup", daemon=True)
+    thread.start()
+    return thread
 
 # === Updated System Prompt ===
 SYSTEM_PROMPT = """
@@ -29,10 +106,24 @@ Follow these principles:
 Return 3-5 bullet points. Each bullet must convey one key insight or takeaway.
 """
 
+# === Result preview / summary settings ===
+PREVIEW_ROWS = int(os.getenv("CHAT_PREVIEW_ROWS", "10"))
+CATEGORICAL_LIMIT = 10
+TOP_VALUES = 3
+
 # === Helper: Tabular summary for TinyLlama ===
 
 
-def generate_data_summary(df: pd.DataFrame) -> str:
+def generate_data_summary(df: pd.DataFrame, stats: dict = None) -> str:
+    """
+    Text summary of a result for the prompt.
+
+    `stats` comes from `summarize_result` and covers the full result set;
+    without it the summary falls back to the preview rows in `df`.
+    """
+    if stats is not None:
+        return _format_stats(df, stats)
+
     lines = []
     lines.append(f"📊 Columns: {', '.join(df.columns)}")
     lines.append(f"🧮 Rows: {len(df)}")
@@ -52,51 +143,214 @@ def generate_data_summary(df: pd.DataFrame) -> str:
 
     return "\n".join(lines)
 
+
+def _format_stats(df: pd.DataFrame, stats: dict) -> str:
+    lines = []
+    lines.append(f"📊 Columns: {', '.join(df.columns)}")
+    lines.append(f"🧮 Rows: {stats['rows']} (showing {len(df)})")
+
+    for col in df.columns:
+        col_stats = stats["columns"].get(col)
+        if col_stats is None:
+            continue
+        if "avg" in col_stats and col_stats["avg"] is not None:
+            lines.append(
+                f"📈 {col}: min={col_stats['min']:.2f}, max={col_stats['max']:.2f}, avg={col_stats['avg']:.2f}"
+            )
+        elif col_stats.get("top"):
+            formatted = ", ".join(f"{k} ({v})" for k, v in col_stats["top"])
+            lines.append(f"🗂️ {col}: {formatted}")
+        else:
+            lines.append(f"📁 {col}: ~{col_stats['distinct']} unique values")
+
+    return "\n".join(lines)
+
 # === Query Runner ===
 
 
-def query_monkdb(sql: str) -> tuple[str, pd.DataFrame]:
+def _strip_statement(sql: str) -> str:
+    return sql.strip().rstrip(";").strip()
+
+
+def _quote(column: str) -> str:
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _is_scalar(series: pd.Series) -> bool:
+    # GEO_SHAPE / OBJECT / ARRAY values arrive as dicts and lists
+    values = series.dropna()
+    return values.empty or not isinstance(values.iloc[0], (dict, list))
+
+
+def query_monkdb(sql: str, timings: StageTimings = None) -> tuple[str, pd.DataFrame]:
+    """
+    Run the user's SELECT with a server-side LIMIT and return the preview.
+
+    The statement is wrapped as a subquery so MonkDB stops after
+    PREVIEW_ROWS rows instead of shipping the whole result over MCP.
+    """
+    timings = timings or StageTimings()
     try:
-        result = run_select_query(sql)
+        with timings.stage("mcp_query"):
+            result = run_select_query(
+                f"SELECT * FROM ({_strip_statement(sql)}) AS q LIMIT {PREVIEW_ROWS}")
         if isinstance(result, dict) and result.get("status") == "error":
             return f"❌ Query failed: {result['message']}", pd.DataFrame()
         if isinstance(result, list) and result:
-            df = pd.DataFrame(result)
-            return "", df.head(10)
+            return "", pd.DataFrame(result)
         return "No results found.", pd.DataFrame()
     except Exception as e:
         return f"MCP query error: {e}", pd.DataFrame()
 
+
+def summarize_result(sql: str, preview: pd.DataFrame, timings: StageTimings = None):
+    """
+    Column statistics over the full result of `sql`, computed in MonkDB.
+
+    One aggregate query returns the row count, min/max/avg of numeric
+    columns and `hyperloglog_distinct` for every scalar column. Columns
+    with fewer than CATEGORICAL_LIMIT distinct values then get their top
+    values from a single UNION ALL of GROUP BYs. Column types are taken
+    from the preview. Returns None if the aggregation fails, so callers
+    can fall back to summarizing the preview.
+    """
+    timings = timings or StageTimings()
+    subquery = _strip_statement(sql)
+    columns = [c for c in preview.columns if _is_scalar(preview[c])]
+    numeric = {c for c in columns
+               if pd.api.types.is_numeric_dtype(preview[c])
+               and not pd.api.types.is_bool_dtype(preview[c])}
+
+    selects = ['COUNT(*) AS "rows"']
+    for i, col in enumerate(columns):
+        quoted = _quote(col)
+        if col in numeric:
+            selects += [f"MIN(q.{quoted}) AS min_{i}", f"MAX(q.{quoted}) AS max_{i}",
+                        f"AVG(q.{quoted}) AS avg_{i}"]
+        selects.append(f"hyperloglog_distinct(q.{quoted}) AS distinct_{i}")
+
+    try:
+        with timings.stage("summary_query"):
+            result = run_select_query(
+                f"SELECT {', '.join(selects)} FROM ({subquery}) AS q")
+        if not isinstance(result, list) or not result:
+            return None
+        row = result[0]
+        stats = {"rows": row["rows"], "columns": {}}
+        for i, col in enumerate(columns):
+            col_stats = {"distinct": row[f"distinct_{i}"]}
+            if col in numeric:
+                col_stats.update(min=row[f"min_{i}"], max=row[f"max_{i}"],
+                                 avg=row[f"avg_{i}"])
+            stats["columns"][col] = col_stats
+
+        categorical = [i for i, col in enumerate(columns)
+                       if col not in numeric
+                       and (stats["columns"][col]["distinct"] or 0) < CATEGORICAL_LIMIT]
+        if categorical:
+            branches = [
+                f"""SELECT * FROM (
+                        SELECT {i} AS col, CAST(q.{_quote(columns[i])} AS TEXT) AS value,
+                               COUNT(*) AS n
+                        FROM ({subquery}) AS q
+                        GROUP BY 1, 2 ORDER BY n DESC LIMIT {TOP_VALUES}) AS t{i}"""
+                for i in categorical
+            ]
+            with timings.stage("summary_query"):
+                top_rows = run_select_query(" UNION ALL ".join(branches))
+            if isinstance(top_rows, list):
+                for top in top_rows:
+                    col_stats = stats["columns"][columns[top["col"]]]
+                    col_stats.setdefault("top", []).append((top["value"], top["n"]))
+                for col_stats in stats["columns"].values():
+                    col_stats.get("top", []).sort(key=lambda item: -item[1])
+        return stats
+    except Exception as e:
+        logger.warning("Server-side summary failed, using preview rows: %s", e)
+        return None
+
 # === Main Response Generator ===
 
 
-def generate_response(user_input: str) -> str:
+def generate_response(user_input: str, timings: StageTimings = None):
+    """
+    Yield the reply as it grows, one update per generated chunk.
+
+    Each yielded value is the full reply so far, which is what Gradio
+    expects from a streaming handler. Errors are yielded as a single reply.
+    Per-stage seconds and token counts are recorded on `timings` (pass
+    your own StageTimings to read them afterwards) and logged at the end.
+    """
+    timings = timings or StageTimings()
     user_input = user_input.strip()
+    cache_key = None
 
     # If it's a SQL query
     if user_input.lower().startswith("select"):
-        error_msg, df = query_monkdb(user_input)
+        # Same statement against unchanged tables -> reuse the last answer
+        with timings.stage("cache_lookup"):
+            cache_key = (normalize_sql(user_input),
+                         table_version(run_select_query, user_input))
+            cached = insight_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Insight cache hit: %s", insight_cache.stats())
+            yield cached
+            return
+        error_msg, df = query_monkdb(user_input, timings)
         if error_msg:
-            return error_msg
-        data_summary = generate_data_summary(df)
-        prompt = pipe.tokenizer.apply_chat_template([
+            yield error_msg
+            return
+        stats = summarize_result(user_input, df, timings)
+        with timings.stage("summarize"):
+            data_summary = generate_data_summary(df, stats)
+            table = df.to_string(index=False)
+        messages = [
             {"role": "system", "content": SYSTEM_PROMPT.strip()},
             {"role": "user",
-                "content": f"Here are the top SQL results:\n{df.to_string(index=False)}\n\nHere is a summary:\n{data_summary}\n\nSummarize or explain the insights."}
-        ], tokenize=False, add_generation_prompt=True)
+                "content": f"Here are the top SQL results:\n{table}\n\nHere is a summary:\n{data_summary}\n\nSummarize or explain the insights."}
+        ]
     else:
-        prompt = pipe.tokenizer.apply_chat_template([
+        messages = [
             {"role": "system", "content": SYSTEM_PROMPT.strip()},
             {"role": "user", "content": user_input}
-        ], tokenize=False, add_generation_prompt=True)
-
-    outputs = pipe(
-        prompt,
-        max_new_tokens=512,
-        do_sample=True,
-        temperature=0.7,
-        top_p=0.95,
-        eos_token_id=pipe.tokenizer.eos_token_id,
-    )
-    generated_text = outputs[0]["generated_text"]
-    return generated_text[len(prompt):].strip()
+        ]
+
+    with timings.stage("model_load"):
+        backend = get_backend()
+
+    try:
+        request = get_scheduler().submit(
+            messages, max_new_tokens=MAX_NEW_TOKENS, temperature=0.7, top_p=0.95)
+    except QueueFullError:
+        yield "⚠️ The assistant is busy right now. Please try again in a moment."
+        return
+
+    first_token = None
+    reply = ""
+    for chunk in request:
+        if not chunk:
+            continue
+        if first_token is None:
+            first_token = time.perf_counter()
+        reply += chunk
+        yield reply.lstrip()
+    done = time.perf_counter()
+    if cache_key is not None and reply.strip():
+        insight_cache.put(cache_key, reply.lstrip())
+
+    # Queue wait ends when the scheduler starts the batch holding this request;
+    # template, tokenizer and token figures come from the backend's own calls
+    started = request.started or request.submitted
+    timings.add("chat_template", request.stats.get("chat_template", 0.0))
+    timings.add("tokenize", request.stats.get("tokenize", 0.0))
+    timings.add("queue_wait", started - request.submitted)
+    timings.add("first_token", (first_token or done) - started)
+    timings.add("generation", done - started)
+    timings.tokens["prompt"] = request.stats.get("prompt_tokens", 0)
+    timings.tokens["generated"] = request.stats.get("generated_tokens", 0)
+    elapsed = done - started
+    logger.info("%s generated %d tokens in %.2fs (%.1f tok/s, first token %.2fs)",
+                backend.name, timings.tokens["generated"], elapsed,
+                timings.tokens["generated"] / max(elapsed, 1e-9),
+                timings.stages["first_token"])
+    logger.info("Stage timings: %s", timings.as_dict())
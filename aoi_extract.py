@@ -0,0 +1,239 @@
+import os
+import math
+import time
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import shapely
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.warp import reproject, transform_bounds, calculate_default_transform
+from rasterio.windows import Window, from_bounds
+
+import footprints
+from footprints import config
+
+WORKERS = config.getint("extract", "workers", fallback=8)
+BLOCK_CACHE_MB = config.getint("extract", "block_cache_mb", fallback=512)
+CACHE_BLOCK_SIZE = config.getint("extract", "cache_block_size", fallback=512)
+RESAMPLING = Resampling[config.get("extract", "resampling", fallback="nearest")]
+
+results_dir = os.path.join(os.getcwd(), "results", "v3")
+
+
+class BlockCache:
+    """
+    Thread-safe LRU of decoded raster blocks shared by all extractions.
+
+    Blocks sit on a fixed CACHE_BLOCK_SIZE grid anchored at pixel (0, 0),
+    which lines up with the internal tiling of 256/512 px GeoTIFFs, so
+    overlapping AOIs reuse decoded pixels instead of reading them again.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None:
+                self.misses += 1
+                return None
+            self._blocks.move_to_end(key)
+            self.hits += 1
+            return block
+
+    def put(self, key, block):
+        with self._lock:
+            if key in self._blocks:
+                return
+            self._blocks[key] = block
+            self.bytes += block.nbytes
+            while self.bytes > self.max_bytes and self._blocks:
+                _, evicted = self._blocks.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+
+block_cache = BlockCache(BLOCK_CACHE_MB * 1024 * 1024)
+
+
+def read_window(src, window, band=1, size=CACHE_BLOCK_SIZE):
+    """
+    Read `window` of `band` through the shared block cache.
+    """
+    out = np.empty((int(window.height), int(window.width)), dtype=src.dtypes[band - 1])
+    row0, col0 = int(window.row_off), int(window.col_off)
+    row1, col1 = row0 + out.shape[0], col0 + out.shape[1]
+    for bi in range(row0 // size, (row1 - 1) // size + 1):
+        for bj in range(col0 // size, (col1 - 1) // size + 1):
+            key = (src.name, band, bi, bj)
+            block = block_cache.get(key)
+            if block is None:
+                block_window = Window(bj * size, bi * size,
+                                      min(size, src.width - bj * size),
+                                      min(size, src.height - bi * size))
+                block = src.read(band, window=block_window)
+                block_cache.put(key, block)
+            r0, c0 = max(row0, bi * size), max(col0, bj * size)
+            r1 = min(row1, bi * size + block.shape[0])
+            c1 = min(col1, bj * size + block.shape[1])
+            out[r0 - row0:r1 - row0, c0 - col0:c1 - col0] = \
+                block[r0 - bi * size:r1 - bi * size, c0 - bj * size:c1 - bj * size]
+    return out
+
+
+def find_tiles(aoi, layer, start=None, end=None):
+    """
+    Paths of the tiles whose valid data intersects the AOI, newest
+    acquisition first.
+
+    Candidates come from the coarse outline level; only those are checked
+    against the detailed outline, so rasters whose nodata edge covers the
+    AOI are never opened. Synthetic variants share the raster of their
+    source tile, so paths are de-duplicated.
+    """
+    where, params = footprints.intersects_filter(aoi.wkt)
+    where += " AND layer = ?"
+    params += (layer,)
+    window, window_params = footprints.time_window_filter(start, end)
+    if window:
+        where += f" AND {window}"
+        params += window_params
+    conn = footprints.connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT path, acquired_at, outline, area
+            FROM {footprints.DB_SCHEMA}.{footprints.RASTER_TABLE}
+            WHERE {where}
+            ORDER BY acquired_at DESC
+        """, params)
+        rows = footprints.refine_intersecting(aoi, cursor.fetchall(), 2, 3)
+    finally:
+        cursor.close()
+        conn.close()
+    return list(dict.fromkeys(row[0] for row in rows))
+
+
+def read_aoi_window(path, aoi_bounds):
+    """
+    Worker: read only the part of one GeoTIFF that overlaps the AOI.
+
+    Returns (array, transform, crs, nodata) or None if nothing overlaps.
+    """
+    with rasterio.open(path) as src:
+        bounds = transform_bounds("EPSG:4326", src.crs, *aoi_bounds, densify_pts=21)
+        window = from_bounds(*bounds, transform=src.transform)
+        col0, row0 = max(math.floor(window.col_off), 0), max(math.floor(window.row_off), 0)
+        col1 = min(math.ceil(window.col_off + window.width), src.width)
+        row1 = min(math.ceil(window.row_off + window.height), src.height)
+        if col1 <= col0 or row1 <= row0:
+            return None
+        window = Window(col0, row0, col1 - col0, row1 - row0)
+        data = read_window(src, window)
+        return data, src.window_transform(window), src.crs, src.nodata
+
+
+def mosaic(pieces, aoi_bounds, dst_crs, resolution=None):
+    """
+    Reproject windowed reads onto one grid; earlier pieces take priority.
+    """
+    dst_bounds = transform_bounds("EPSG:4326", dst_crs, *aoi_bounds, densify_pts=21)
+    if resolution is None:
+        data, transform, crs, _ = pieces[0]
+        src_bounds = rasterio.transform.array_bounds(*data.shape, transform)
+        guess, _, _ = calculate_default_transform(
+            crs, dst_crs, data.shape[1], data.shape[0], *src_bounds)
+        resolution = guess.a
+    width = max(1, math.ceil((dst_bounds[2] - dst_bounds[0]) / resolution))
+    height = max(1, math.ceil((dst_bounds[3] - dst_bounds[1]) / resolution))
+    dst_transform = from_origin(dst_bounds[0], dst_bounds[3], resolution, resolution)
+
+    nodata = pieces[0][3] if pieces[0][3] is not None else 0
+    nodata_is_nan = isinstance(nodata, float) and math.isnan(nodata)
+    dtype = pieces[0][0].dtype
+    out = np.full((height, width), nodata, dtype=dtype)
+    scratch = np.empty_like(out)
+    for data, transform, crs, src_nodata in pieces:
+        scratch.fill(nodata)
+        reproject(data, scratch, src_transform=transform, src_crs=crs,
+                  src_nodata=src_nodata if src_nodata is not None else nodata,
+                  dst_transform=dst_transform, dst_crs=dst_crs,
+                  dst_nodata=nodata, resampling=RESAMPLING)
+        # NaN never equals itself, so NaN nodata needs isnan
+        empty = np.isnan(out) if nodata_is_nan else out == nodata
+        out[empty] = scratch[empty]
+    return out, dst_transform, nodata
+
+
+def extract_aoi(aoi, layer, start=None, end=None, dst_crs="EPSG:4326",
+                resolution=None, workers=WORKERS):
+    """
+    Pixel values of `layer` inside a WGS84 AOI, mosaicked onto one grid.
+
+    Tiles are found through the MonkDB index, only the overlapping windows
+    are read (in parallel, via the shared block cache), and the newest
+    acquisition wins where tiles overlap. Returns (array, transform, nodata)
+    or None when no tile intersects the AOI.
+    """
+    paths = find_tiles(aoi, layer, start, end)
+    if not paths:
+        return None
+    aoi_bounds = shapely.bounds(aoi).tolist()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pieces = [p for p in pool.map(lambda path: read_aoi_window(path, aoi_bounds), paths)
+                  if p is not None]
+    if not pieces:
+        return None
+    return mosaic(pieces, aoi_bounds, dst_crs, resolution)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract AOI pixels for one layer.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--aoi", help="AOI as WKT (lon/lat)")
+    group.add_argument("--aoi-file", help="GeoPackage/GeoJSON/WKT file; AOIs are unioned")
+    parser.add_argument("--layer", required=True, help="e.g. B04_10m")
+    parser.add_argument("--start", help="Acquired at or after (ISO-8601)")
+    parser.add_argument("--end", help="Acquired before (ISO-8601)")
+    parser.add_argument("--crs", default="EPSG:4326", help="Output CRS")
+    parser.add_argument("--resolution", type=float, help="Output pixel size in CRS units")
+    parser.add_argument("--out", help="Output GeoTIFF path")
+    args = parser.parse_args(argv)
+
+    if args.aoi:
+        aoi = shapely.from_wkt(args.aoi)
+    else:
+        from batch_aoi_intersection import load_aois
+        aoi = shapely.union_all(load_aois(args.aoi_file)[1])
+
+    start = time.perf_counter()
+    result = extract_aoi(aoi, args.layer, args.start, args.end, args.crs, args.resolution)
+    if result is None:
+        print("⚠️ No tiles intersect the AOI.")
+        return
+    data, transform, nodata = result
+
+    out_path = args.out or os.path.join(results_dir, f"aoi_{args.layer}.tif")
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with rasterio.open(out_path, "w", driver="GTiff", height=data.shape[0],
+                       width=data.shape[1], count=1, dtype=data.dtype,
+                       crs=args.crs, transform=transform, nodata=nodata,
+                       tiled=True, compress="deflate") as dst:
+        dst.write(data, 1)
+    print(f"✅ Saved: {out_path} ({data.shape[1]}x{data.shape[0]})")
+    print(f"⏱️ Extraction: {round(time.perf_counter() - start, 3)} sec "
+          f"(block cache hits={block_cache.hits}, misses={block_cache.misses})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import geohash
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+from shapely.geometry import box
+
+import footprints
+from footprints import config
+
+GROUP_PRECISION = config.getint("analytics", "aoi_group_precision", fallback=3)
+QUERY_WORKERS = config.getint("analytics", "aoi_query_workers", fallback=8)
+
+results_dir = os.path.join(os.getcwd(), "results", "v3")
+
+
+def load_aois(path, id_column=None):
+    """
+    Load AOIs from a GeoPackage/GeoJSON (via GeoPandas) or a WKT file.
+
+    WKT files hold one geometry per line, optionally prefixed by an id and
+    a tab. Returns (ids, geometries) with geometries in EPSG:4326.
+    """
+    if path.lower().endswith((".wkt", ".txt")):
+        ids, geoms = [], []
+        with open(path, "r", encoding="utf-8") as f:
+            for n, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                aoi_id, _, text = line.rpartition("\t")
+                ids.append(aoi_id or str(n))
+                geoms.append(shapely.from_wkt(text))
+        return ids, np.array(geoms, dtype=object)
+
+    import geopandas as gpd
+
+    gdf = gpd.read_file(path)
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs("EPSG:4326")
+    gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+    ids = (gdf[id_column].astype(str).tolist() if id_column
+           else [str(i) for i in gdf.index])
+    return ids, np.asarray(gdf.geometry.values, dtype=object)
+
+
+def group_by_geohash(geoms, precision=GROUP_PRECISION):
+    """
+    Bucket AOIs by the geohash cell of their centroid.
+
+    Returns {cell: indices}. Each bucket becomes one coarse database query,
+    so the number of round trips scales with the covered area rather than
+    the number of AOIs.
+    """
+    centroids = shapely.get_coordinates(shapely.centroid(geoms))
+    groups = {}
+    for idx, (lon, lat) in enumerate(centroids):
+        cell = geohash.encode(lat, lon, precision)
+        groups.setdefault(cell, []).append(idx)
+    return groups
+
+
+def fetch_candidates(envelope_wkt, layer=None, window=("", ())):
+    """
+    Worker: run one coarse `intersects` query (on `outline_coarse`) for a
+    group envelope.
+    """
+    where, params = footprints.intersects_filter(envelope_wkt)
+    if layer:
+        where += " AND layer = ?"
+        params += (layer,)
+    if window[0]:
+        where += f" AND {window[0]}"
+        params += window[1]
+    conn = footprints.connect()
+    cursor = conn.cursor()
+    rows = []
+    try:
+        for batch in footprints.iter_footprint_batches(
+                cursor, columns=("_id", "tile_id", "layer", "area_km", "area", "outline"),
+                where=where, params=params):
+            rows.extend(batch)
+    finally:
+        cursor.close()
+        conn.close()
+    return rows
+
+
+def refine_group(aoi_ids, aoi_geoms, rows):
+    """
+    Exact AOI/tile matching for one group with vectorised predicates,
+    against each tile's detailed valid-data outline.
+
+    Returns (mapping rows, coverage rows). Coverage is the share of the AOI
+    covered by the union of its intersecting tiles.
+    """
+    if not rows:
+        return [], [(a, 0, 0.0) for a in aoi_ids]
+    tile_geoms = footprints.detailed_geometries([r[5] for r in rows], [r[4] for r in rows])
+    tree = STRtree(tile_geoms)
+    aoi_idx, tile_idx = tree.query(aoi_geoms, predicate="intersects")
+
+    overlap = shapely.area(shapely.intersection(
+        aoi_geoms[aoi_idx], tile_geoms[tile_idx]))
+    aoi_area = shapely.area(aoi_geoms)
+    mapping = []
+    for a, t, ov in zip(aoi_idx, tile_idx, overlap):
+        _, tile_id, layer, area_km, _, _ = rows[t]
+        share = ov / aoi_area[a] * 100 if aoi_area[a] > 0 else 0.0
+        mapping.append((aoi_ids[a], tile_id, layer, area_km, round(float(share), 3)))
+
+    coverage = []
+    hits = {}
+    for a, t in zip(aoi_idx, tile_idx):
+        hits.setdefault(int(a), []).append(t)
+    for a, aoi_id in enumerate(aoi_ids):
+        tiles = hits.get(a)
+        if tiles is None or aoi_area[a] == 0:
+            coverage.append((aoi_id, 0, 0.0))
+            continue
+        covered = shapely.intersection(
+            aoi_geoms[a], shapely.union_all(tile_geoms[tiles]))
+        pct = shapely.area(covered) / aoi_area[a] * 100
+        coverage.append((aoi_id, len(tiles), round(float(pct), 3)))
+    return mapping, coverage
+
+
+def run_batch(aoi_ids, aoi_geoms, layer=None, precision=GROUP_PRECISION,
+              workers=QUERY_WORKERS, start=None, end=None):
+    """
+    Intersect many AOIs with the tile table using a few grouped queries.
+
+    `start`/`end` optionally restrict tiles to an acquisition window.
+    Returns (mapping DataFrame, coverage DataFrame).
+    """
+    window = footprints.time_window_filter(start, end)
+    groups = group_by_geohash(aoi_geoms, precision)
+    print(f"🔍 {len(aoi_ids)} AOIs grouped into {len(groups)} geohash cells "
+          f"(precision {precision}), querying with {workers} workers...")
+
+    mapping, coverage = [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for cell, members in groups.items():
+            envelope = box(*shapely.total_bounds(aoi_geoms[members])).wkt
+            futures[pool.submit(fetch_candidates, envelope, layer, window)] = members
+        for future in as_completed(futures):
+            members = futures[future]
+            rows = future.result()
+            m, c = refine_group([aoi_ids[i] for i in members],
+                                aoi_geoms[members], rows)
+            mapping.extend(m)
+            coverage.extend(c)
+
+    mapping_df = pd.DataFrame(mapping, columns=[
+        "aoi_id", "tile_id", "layer", "area_km", "aoi_overlap_pct"])
+    coverage_df = pd.DataFrame(coverage, columns=[
+        "aoi_id", "tile_count", "coverage_pct"])
+    return mapping_df, coverage_df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Find the tiles covering each AOI in a file.")
+    parser.add_argument("aoi_file", help="GeoPackage, GeoJSON or WKT file")
+    parser.add_argument("--id-column", help="AOI id attribute (vector files)")
+    parser.add_argument("--layer", help="Restrict to one raster layer")
+    parser.add_argument("--precision", type=int, default=GROUP_PRECISION,
+                        help="Geohash precision used to group AOIs")
+    parser.add_argument("--workers", type=int, default=QUERY_WORKERS)
+    parser.add_argument("--start", help="Acquired at or after (ISO-8601)")
+    parser.add_argument("--end", help="Acquired before (ISO-8601)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    aoi_ids, aoi_geoms = load_aois(args.aoi_file, args.id_column)
+    mapping_df, coverage_df = run_batch(
+        aoi_ids, aoi_geoms, args.layer, args.precision, args.workers,
+        args.start, args.end)
+    duration = round(time.perf_counter() - start, 3)
+
+    os.makedirs(results_dir, exist_ok=True)
+    mapping_df.to_csv(os.path.join(
+        results_dir, "aoi_tile_mapping.csv"), index=False)
+    coverage_df.to_csv(os.path.join(
+        results_dir, "aoi_coverage.csv"), index=False)
+    print("✅ Saved: results/v3/aoi_tile_mapping.csv")
+    print("✅ Saved: results/v3/aoi_coverage.csv")
+    print(f"⏱️ {len(aoi_ids)} AOIs, {len(mapping_df)} AOI/tile matches "
+          f"in {duration} sec")
+
+
+if __name__ == "__main__":
+    main()
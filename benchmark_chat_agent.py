@@ -0,0 +1,143 @@
+import os
+import time
+import random
+import sqlite3
+import argparse
+import threading
+
+import numpy as np
+
+# Every replay must reach the model, so turn the answer cache off
+os.environ.setdefault("INSIGHT_CACHE_SIZE", "0")
+
+import agent  # noqa: E402
+
+PROMPTS = [
+    "Summarize the coverage of Sentinel-2 tiles over south-west England.",
+    "Which layers have the largest mean tile area and why might that be?",
+    "Explain what a geohash3 region diversity score tells an analyst.",
+]
+
+QUERIES = [
+    "SELECT tile_id, layer, area_km FROM monkdb.sentinel_tiles ORDER BY area_km DESC LIMIT 50",
+    "SELECT layer, COUNT(*) AS tile_count, AVG(area_km) AS mean_area FROM monkdb.sentinel_tiles GROUP BY layer",
+    "SELECT geohash3, resolution, area_km FROM monkdb.sentinel_tiles WHERE area_km > 5000",
+]
+
+LAYERS = ["B01_60m", "B02_10m", "B03_10m", "B04_10m", "B08_10m", "B11_20m",
+          "B12_20m", "SCL_20m", "AOT_10m", "WVP_10m", "TCI_10m"]
+
+results_dir = os.path.join(os.getcwd(), "results", "v3")
+
+
+class _DistinctCount:
+    # Exact stand-in for MonkDB's hyperloglog_distinct
+    def __init__(self):
+        self.values = set()
+
+    def step(self, value):
+        self.values.add(value)
+
+    def finalize(self):
+        return len(self.values)
+
+
+class LocalQueryStub:
+    """
+    In-memory SQLite replacement for `run_select_query`.
+
+    Holds a synthetic `monkdb.sentinel_tiles` table with the scalar columns
+    of the real schema, plus an optional fixed delay per statement to mimic
+    MCP round trips. Statements SQLite can't run come back as MCP-style
+    error dicts, as the real server would return them.
+    """
+
+    def __init__(self, rows: int, latency_ms: float = 0.0, seed: int = 42):
+        self.latency = latency_ms / 1000
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(":memory:", check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.create_aggregate("hyperloglog_distinct", 1, _DistinctCount)
+        self.db.execute("ATTACH DATABASE ':memory:' AS monkdb")
+        self.db.execute("""CREATE TABLE monkdb.sentinel_tiles (
+            tile_id TEXT, path TEXT, layer TEXT, resolution TEXT,
+            area_km REAL, geohash3 TEXT)""")
+        rng = random.Random(seed)
+        records = []
+        for i in range(rows):
+            layer = rng.choice(LAYERS)
+            records.append((
+                f"T30UVA_{i % 5000}", f"/tiles/T30UVA_{layer}_{i}.tif", layer,
+                layer.split("_")[1], rng.uniform(100, 12100),
+                "".join(rng.choice("bcdefgu") for _ in range(3)),
+            ))
+        self.db.executemany(
+            "INSERT INTO monkdb.sentinel_tiles VALUES (?, ?, ?, ?, ?, ?)", records)
+
+    def __call__(self, query: str):
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            with self.lock:
+                return [dict(row) for row in self.db.execute(query)]
+        except sqlite3.Error as e:
+            return {"status": "error", "message": str(e)}
+
+
+def percentiles(samples: dict) -> dict:
+    return {
+        stage: {"p50": round(float(np.percentile(values, 50)), 4),
+                "p95": round(float(np.percentile(values, 95)), 4)}
+        for stage, values in sorted(samples.items())
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay chat prompts and SQL against a local query stub and "
+                    "report per-stage latency.")
+    parser.add_argument("--rounds", type=int, default=5,
+                        help="Times each prompt and query is replayed")
+    parser.add_argument("--rows", type=int, default=100000,
+                        help="Rows in the synthetic sentinel_tiles table")
+    parser.add_argument("--query-latency-ms", type=float, default=0.0,
+                        help="Delay added to every stub query")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    agent.run_select_query = LocalQueryStub(args.rows, args.query_latency_ms)
+    agent.MAX_NEW_TOKENS = args.max_new_tokens
+    print(f"🔍 Loading {agent.LLM_BACKEND} backend...")
+    agent.warm_up(background=False)
+
+    samples, tokens = {}, {}
+    for round_no in range(args.rounds):
+        for text in QUERIES + PROMPTS:
+            timings = agent.StageTimings()
+            begin = time.perf_counter()
+            for _ in agent.generate_response(text, timings):
+                pass
+            timings.add("total", time.perf_counter() - begin)
+            for stage, seconds in timings.stages.items():
+                samples.setdefault(stage, []).append(seconds)
+            for kind, count in timings.tokens.items():
+                tokens.setdefault(kind, []).append(count)
+        print(f"✅ Round {round_no + 1}/{args.rounds} done")
+
+    report = percentiles(samples)
+    os.makedirs(results_dir, exist_ok=True)
+    output_path = os.path.join(results_dir, "chat_stage_benchmark.txt")
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(f"backend: {agent.LLM_BACKEND}, rounds: {args.rounds}, "
+                f"rows: {args.rows}, query latency: {args.query_latency_ms} ms\n")
+        for stage, values in report.items():
+            line = f"{stage}: p50={values['p50']}s, p95={values['p95']}s"
+            f.write(line + "\n")
+            print(line)
+        for kind, counts in tokens.items():
+            f.write(f"{kind} tokens: mean={np.mean(counts):.1f}\n")
+    print(f"✅ Saved: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
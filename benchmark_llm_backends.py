@@ -0,0 +1,71 @@
+import os
+import time
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from llm_backends import BACKENDS, load_backend  # noqa: E402
+
+PROMPTS = [
+    "Summarize the coverage of Sentinel-2 tiles over south-west England.",
+    "Which layers have the largest mean tile area and why might that be?",
+    "Explain what a geohash3 region diversity score tells an analyst.",
+]
+
+results_dir = os.path.join(os.getcwd(), "results", "v3")
+
+
+def benchmark(name, max_new_tokens):
+    start = time.perf_counter()
+    backend = load_backend(name)
+    startup = time.perf_counter() - start
+
+    total_tokens, total_time = 0, 0.0
+    for prompt in PROMPTS:
+        messages = [{"role": "user", "content": prompt}]
+        begin = time.perf_counter()
+        reply = backend.generate(messages, max_new_tokens=max_new_tokens)
+        total_time += time.perf_counter() - begin
+        total_tokens += backend.count_tokens(reply)
+    return {
+        "backend": name,
+        "startup_sec": round(startup, 2),
+        "generated_tokens": total_tokens,
+        "tokens_per_sec": round(total_tokens / max(total_time, 1e-9), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare LLM backend speed.")
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help="Comma-separated backend names")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    import agent  # noqa: F401
+    import_sec = round(time.perf_counter() - start, 2)
+    print(f"⏱️ agent import (model not loaded): {import_sec} sec")
+
+    rows = []
+    for name in args.backends.split(","):
+        print(f"🔍 Benchmarking {name}...")
+        try:
+            rows.append(benchmark(name.strip(), args.max_new_tokens))
+            print(f"✅ {rows[-1]}")
+        except Exception as e:
+            print(f"❌ {name} failed: {e}")
+
+    os.makedirs(results_dir, exist_ok=True)
+    output_path = os.path.join(results_dir, "llm_backend_benchmark.txt")
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(f"agent import (model not loaded): {import_sec} sec\n")
+        for row in rows:
+            f.write(f"{row}\n")
+    print(f"✅ Saved: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import os
+import time
+import random
+import argparse
+import statistics
+
+from shapely.geometry import box
+
+import database
+import local_monkdb
+
+results_dir = os.path.join(os.getcwd(), "results", "v3")
+
+# Representative statements from the query suites; {table} is filled in
+QUERIES = {
+    "within bbox": """
+        SELECT tile_id, centroid FROM {table}
+        WHERE within(centroid, 'POLYGON ((-4 40, -2 40, -2 42, -4 42, -4 40))')""",
+    "intersects AOI (param)": """
+        SELECT tile_id, layer, area_km, centroid FROM {table}
+        WHERE intersects(area, ?)""",
+    "distance filter": """
+        SELECT tile_id, area_km, distance(centroid, [-3.6, 41.0]) AS dist_m FROM {table}
+        WHERE distance(centroid, [-3.6, 41.0]) < 50000
+        ORDER BY dist_m LIMIT 100""",
+    "geohash regions": """
+        SELECT substr(geohash(centroid), 1, 3) AS region, COUNT(*) AS tiles FROM {table}
+        GROUP BY region ORDER BY tiles DESC""",
+    "layer statistics": """
+        SELECT layer, COUNT(*) AS tiles, ROUND(AVG(area_km), 2) AS avg_area_km,
+               stddev(area_km) AS std_area_km, hyperloglog_distinct(geohash3) AS regions
+        FROM {table} GROUP BY layer ORDER BY layer""",
+    "monthly counts": """
+        SELECT acquired_month, COUNT(*) AS tiles FROM {table}
+        GROUP BY acquired_month ORDER BY acquired_month""",
+}
+
+AOI = "POLYGON ((-3.5 40.5, -3.2 40.5, -3.2 40.8, -3.5 40.8, -3.5 40.5))"
+
+
+def synthetic_tiles(count, seed):
+    """
+    Base tiles in the insert_v2 tile format: 10 km UTM 30N squares
+    scattered over central Spain, one of three layers, spread over a year.
+    """
+    rng = random.Random(seed)
+    tiles = []
+    for i in range(count):
+        x = rng.uniform(300_000, 600_000)
+        y = rng.uniform(4_400_000, 4_700_000)
+        layer = ("B04_10m", "B8A_20m", "SCL_60m")[i % 3]
+        tiles.append({
+            "tile_id": f"T30TVK_{i:05d}",
+            "timestamp": f"2025{1 + i % 12:02d}{1 + i % 28:02d}T112131",
+            "layer": layer,
+            "resolution": layer.rsplit("_", 1)[1],
+            "bbox": box(x, y, x + 10_000, y + 10_000),
+            "path": f"synthetic/{i:05d}.tif",
+            "thumbnail_path": None,
+            "overview_path": None,
+        })
+    return tiles
+
+
+def ingest(rows, seed):
+    # insert_v2 reads config on import; it only matters once DB_HOSTS points here
+    import insert_v2
+
+    random.seed(seed)
+    conn = database.connect()
+    cursor = conn.cursor()
+    insert_v2.create_table(cursor)
+
+    records = []
+    for base_tile in synthetic_tiles(-(-rows // 11), seed):
+        row = insert_v2.real_row(base_tile)
+        if row is not None:
+            records.append(row)
+        records.extend(insert_v2.generate_variants(base_tile, num_variants=10))
+    records = records[:rows]
+
+    writer = insert_v2.BatchWriter()
+    start = time.perf_counter()
+    for i in range(0, len(records), insert_v2.BATCH_SIZE):
+        writer.submit(records[i:i + insert_v2.BATCH_SIZE])
+    writer.close()
+    elapsed = time.perf_counter() - start
+
+    cursor.execute(f"SELECT COUNT(*) FROM {database.DB_SCHEMA}.{database.RASTER_TABLE}")
+    stored = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return {"rows": stored, "seconds": round(elapsed, 3),
+            "rows_per_sec": round(len(records) / elapsed, 1)}
+
+
+def run_queries(rounds):
+    table = f"{database.DB_SCHEMA}.{database.RASTER_TABLE}"
+    results = {}
+    conn = database.connect()
+    cursor = conn.cursor()
+    for name, sql in QUERIES.items():
+        stmt = sql.format(table=table)
+        params = [AOI] if "?" in stmt else None
+        latencies, row_count = [], 0
+        for _ in range(rounds):
+            start = time.perf_counter()
+            cursor.execute(stmt, params)
+            row_count = len(cursor.fetchall())
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        results[name] = {
+            "rows": row_count,
+            "p50_ms": round(statistics.median(latencies) * 1000, 2),
+            "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 2),
+        }
+    cursor.close()
+    conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ingest and query benchmark against a local MonkDB stand-in.")
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default=":memory:", help="SQLite file for the stand-in")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--max-rows-per-sec", type=float, default=0.0)
+    parser.add_argument("--max-bytes-per-sec", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, address = local_monkdb.start_in_background(
+        path=args.db, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        max_rows_per_sec=args.max_rows_per_sec, max_bytes_per_sec=args.max_bytes_per_sec,
+        seed=args.seed)
+    # Point the shared pool at the stand-in instead of config.ini's DB_HOST
+    database.DB_HOSTS = [address]
+    print(f"🧪 Local MonkDB stand-in on {address}")
+
+    try:
+        ingest_result = ingest(args.rows, args.seed)
+        print(f"📥 Ingested {ingest_result['rows']} rows "
+              f"({ingest_result['rows_per_sec']} rows/sec)")
+        query_results = run_queries(args.rounds)
+    finally:
+        database.get_pool().close()
+        server.shutdown()
+        server.server_close()
+
+    os.makedirs(results_dir, exist_ok=True)
+    out_path = os.path.join(results_dir, "local_monkdb_benchmark.txt")
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("Local MonkDB stand-in benchmark\n")
+        f.write(f"rows={args.rows} rounds={args.rounds} seed={args.seed} "
+                f"latency_ms={args.latency_ms} jitter_ms={args.jitter_ms} "
+                f"max_rows_per_sec={args.max_rows_per_sec} "
+                f"max_bytes_per_sec={args.max_bytes_per_sec}\n\n")
+        f.write(f"ingest: {ingest_result}\n\n")
+        for name, result in query_results.items():
+            print(f"⏱️ {name}: {result}")
+            f.write(f"{name}: {result}\n")
+    print(f"✅ Results saved to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
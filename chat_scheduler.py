@@ -0,0 +1,148 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# === Scheduler settings (read from .env / environment) ===
+MAX_BATCH_SIZE = int(os.getenv("CHAT_MAX_BATCH", "8"))
+BATCH_WINDOW_MS = int(os.getenv("CHAT_BATCH_WINDOW_MS", "25"))
+MAX_QUEUE_DEPTH = int(os.getenv("CHAT_MAX_QUEUE", "64"))
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class ChatRequest:
+    """
+    One queued prompt. Iterating it yields text chunks as they arrive.
+
+    `stats` is filled in by the backend while it serves the request:
+    chat template and tokenizer seconds, prompt and generated tokens.
+    """
+
+    _DONE = object()
+
+    def __init__(self, messages: list[dict], options: dict):
+        self.messages = messages
+        self.options = options
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.error = None
+        self.stats = {}
+        self._chunks = queue.Queue()
+
+    def _put(self, chunk: str):
+        self._chunks.put(chunk)
+
+    def _finish(self, error: Exception = None):
+        self.error = error
+        self._chunks.put(self._DONE)
+
+    def __iter__(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is self._DONE:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield chunk
+
+
+class BatchScheduler:
+    """
+    Single model worker that batches concurrent chat prompts.
+
+    The worker blocks for the first pending request, then keeps collecting
+    for up to BATCH_WINDOW_MS (or until MAX_BATCH_SIZE) and runs the whole
+    group through one `stream_batch` call, routing each row's chunks back
+    to its request. Requests with different generation options go into
+    separate batches. Submitting beyond MAX_QUEUE_DEPTH fails fast.
+    """
+
+    def __init__(self, get_backend, max_batch_size: int = MAX_BATCH_SIZE,
+                 batch_window_ms: int = BATCH_WINDOW_MS,
+                 max_queue_depth: int = MAX_QUEUE_DEPTH):
+        self.get_backend = get_backend
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000
+        self.max_queue_depth = max_queue_depth
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._records = deque(maxlen=1000)
+        self._worker = threading.Thread(target=self._run, name="chat-scheduler",
+                                        daemon=True)
+        self._worker.start()
+
+    def submit(self, messages: list[dict], **options) -> ChatRequest:
+        request = ChatRequest(messages, options)
+        with self._cond:
+            if len(self._pending) >= self.max_queue_depth:
+                raise QueueFullError(
+                    f"Chat queue is full ({self.max_queue_depth} pending requests)")
+            self._pending.append(request)
+            self._cond.notify()
+        return request
+
+    def _next_batch(self) -> list[ChatRequest]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.perf_counter() + self.batch_window
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            first = self._pending[0]
+            batch = [r for r in self._pending if r.options == first.options]
+            batch = batch[:self.max_batch_size]
+            for request in batch:
+                self._pending.remove(request)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            waits = [started - r.submitted for r in batch]
+            for request in batch:
+                request.started = started
+            try:
+                backend = self.get_backend()
+                for index, chunk in backend.stream_batch(
+                        [r.messages for r in batch], stats=[r.stats for r in batch],
+                        **batch[0].options):
+                    batch[index]._put(chunk)
+                for request in batch:
+                    request._finish()
+            except Exception as e:
+                logger.exception("Batched generation failed")
+                for request in batch:
+                    request._finish(e)
+            latency = time.perf_counter() - started
+            self._records.append((len(batch), sum(waits) / len(waits),
+                                  max(waits), latency))
+            logger.info("Chat batch: size=%d, max queue wait=%.3fs, generation=%.2fs",
+                        len(batch), max(waits), latency)
+
+    def stats(self) -> dict:
+        """
+        Summary of recent batches: sizes, queue wait and generation latency.
+        """
+        records = list(self._records)
+        if not records:
+            return {"batches": 0, "queue_depth": len(self._pending)}
+        sizes, mean_waits, max_waits, latencies = zip(*records)
+        return {
+            "batches": len(records),
+            "queue_depth": len(self._pending),
+            "avg_batch_size": round(sum(sizes) / len(sizes), 2),
+            "avg_queue_wait_sec": round(sum(mean_waits) / len(mean_waits), 3),
+            "max_queue_wait_sec": round(max(max_waits), 3),
+            "avg_generation_sec": round(sum(latencies) / len(latencies), 2),
+        }
@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import inspect
+import argparse
+import importlib
+import statistics
+import subprocess
+
+# Subcommand -> target -> module whose main() runs it. Modules are only
+# imported once their target is picked, so `--help` and argument errors
+# don't pay for pandas, rasterio, dask, torch or gradio.
+COMMANDS = {
+    "index": {
+        "help": "Build the raster tile index",
+        "default": "tiles",
+        "targets": {"tiles": "index_v3", "previews": "index_previews",
+                    "embeddings": "tile_embeddings"},
+    },
+    "ingest": {
+        "help": "Load tiles into MonkDB",
+        "default": "synthetic",
+        "targets": {"synthetic": "insert_v2", "stream": "pipeline"},
+    },
+    "query": {
+        "help": "Run the query suites",
+        "default": "all",
+        "targets": {"core": "query_raster_tiles", "advanced": "advanced_queries",
+                    "geo": "geo_analytics_queries"},
+    },
+    "analytics": {
+        "help": "Scale-out analytics jobs",
+        "default": None,
+        "targets": {"density": "coverage_density", "duplicates": "duplicate_footprints",
+                    "aoi": "batch_aoi_intersection", "time-window": "time_window_queries",
+                    "extract": "aoi_extract", "similar": "similar_tiles"},
+    },
+    "viz": {
+        "help": "Charts, footprint maps and the tile server",
+        "default": "charts",
+        "targets": {"charts": "raster_visualization", "tiles": "tile_server"},
+    },
+    "chat": {
+        "help": "Chat UI and its stage benchmark",
+        "default": "ui",
+        "targets": {"ui": "main", "benchmark": "benchmark_chat_agent"},
+    },
+}
+
+# Modules that must not be loaded just to parse the command line
+HEAVY_MODULES = ("pandas", "numpy", "shapely", "pyproj", "rasterio", "dask",
+                 "geopandas", "matplotlib", "torch", "transformers", "gradio")
+
+STARTUP_BUDGET_SEC = 0.5
+
+
+class TargetArgumentError(Exception):
+    """
+    Extra arguments given to a target whose main() takes none.
+    """
+
+
+def run_target(command, target, argv):
+    """
+    Import the target's module and call its main(), forwarding extra
+    arguments to mains that parse their own. Returns an exit code.
+
+    Config-driven mains take no arguments; passing them any raises
+    TargetArgumentError.
+    """
+    targets = COMMANDS[command]["targets"]
+    if target == "all":
+        for name in targets:
+            code = run_target(command, name, argv)
+            if code:
+                return code
+        return 0
+
+    module = importlib.import_module(targets[target])
+    if argv:
+        if not inspect.signature(module.main).parameters:
+            raise TargetArgumentError(
+                f"'{command} {target}' takes no extra arguments (configure it in "
+                f"config.ini); got: {' '.join(argv)}")
+        result = module.main(argv)
+    else:
+        result = module.main()
+    return result if isinstance(result, int) else 0
+
+
+def startup_check(budget, runs):
+    """
+    Time `cli.py --help` in fresh interpreters against a bare `python -c
+    pass`, and check that parsing arguments imports none of HEAVY_MODULES.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def timed(args):
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *args], cwd=here, check=True,
+                           stdout=subprocess.DEVNULL)
+            samples.append(time.perf_counter() - start)
+        return statistics.median(samples)
+
+    baseline = timed(["-c", "pass"])
+    cli_seconds = timed([os.path.join(here, "cli.py"), "--help"])
+    probe = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, json, cli; cli.build_parser().parse_args(['query', 'core']); "
+         f"print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))"],
+        cwd=here, check=True, capture_output=True, text=True)
+    loaded = json.loads(probe.stdout.strip().splitlines()[-1])
+
+    print(f"⏱️ python -c pass: {baseline * 1000:.1f} ms")
+    print(f"⏱️ cli.py --help: {cli_seconds * 1000:.1f} ms (budget {budget * 1000:.0f} ms)")
+    ok = True
+    if loaded:
+        print(f"❌ Heavy modules imported at startup: {', '.join(loaded)}")
+        ok = False
+    if cli_seconds > budget:
+        print("❌ Startup time over budget")
+        ok = False
+    if ok:
+        print("✅ Startup within budget")
+    return 0 if ok else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description="MonkDB GeoRaster demo: index, ingest, query, analyse, chat.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, spec in COMMANDS.items():
+        choices = list(spec["targets"]) + (["all"] if spec["default"] == "all" else [])
+        cmd = sub.add_parser(name, help=spec["help"], description=spec["help"])
+        cmd.add_argument("target", choices=choices,
+                         nargs="?" if spec["default"] else None, default=spec["default"])
+        cmd.add_argument("args", nargs=argparse.REMAINDER,
+                         help="Passed through to the target's own options")
+
+    check = sub.add_parser("startup-check", help="Fail if CLI startup exceeds a time budget")
+    check.add_argument("--budget", type=float, default=STARTUP_BUDGET_SEC,
+                       help="Seconds allowed for `cli.py --help`")
+    check.add_argument("--runs", type=int, default=5)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "startup-check":
+        return startup_check(args.budget, args.runs)
+    try:
+        return run_target(args.command, args.target, args.args)
+    except TargetArgumentError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
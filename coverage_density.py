@@ -0,0 +1,222 @@
+import os
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import footprints
+from footprints import config, DB_SCHEMA, RASTER_TABLE
+
+# Grid settings (all optional, see README "Coverage density grid")
+GRID_RESOLUTION = config.getfloat(
+    "analytics", "grid_resolution_deg", fallback=0.01)
+GRID_BBOX = config.get("analytics", "grid_bbox", fallback="")
+PARTITION_PRECISION = config.getint(
+    "analytics", "partition_precision", fallback=3)
+WORKERS = config.getint("analytics", "workers", fallback=os.cpu_count() or 1)
+REDUNDANT_THRESHOLD = config.getint(
+    "analytics", "redundant_threshold", fallback=10)
+
+results_dir = os.path.join(os.getcwd(), "results", "v3")
+
+
+def grid_shape(extent, res):
+    minx, miny, maxx, maxy = extent
+    return (math.ceil((maxy - miny) / res), math.ceil((maxx - minx) / res))
+
+
+def envelope_cells(bounds, extent, res, shape):
+    """
+    Convert (n, 4) envelopes into half-open cell ranges on the grid.
+
+    Rows count down from the top edge so the grid is in image order.
+    Envelopes falling entirely outside the extent are dropped.
+    """
+    minx, _, _, maxy = extent
+    ny, nx = shape
+    c0 = np.floor((bounds[:, 0] - minx) / res).astype(np.int64)
+    c1 = np.ceil((bounds[:, 2] - minx) / res).astype(np.int64)
+    r0 = np.floor((maxy - bounds[:, 3]) / res).astype(np.int64)
+    r1 = np.ceil((maxy - bounds[:, 1]) / res).astype(np.int64)
+    c0, c1 = np.clip(c0, 0, nx), np.clip(c1, 0, nx)
+    r0, r1 = np.clip(r0, 0, ny), np.clip(r1, 0, ny)
+    keep = (c1 > c0) & (r1 > r0)
+    return r0[keep], r1[keep], c0[keep], c1[keep], keep
+
+
+def accumulate_envelopes(diff, bounds, extent, res, weights=None):
+    """
+    Add a batch of footprint envelopes to a 2-D difference array.
+
+    `diff` has shape (ny + 1, nx + 1). Each envelope costs four scatter
+    updates regardless of how many cells it covers; the dense grid is
+    recovered once at the end with `difference_to_grid`. Returns the
+    number of envelopes that touched the grid.
+    """
+    shape = (diff.shape[0] - 1, diff.shape[1] - 1)
+    r0, r1, c0, c1, keep = envelope_cells(bounds, extent, res, shape)
+    if weights is None:
+        w = np.ones(len(r0), dtype=diff.dtype)
+    else:
+        w = np.asarray(weights, dtype=diff.dtype)[keep]
+    width = diff.shape[1]
+    idx = np.concatenate([r0 * width + c0, r0 * width + c1,
+                          r1 * width + c0, r1 * width + c1])
+    signed = np.concatenate([w, -w, -w, w])
+    # Unbuffered scatter-add: touches 4 cells per envelope, never the
+    # whole grid (diff is C-contiguous, so ravel() is a view)
+    np.add.at(diff.ravel(), idx, signed)
+    return len(r0)
+
+
+def difference_to_grid(diff):
+    return diff.cumsum(axis=0).cumsum(axis=1)[:-1, :-1]
+
+
+def rasterize_partitions(prefixes, extent, res):
+    """
+    Worker: stream a share of the geohash partitions into one difference
+    array, so each worker allocates and sends back a single grid.
+
+    Returns the array and the tile count per partition.
+    """
+    shape = grid_shape(extent, res)
+    diff = np.zeros((shape[0] + 1, shape[1] + 1), dtype=np.int64)
+    counts = {}
+    conn = footprints.connect()
+    cursor = conn.cursor()
+    try:
+        for prefix in prefixes:
+            where, params = footprints.partition_filter(prefix)
+            tiles = 0
+            for batch in footprints.iter_footprint_batches(
+                    cursor, columns=("area",), where=where, params=params):
+                bounds = footprints.footprint_bounds([row[0] for row in batch])
+                tiles += accumulate_envelopes(diff, bounds, extent, res)
+            counts[prefix] = tiles
+    finally:
+        cursor.close()
+        conn.close()
+    return diff, counts
+
+
+def table_extent(cursor):
+    """
+    GRID_BBOX if set, else the union of all footprint envelopes, or None
+    if the table is empty.
+
+    Streams the `area` column once: MonkDB has no envelope aggregate for
+    GEO_SHAPE, and centroid bounds would clip footprints at the edges.
+    """
+    if GRID_BBOX:
+        return tuple(float(v) for v in GRID_BBOX.split(","))
+    extent = None
+    for batch in footprints.iter_footprint_batches(cursor, columns=("area",)):
+        bounds = footprints.footprint_bounds([row[0] for row in batch])
+        batch_extent = (*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0))
+        extent = batch_extent if extent is None else (
+            min(extent[0], batch_extent[0]), min(extent[1], batch_extent[1]),
+            max(extent[2], batch_extent[2]), max(extent[3], batch_extent[3]))
+    return None if extent is None else tuple(float(v) for v in extent)
+
+
+def write_outputs(grid, extent, res, tiles, duration):
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LogNorm
+
+    os.makedirs(results_dir, exist_ok=True)
+    npy_path = os.path.join(results_dir, "coverage_density.npy")
+    np.save(npy_path, grid)
+    print(f"✅ Saved: {npy_path}")
+
+    try:
+        import rasterio
+        from rasterio.transform import from_origin
+
+        tif_path = os.path.join(results_dir, "coverage_density.tif")
+        with rasterio.open(
+            tif_path, "w", driver="GTiff", height=grid.shape[0],
+            width=grid.shape[1], count=1, dtype="int32", crs="EPSG:4326",
+            transform=from_origin(extent[0], extent[3], res, res),
+            compress="deflate",
+        ) as dst:
+            dst.write(grid.astype(np.int32), 1)
+        print(f"✅ Saved: {tif_path}")
+    except ImportError:
+        print("⚠️ rasterio not available, skipping GeoTIFF output.")
+
+    plt.figure(figsize=(12, 8))
+    masked = np.ma.masked_equal(grid, 0)
+    vmax = max(int(grid.max()), 1)
+    plt.imshow(masked, extent=(extent[0], extent[2], extent[1], extent[3]),
+               cmap="inferno", norm=LogNorm(vmin=1, vmax=max(vmax, 2)),
+               interpolation="nearest")
+    plt.colorbar(label="Overlapping tiles per cell")
+    plt.xlabel("Longitude")
+    plt.ylabel("Latitude")
+    plt.title(f"Tile Coverage Density ({res}° cells)")
+    plt.tight_layout()
+    png_path = os.path.join(results_dir, "coverage_density.png")
+    plt.savefig(png_path, dpi=150)
+    plt.close()
+    print(f"📊 Saved: {png_path}")
+
+    covered = int(np.count_nonzero(grid))
+    redundant = int(np.count_nonzero(grid >= REDUNDANT_THRESHOLD))
+    summary_path = os.path.join(results_dir, "coverage_density_summary.txt")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        f.write(f"Extent (minx, miny, maxx, maxy): {extent}\n")
+        f.write(f"Cell size (deg): {res}\n")
+        f.write(f"Grid shape (rows, cols): {grid.shape}\n")
+        f.write(f"Tiles rasterized: {tiles}\n")
+        f.write(f"Covered cells: {covered} ({covered / grid.size:.2%})\n")
+        f.write(f"Uncovered cells: {grid.size - covered}\n")
+        f.write(f"Max overlap: {int(grid.max())}\n")
+        f.write(f"Redundant cells (>= {REDUNDANT_THRESHOLD} tiles): {redundant}\n")
+        f.write(f"⏱️ Duration: {round(duration, 3)} sec\n")
+    print(f"✅ Saved: {summary_path}")
+
+
+def main():
+    start = time.perf_counter()
+    conn = footprints.connect()
+    cursor = conn.cursor()
+    extent = table_extent(cursor)
+    if extent is None:
+        cursor.close()
+        conn.close()
+        print("❌ No footprints found in the database; skipping the coverage grid.")
+        return 1
+    partitions = footprints.list_partitions(cursor, PARTITION_PRECISION)
+    cursor.close()
+    conn.close()
+
+    shape = grid_shape(extent, GRID_RESOLUTION)
+    print(f"🔍 Rasterizing {len(partitions)} geohash partitions onto a "
+          f"{shape[0]}x{shape[1]} grid with {WORKERS} workers...")
+
+    diff = np.zeros((shape[0] + 1, shape[1] + 1), dtype=np.int64)
+    tiles = 0
+    # Round-robin shares: neighbouring (often equally dense) partitions
+    # land on different workers
+    shares = [partitions[i::WORKERS] for i in range(WORKERS) if partitions[i::WORKERS]]
+    with ProcessPoolExecutor(max_workers=WORKERS) as pool:
+        futures = [pool.submit(rasterize_partitions, share, extent, GRID_RESOLUTION)
+                   for share in shares]
+        for future in as_completed(futures):
+            partial, counts = future.result()
+            diff += partial
+            for prefix, count in counts.items():
+                tiles += count
+                print(f"✅ Partition {prefix}: {count} tiles")
+
+    grid = difference_to_grid(diff)
+    write_outputs(grid, extent, GRID_RESOLUTION, tiles,
+                  time.perf_counter() - start)
+    print(f"🎯 Coverage density completed. Outputs saved to: {results_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
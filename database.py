@@ -0,0 +1,314 @@
+import configparser
+import itertools
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+from monkdb import client
+
+logger = logging.getLogger(__name__)
+
+# Load configuration
+config = configparser.ConfigParser()
+config.read("config.ini", encoding="utf-8")
+
+# DB_HOST may list several nodes ("10.0.0.1,10.0.0.2:4201"); entries
+# without a port use DB_PORT
+DB_HOSTS = [h.strip() for h in config['database']['DB_HOST'].split(",") if h.strip()]
+DB_PORT = config['database']['DB_PORT']
+DB_USER = config['database']['DB_USER']
+DB_PASSWORD = config['database']['DB_PASSWORD']
+DB_SCHEMA = config['database']['DB_SCHEMA']
+RASTER_TABLE = config['database']['RASTER_GEO_SHAPE_TABLE_V2']
+
+# Pool / retry settings (all optional)
+POOL_SIZE = config.getint('database', 'DB_POOL_SIZE', fallback=8)
+MAX_RETRIES = config.getint('database', 'DB_MAX_RETRIES', fallback=3)
+RETRY_BACKOFF = config.getfloat('database', 'DB_RETRY_BACKOFF', fallback=0.5)
+TIMEOUT = config.getfloat('database', 'DB_TIMEOUT', fallback=60.0)
+# Seconds to wait for a free pooled connection before giving up
+POOL_TIMEOUT = config.getfloat('database', 'DB_POOL_TIMEOUT', fallback=30.0)
+
+_statement_hooks = []
+# Body size of the last SQL request each thread sent
+_request_sizes = threading.local()
+
+
+def add_statement_hook(hook):
+    """
+    Register `hook(sql, seconds, rowcount, error)`, called after every
+    statement run through a pooled cursor (error is None on success).
+    """
+    _statement_hooks.append(hook)
+
+
+def remove_statement_hook(hook):
+    if hook in _statement_hooks:
+        _statement_hooks.remove(hook)
+
+
+def last_request_bytes():
+    """
+    Size in bytes of the last SQL request body the MonkDB client sent from
+    this thread, or None if nothing was sent or the client doesn't expose it.
+    """
+    return getattr(_request_sizes, "value", None)
+
+
+def _track_request_sizes(connection):
+    # MonkClient serializes the statement and its args once, then hands the
+    # bytes to _json_request; record their length there
+    monk_client = getattr(connection, "client", None)
+    json_request = getattr(monk_client, "_json_request", None)
+    if json_request is None:
+        return connection
+
+    def tracked(method, path, data):
+        _request_sizes.value = len(data or b"")
+        return json_request(method, path, data)
+
+    monk_client._json_request = tracked
+    return connection
+
+
+def server_urls():
+    urls = []
+    for host in DB_HOSTS:
+        address = host if ":" in host else f"{host}:{DB_PORT}"
+        urls.append(f"http://{DB_USER}:{DB_PASSWORD}@{address}")
+    return urls
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Connection-level failures worth retrying (node down, reset, timeout).
+    """
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return type(error).__name__ in ("ConnectionError", "TimeoutError",
+                                    "ProtocolError", "MaxRetryError")
+
+
+def is_unsent(error: Exception) -> bool:
+    """
+    Failures known to happen before the request reached the server
+    (refused or failed connects), so even a write can safely be resent.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, ConnectionRefusedError) or type(error).__name__ in (
+                "NewConnectionError", "ConnectTimeoutError"):
+            return True
+        error = getattr(error, "reason", None) or error.__cause__ or error.__context__
+    return False
+
+
+_IDEMPOTENT = re.compile(
+    r"^\s*(SELECT|WITH|SHOW|EXPLAIN|REFRESH|OPTIMIZE|ANALYZE|SET"
+    r"|CREATE\s+TABLE\s+IF\s+NOT\s+EXISTS|DROP\s+TABLE\s+IF\s+EXISTS)\b", re.IGNORECASE)
+
+
+def is_idempotent(sql: str) -> bool:
+    """
+    Statements that can run twice without changing the outcome. INSERTs
+    into tables without a primary key are not: a retry after a timeout
+    the server already acted on would duplicate the batch.
+    """
+    return bool(_IDEMPOTENT.match(sql))
+
+
+class PooledCursor:
+    """
+    Cursor wrapper that retries transient errors and reports statement
+    timings to the registered hooks. Everything else is delegated to the
+    underlying MonkDB cursor.
+
+    Reads and other idempotent statements are retried on any transient
+    error; writes only when the request never reached the server.
+    """
+
+    def __init__(self, cursor, max_retries: int, backoff: float):
+        self._cursor = cursor
+        self._max_retries = max_retries
+        self._backoff = backoff
+
+    def _run(self, method, sql, *args):
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                result = method(sql, *args)
+            except Exception as e:
+                seconds = time.perf_counter() - start
+                retry = (attempt < self._max_retries and is_transient(e)
+                         and (is_idempotent(sql) or is_unsent(e)))
+                _notify(sql, seconds, -1, e)
+                if not retry:
+                    raise
+                delay = self._backoff * (2 ** attempt)
+                logger.warning("Transient MonkDB error (%s), retrying in %.1fs", e, delay)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            _notify(sql, time.perf_counter() - start, self._cursor.rowcount, None)
+            return result
+
+    def execute(self, sql, parameters=None):
+        if parameters is None:
+            return self._run(self._cursor.execute, sql)
+        return self._run(self._cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(self._cursor.executemany, sql, seq_of_parameters)
+
+    def close(self):
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+def _notify(sql, seconds, rowcount, error):
+    for hook in list(_statement_hooks):
+        try:
+            hook(sql, seconds, rowcount, error)
+        except Exception:
+            logger.exception("Statement hook failed")
+
+
+class PooledConnection:
+    """
+    A connection checked out of a ConnectionPool. `close()` hands it back
+    to the pool instead of closing it, so HTTP keep-alive sockets are
+    reused by the next caller.
+    """
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+        self._closed = False
+
+    def cursor(self):
+        return PooledCursor(self._connection.cursor(), self._pool.max_retries,
+                            self._pool.backoff)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._pool.release(self._connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of MonkDB connections.
+
+    Connections are opened lazily up to `size`; callers block when all are
+    checked out, for at most `acquire_timeout` seconds. Each new connection
+    gets the node list rotated by one, so load spreads round-robin across
+    DB_HOST entries while the client can still fail over to the remaining
+    nodes. Sockets use TCP keep-alive.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, max_retries: int = MAX_RETRIES,
+                 backoff: float = RETRY_BACKOFF, timeout: float = TIMEOUT,
+                 acquire_timeout: float = POOL_TIMEOUT):
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._rotation = itertools.count()
+
+    def _open(self):
+        urls = server_urls()
+        shift = next(self._rotation) % len(urls)
+        return _track_request_sizes(client.connect(
+            urls[shift:] + urls[:shift],
+            username=DB_USER,
+            timeout=self.timeout,
+            backoff_factor=self.backoff,
+            socket_keepalive=True,
+        ))
+
+    def acquire(self) -> PooledConnection:
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    connection = self._open()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                try:
+                    connection = self._idle.get(timeout=self.acquire_timeout)
+                except queue.Empty:
+                    raise TimeoutError(
+                        f"No MonkDB connection free after {self.acquire_timeout}s "
+                        f"(pool size {self.size})") from None
+        return PooledConnection(self, connection)
+
+    def release(self, connection):
+        self._idle.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._opened = 0
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Process-wide pool shared by every script and worker thread.
+
+    Worker processes forked from a parent that already had a pool get a
+    fresh one rather than sharing the parent's sockets.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool()
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def connect() -> PooledConnection:
+    """
+    Check a connection out of the shared pool; `close()` returns it.
+    """
+    return get_pool().acquire()
@@ -0,0 +1,196 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+from shapely.geometry import box
+
+import footprints
+from footprints import config
+
+IOU_THRESHOLD = config.getfloat(
+    "analytics", "duplicate_iou_threshold", fallback=0.9)
+PARTITION_PRECISION = config.getint(
+    "analytics", "partition_precision", fallback=3)
+WORKERS = config.getint("analytics", "workers", fallback=os.cpu_count() or 1)
+
+results_dir = os.path.join(os.getcwd(), "results", "v3")
+
+
+def _load(cursor, where, params, precision):
+    columns = ("_id", "tile_id", "layer", "area",
+               f"substr(geohash(centroid), 1, {int(precision)})")
+    ids, tile_ids, layers, areas, regions = [], [], [], [], []
+    for batch in footprints.iter_footprint_batches(
+            cursor, columns=columns, where=where, params=params):
+        for row_id, tile_id, layer, area, region in batch:
+            ids.append(row_id)
+            tile_ids.append(tile_id)
+            layers.append(layer)
+            areas.append(area)
+            regions.append(region)
+    geoms = (footprints.footprint_geometries(areas) if areas
+             else np.empty(0, dtype=object))
+    return (np.array(ids, dtype=object), tile_ids,
+            np.array(layers, dtype=object), geoms, regions)
+
+
+def iou_pairs(geoms, layers, left, threshold):
+    """
+    Find near-identical footprint pairs with one bulk STRtree query.
+
+    `left` is the number of leading geometries owned by the current
+    partition; the rest are halo tiles from neighbouring partitions.
+    Returns (i, j, iou) arrays with i < left, i != j, same layer and
+    IoU >= threshold.
+    """
+    tree = STRtree(geoms)
+    i, j = tree.query(geoms[:left], predicate="intersects")
+    keep = (i != j) & (layers[i] == layers[j])
+    i, j = i[keep], j[keep]
+    inter = shapely.area(shapely.intersection(geoms[i], geoms[j]))
+    union = shapely.area(shapely.union(geoms[i], geoms[j]))
+    iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+    keep = iou >= threshold
+    return i[keep], j[keep], iou[keep]
+
+
+def detect_partition(prefix, threshold):
+    """
+    Worker: find duplicate pairs owned by one geohash partition.
+
+    Tiles in the partition are joined against themselves plus a halo of
+    tiles from other partitions that intersect the partition's extent.
+    A pair inside the partition is emitted once (i < j); a pair crossing
+    into the halo is emitted only by the lexicographically smaller
+    partition, so no pair is reported twice across workers.
+    """
+    where, params = footprints.partition_filter(prefix)
+    conn = footprints.connect()
+    cursor = conn.cursor()
+    try:
+        ids, tile_ids, layers, geoms, _ = _load(
+            cursor, where, params, len(prefix))
+        if len(geoms) == 0:
+            return prefix, []
+        extent = box(*shapely.total_bounds(geoms)).wkt
+        h_ids, h_tiles, h_layers, h_geoms, h_regions = _load(
+            cursor, f"intersects(area, ?) AND NOT ({where})",
+            (extent, *params), len(prefix))
+    finally:
+        cursor.close()
+        conn.close()
+
+    left = len(geoms)
+    all_ids = np.concatenate([ids, h_ids])
+    all_tiles = tile_ids + h_tiles
+    all_layers = np.concatenate([layers, h_layers])
+    all_geoms = np.concatenate([geoms, h_geoms])
+
+    i, j, iou = iou_pairs(all_geoms, all_layers, left, threshold)
+    pairs = []
+    for a, b, score in zip(i, j, iou):
+        if b < left and a > b:
+            continue
+        if b >= left and h_regions[b - left] < prefix:
+            continue
+        pairs.append((all_layers[a], all_ids[a], all_tiles[a],
+                      all_ids[b], all_tiles[b], round(float(score), 4)))
+    return prefix, pairs
+
+
+def cluster_pairs(pairs_df):
+    """
+    Group duplicate pairs into connected clusters per layer (union-find).
+    """
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in zip(pairs_df["id_a"], pairs_df["id_b"]):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+
+    tile_names = dict(zip(pairs_df["id_a"], pairs_df["tile_a"]))
+    tile_names.update(zip(pairs_df["id_b"], pairs_df["tile_b"]))
+    layer_of = dict(zip(pairs_df["id_a"], pairs_df["layer"]))
+    layer_of.update(zip(pairs_df["id_b"], pairs_df["layer"]))
+
+    members = {}
+    for row_id in parent:
+        members.setdefault(find(row_id), []).append(row_id)
+
+    clusters = []
+    for root, ids in members.items():
+        clusters.append({
+            "layer": layer_of[root],
+            "cluster_size": len(ids),
+            "representative": tile_names[root],
+            "tile_ids": ";".join(sorted(tile_names[i] for i in ids)),
+        })
+    df = pd.DataFrame(clusters, columns=["layer", "cluster_size",
+                                         "representative", "tile_ids"])
+    df = df.sort_values(["layer", "cluster_size"], ascending=[True, False])
+    df.insert(1, "cluster_id", df.groupby("layer").cumcount() + 1)
+    return df
+
+
+def main():
+    start = time.perf_counter()
+    conn = footprints.connect()
+    cursor = conn.cursor()
+    partitions = footprints.list_partitions(cursor, PARTITION_PRECISION)
+    cursor.close()
+    conn.close()
+
+    print(f"🔍 Self-joining {len(partitions)} geohash partitions "
+          f"(IoU >= {IOU_THRESHOLD}) with {WORKERS} workers...")
+    pairs = []
+    with ProcessPoolExecutor(max_workers=WORKERS) as pool:
+        futures = [pool.submit(detect_partition, prefix, IOU_THRESHOLD)
+                   for prefix in partitions]
+        for future in as_completed(futures):
+            prefix, found = future.result()
+            pairs.extend(found)
+            print(f"✅ Partition {prefix}: {len(found)} duplicate pairs")
+
+    os.makedirs(results_dir, exist_ok=True)
+    pairs_df = pd.DataFrame(pairs, columns=["layer", "id_a", "tile_a",
+                                            "id_b", "tile_b", "iou"])
+    pairs_df.drop(columns=["id_a", "id_b"]).to_csv(
+        os.path.join(results_dir, "duplicate_footprint_pairs.csv"), index=False)
+    clusters_df = cluster_pairs(pairs_df)
+    clusters_df.to_csv(os.path.join(
+        results_dir, "duplicate_footprint_clusters.csv"), index=False)
+    duration = round(time.perf_counter() - start, 3)
+
+    with open(os.path.join(results_dir, "duplicate_footprint_summary.txt"),
+              "w", encoding="utf-8") as f:
+        f.write(f"IoU threshold: {IOU_THRESHOLD}\n")
+        f.write(f"Partitions: {len(partitions)}\n")
+        f.write(f"Duplicate pairs: {len(pairs_df)}\n")
+        f.write(f"Duplicate clusters: {len(clusters_df)}\n\n")
+        if not clusters_df.empty:
+            per_layer = clusters_df.groupby("layer").agg(
+                clusters=("cluster_id", "count"),
+                duplicated_tiles=("cluster_size", "sum"),
+                largest_cluster=("cluster_size", "max"))
+            f.write(per_layer.to_string())
+            f.write("\n")
+        f.write(f"⏱️ Duration: {duration} sec\n")
+
+    print(f"🎯 Found {len(clusters_df)} duplicate clusters. "
+          f"Results saved to: {results_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import configparser
+import os
+
+import numpy as np
+import shapely
+
+import database
+
+# Load configuration
+config = configparser.ConfigParser()
+config.read("config.ini", encoding="utf-8")
+
+DB_SCHEMA = database.DB_SCHEMA
+RASTER_TABLE = database.RASTER_TABLE
+
+# Path resolution (same as insert script)
+tile_dir = config['sentinel']['sentinel_data_dir_v2']
+output_filename = config['paths']['output_csv_v3']
+TILE_INDEX_PATH = os.path.join(tile_dir, "tile_index", output_filename)
+
+# Rows fetched per round trip when streaming the table
+STREAM_BATCH_SIZE = config.getint("analytics", "stream_batch_size",
+                                  fallback=50_000)
+
+
+def connect():
+    """
+    Check out a connection from the shared MonkDB pool (see database.py).
+    """
+    return database.connect()
+
+
+def list_partitions(cursor, precision=3):
+    """
+    Return the geohash prefixes (length >= 3) that hold at least one tile.
+
+    Precision 3 maps directly onto the indexed `geohash3` column; longer
+    prefixes split crowded regions into more, smaller work units.
+    """
+    if precision <= 3:
+        cursor.execute(f"""
+            SELECT DISTINCT geohash3
+            FROM {DB_SCHEMA}.{RASTER_TABLE}
+            ORDER BY geohash3
+        """)
+    else:
+        cursor.execute(f"""
+            SELECT DISTINCT substr(geohash(centroid), 1, {int(precision)}) AS region
+            FROM {DB_SCHEMA}.{RASTER_TABLE}
+            ORDER BY region
+        """)
+    return [row[0] for row in cursor.fetchall() if row[0]]
+
+
+def partition_filter(prefix):
+    """
+    SQL predicate and parameters selecting the tiles of one geohash partition.
+    """
+    if len(prefix) <= 3:
+        return "geohash3 = ?", (prefix,)
+    return "geohash3 = ? AND geohash(centroid) LIKE ?", (prefix[:3], f"{prefix}%")
+
+
+def time_window_filter(start=None, end=None):
+    """
+    SQL predicate and parameters restricting rows to an acquisition window.
+
+    Bounds are ISO-8601 strings (either may be omitted). The predicate is
+    repeated on the generated `acquired_month` column so that a table
+    created with PARTITION_BY_MONTH only scans the matching partitions.
+    """
+    clauses, params = [], []
+    if start:
+        clauses.append("acquired_at >= ? AND acquired_month >= date_trunc('month', ?::TIMESTAMP WITH TIME ZONE)")
+        params += [start, start]
+    if end:
+        clauses.append("acquired_at < ? AND acquired_month <= date_trunc('month', ?::TIMESTAMP WITH TIME ZONE)")
+        params += [end, end]
+    return " AND ".join(clauses), tuple(params)
+
+
+def intersects_filter(geom_wkt):
+    """
+    Coarse SQL predicate and parameters for tiles whose valid data may
+    intersect `geom_wkt`.
+
+    Uses the `outline_coarse` level, which contains the valid-data outline,
+    so it never drops a real match. Rows ingested before outlines existed
+    fall back to the `area` box. Refine the candidates with
+    `refine_intersecting`.
+    """
+    return ("(intersects(outline_coarse, ?) OR "
+            "(outline_coarse IS NULL AND intersects(area, ?)))"), (geom_wkt, geom_wkt)
+
+
+def detailed_geometries(outlines, areas):
+    """
+    Shapely geometries for exact refinement: each row's detailed `outline`,
+    or its `area` box where the row has none.
+    """
+    geoms = np.empty(len(outlines), dtype=object)
+    for i, (outline, area) in enumerate(zip(outlines, areas)):
+        value = outline if outline is not None else area
+        geoms[i] = (shapely.from_wkt(value) if isinstance(value, str)
+                    else shapely.geometry.shape(value))
+    return geoms
+
+
+def refine_intersecting(geom, rows, outline_index, area_index):
+    """
+    Keep the candidate rows whose detailed geometry really intersects
+    `geom` (a shapely geometry), in their original order.
+    """
+    if not rows:
+        return []
+    geoms = detailed_geometries([r[outline_index] for r in rows],
+                                [r[area_index] for r in rows])
+    shapely.prepare(geom)
+    hits = shapely.intersects(geom, geoms)
+    return [row for row, hit in zip(rows, hits) if hit]
+
+
+def iter_footprint_batches(cursor, columns=("tile_id", "layer", "area"),
+                           where="", params=(), batch_size=STREAM_BATCH_SIZE):
+    """
+    Stream rows of the raster table in bounded batches.
+
+    Pages with a keyset on the `_id` system column, so every round trip is a
+    small indexed range scan and memory stays flat however large the table is.
+    Yields lists of row tuples in the order of `columns`.
+    """
+    select_cols = ", ".join(columns)
+    condition = f"AND ({where})" if where else ""
+    last_id = ""
+    while True:
+        cursor.execute(f"""
+            SELECT _id, {select_cols}
+            FROM {DB_SCHEMA}.{RASTER_TABLE}
+            WHERE _id > ? {condition}
+            ORDER BY _id
+            LIMIT {int(batch_size)}
+        """, (last_id, *params))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [tuple(row[1:]) for row in rows]
+        if len(rows) < batch_size:
+            return
+
+
+def _exterior_coords(area):
+    # MonkDB returns GEO_SHAPE values as GeoJSON dicts; accept WKT as well
+    if isinstance(area, str):
+        return shapely.get_coordinates(shapely.from_wkt(area).exterior)
+    coords = area["coordinates"]
+    if area["type"] == "MultiPolygon":
+        coords = coords[0]
+    return coords[0]
+
+
+def footprint_bounds(areas):
+    """
+    Vectorised envelopes of a batch of GEO_SHAPE values.
+
+    Returns an (n, 4) float array of (minx, miny, maxx, maxy). Rings that
+    share a vertex count (the common case: every box footprint has 5) are
+    stacked and reduced in one NumPy call.
+    """
+    rings = [_exterior_coords(a) for a in areas]
+    if not rings:
+        return np.empty((0, 4))
+    if len({len(r) for r in rings}) == 1:
+        coords = np.asarray(rings, dtype=float)
+        return np.hstack([coords.min(axis=1), coords.max(axis=1)])
+    bounds = np.empty((len(rings), 4))
+    for i, ring in enumerate(rings):
+        coords = np.asarray(ring, dtype=float)
+        bounds[i, :2] = coords.min(axis=0)
+        bounds[i, 2:] = coords.max(axis=0)
+    return bounds
+
+
+def footprint_geometries(areas):
+    """
+    Build a NumPy array of shapely polygons from a batch of GEO_SHAPE values.
+    """
+    rings = [_exterior_coords(a) for a in areas]
+    if rings and len({len(r) for r in rings}) == 1:
+        return shapely.polygons(np.asarray(rings, dtype=float))
+    return np.array([shapely.polygons(r) for r in rings], dtype=object)
+
+
+def load_tile_index(path=TILE_INDEX_PATH):
+    """
+    Read the index written by index_v3.py and reproject its UTM bboxes.
+
+    Returns a DataFrame with the index columns plus a WGS84 `geometry`
+    column. The UTM zone is taken from each row's MGRS `utm_tile`.
+    """
+    import pandas as pd
+
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path)
+    df["geometry"] = _index_geometries(df, {})
+    return df
+
+
+def iter_tile_index(path=TILE_INDEX_PATH, chunksize=STREAM_BATCH_SIZE):
+    """
+    Stream the tile index in DataFrame chunks of up to `chunksize` rows,
+    each with the WGS84 `geometry` column `load_tile_index` adds.
+    """
+    import pandas as pd
+
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        chunks = (batch.to_pandas() for batch in
+                  pq.ParquetFile(path).iter_batches(batch_size=chunksize))
+    else:
+        chunks = pd.read_csv(path, chunksize=chunksize)
+    transformers = {}
+    for df in chunks:
+        df["geometry"] = _index_geometries(df, transformers)
+        yield df
+
+
+def _index_geometries(df, transformers):
+    # Index bboxes are in the UTM zone of each row's MGRS tile
+    from pyproj import Transformer
+    from shapely.ops import transform as shapely_transform
+
+    geometries = []
+    for utm_tile, bbox in zip(df["utm_tile"], df["bbox"]):
+        epsg = utm_epsg(utm_tile)
+        if epsg not in transformers:
+            transformers[epsg] = Transformer.from_crs(
+                f"EPSG:{epsg}", "EPSG:4326", always_xy=True)
+        geometries.append(shapely_transform(
+            transformers[epsg].transform, shapely.from_wkt(bbox)))
+    return geometries
+
+
+def utm_epsg(utm_tile):
+    """
+    EPSG code of the UTM zone for an MGRS tile id such as 'T30UVA'.
+    """
+    code = utm_tile.lstrip("T")
+    zone, band = int(code[:2]), code[2]
+    return (32600 if band >= "N" else 32700) + zone
@@ -1,6 +1,8 @@
 import configparser
 import pandas as pd
-from monkdb import client
+from database import connect, DB_SCHEMA, RASTER_TABLE
+import footprints
+import metrics
 from shapely.geometry import shape
 from shapely import wkt
 from shapely.geometry import Polygon
@@ -29,14 +31,6 @@ def swap_wkt_coords(wkt_str):
 config = configparser.ConfigParser()
 config.read("config.ini", encoding="utf-8")
 
-# Database config
-DB_HOST = config['database']['DB_HOST']
-DB_PORT = config['database']['DB_PORT']
-DB_USER = config['database']['DB_USER']
-DB_PASSWORD = config['database']['DB_PASSWORD']
-DB_SCHEMA = config['database']['DB_SCHEMA']
-RASTER_TABLE = config['database']['RASTER_GEO_SHAPE_TABLE_V2']
-
 # Path resolution (same as insert script)
 tile_dir = config['sentinel']['sentinel_data_dir_v2']
 output_filename = config['paths']['output_csv_v3']
@@ -45,91 +39,135 @@ TILE_INDEX_CSV = os.path.join(tile_index_dir, output_filename)
 
 # Output folder: use 'results' directory in current working directory
 output_dir = os.path.join(os.getcwd(), "results", "v3")
-os.makedirs(output_dir, exist_ok=True)
 
-# Connect to MonkDB
-conn = client.connect(
-    f"http://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}",
-    username=DB_USER
-)
-cursor = conn.cursor()
+# Sample intersection: rows kept, and candidates fetched per round trip
+# (outline shapes make each row heavy)
+SAMPLE_HITS = 100
+SAMPLE_BATCH_SIZE = 500
+
 
 # 1. Layer-wise Statistics
-print("🔍 Running layer-wise descriptive stats...")
-cursor.execute(f"""
-    SELECT
-        layer,
-        COUNT(*) AS tile_count,
-        MIN(area_km) AS min_area,
-        MAX(area_km) AS max_area,
-        ROUND(AVG(area_km), 2) AS mean_area,
-        ROUND(stddev(area_km), 2) AS stddev_area
-    FROM {DB_SCHEMA}.{RASTER_TABLE}
-    GROUP BY layer
-    ORDER BY layer
-""")
-stats_df = pd.DataFrame(cursor.fetchall())
-stats_df.to_csv(os.path.join(output_dir, "layer_statistics.csv"), index=False)
-print("✅ Saved: results/layer_statistics.csv")
+def layer_statistics(cursor):
+    print("🔍 Running layer-wise descriptive stats...")
+    cursor.execute(f"""
+        SELECT
+            layer,
+            COUNT(*) AS tile_count,
+            MIN(area_km) AS min_area,
+            MAX(area_km) AS max_area,
+            ROUND(AVG(area_km), 2) AS mean_area,
+            ROUND(stddev(area_km), 2) AS stddev_area
+        FROM {DB_SCHEMA}.{RASTER_TABLE}
+        GROUP BY layer
+        ORDER BY layer
+    """)
+    stats_df = pd.DataFrame(cursor.fetchall())
+    stats_df.to_csv(os.path.join(output_dir, "layer_statistics.csv"), index=False)
+    print("✅ Saved: results/layer_statistics.csv")
+    return stats_df
+
 
 # 2. Percentile distribution
-print("🔍 Running percentile distribution...")
-cursor.execute(f"""
-    SELECT
-        layer,
-        percentile(area_km, 0.25) AS p25,
-        percentile(area_km, 0.5) AS median,
-        percentile(area_km, 0.75) AS p75,
-        percentile(area_km, 0.95) AS p95
-    FROM {DB_SCHEMA}.{RASTER_TABLE}
-    GROUP BY layer
-    ORDER BY layer
-""")
-percentile_df = pd.DataFrame(cursor.fetchall())
-percentile_df.to_csv(os.path.join(
-    output_dir, "layer_percentiles.csv"), index=False)
-print("✅ Saved: results/layer_percentiles.csv")
+def layer_percentiles(cursor):
+    print("🔍 Running percentile distribution...")
+    cursor.execute(f"""
+        SELECT
+            layer,
+            percentile(area_km, 0.25) AS p25,
+            percentile(area_km, 0.5) AS median,
+            percentile(area_km, 0.75) AS p75,
+            percentile(area_km, 0.95) AS p95
+        FROM {DB_SCHEMA}.{RASTER_TABLE}
+        GROUP BY layer
+        ORDER BY layer
+    """)
+    percentile_df = pd.DataFrame(cursor.fetchall())
+    percentile_df.to_csv(os.path.join(
+        output_dir, "layer_percentiles.csv"), index=False)
+    print("✅ Saved: results/layer_percentiles.csv")
+    return percentile_df
+
 
 # 3. Tiles Intersecting with a Given WKT (from DB)
-print("📍 Querying for a sample WKT polygon intersection...")
-cursor.execute(f"SELECT area FROM {DB_SCHEMA}.{RASTER_TABLE} LIMIT 1")
-sample_area_row = cursor.fetchone()
-if not sample_area_row:
-    print("❌ No geometries found in the database.")
-    cursor.close()
-    conn.close()
-    exit(1)
-sample_geom = shape(sample_area_row[0])
-sample_wkt = sample_geom.wkt
-
-cursor.execute(f"""
-    SELECT tile_id, layer, area_km, centroid
-    FROM {DB_SCHEMA}.{RASTER_TABLE}
-    WHERE intersects(area, ?)
-    ORDER BY area_km DESC
-    LIMIT 100
-""", (sample_wkt,))
-wkt_query_df = pd.DataFrame(cursor.fetchall())
-wkt_query_df.to_csv(os.path.join(
-    output_dir, "wkt_intersection_results.csv"), index=False)
-print("✅ Saved: results/wkt_intersection_results.csv")
+def sample_intersection(cursor):
+    """
+    The SAMPLE_HITS largest tiles intersecting the first footprint in the
+    table, or None if the table is empty.
+    """
+    print("📍 Querying for a sample WKT polygon intersection...")
+    cursor.execute(f"SELECT area FROM {DB_SCHEMA}.{RASTER_TABLE} LIMIT 1")
+    sample_area_row = cursor.fetchone()
+    if not sample_area_row:
+        print("❌ No geometries found in the database.")
+        return None
+    sample_geom = shape(sample_area_row[0])
+    sample_wkt = sample_geom.wkt
+
+    # Coarse outline filter in MonkDB, largest candidates first; exact check
+    # on the detailed outline one page at a time, until SAMPLE_HITS are found
+    where, params = footprints.intersects_filter(sample_wkt)
+    rows = []
+    offset = 0
+    while len(rows) < SAMPLE_HITS:
+        cursor.execute(f"""
+            SELECT tile_id, layer, area_km, centroid, outline, area
+            FROM {DB_SCHEMA}.{RASTER_TABLE}
+            WHERE {where}
+            ORDER BY area_km DESC NULLS LAST, _id
+            LIMIT {SAMPLE_BATCH_SIZE} OFFSET {offset}
+        """, params)
+        batch = [tuple(row) for row in cursor.fetchall()]
+        rows += footprints.refine_intersecting(sample_geom, batch, 4, 5)
+        if len(batch) < SAMPLE_BATCH_SIZE:
+            break
+        offset += SAMPLE_BATCH_SIZE
+    rows = [row[:4] for row in rows[:SAMPLE_HITS]]
+    wkt_query_df = pd.DataFrame(rows)
+    wkt_query_df.to_csv(os.path.join(
+        output_dir, "wkt_intersection_results.csv"), index=False)
+    print("✅ Saved: results/wkt_intersection_results.csv")
+    return wkt_query_df
+
 
 # 4. Server-side Boundary Extraction (from DB)
-print("🧩 Computing union and bounding box from database polygons...")
-cursor.execute(f"SELECT area FROM {DB_SCHEMA}.{RASTER_TABLE}")
-areas = cursor.fetchall()
-geoms = [shape(row[0]) for row in areas]
-union_geom = unary_union(geoms)
-bbox = union_geom.bounds  # (minx, miny, maxx, maxy)
-
-with open(os.path.join(output_dir, "boundary_summary.txt"), "w", encoding="utf-8") as f:
-    f.write("BOUNDING BOX (minx, miny, maxx, maxy):\n")
-    f.write(f"{bbox}\n\n")
-    f.write("WKT of unified geometry:\n")
-    f.write(union_geom.wkt)
-print("✅ Saved: results/boundary_summary.txt")
-
-# Clean up
-cursor.close()
-conn.close()
-print("🎯 All analytics completed successfully. Outputs saved to 'results' directory.")
+def boundary_summary(cursor):
+    print("🧩 Computing union and bounding box from database polygons...")
+    cursor.execute(f"SELECT area FROM {DB_SCHEMA}.{RASTER_TABLE}")
+    areas = cursor.fetchall()
+    geoms = [shape(row[0]) for row in areas]
+    union_geom = unary_union(geoms)
+    bbox = union_geom.bounds  # (minx, miny, maxx, maxy)
+
+    with open(os.path.join(output_dir, "boundary_summary.txt"), "w", encoding="utf-8") as f:
+        f.write("BOUNDING BOX (minx, miny, maxx, maxy):\n")
+        f.write(f"{bbox}\n\n")
+        f.write("WKT of unified geometry:\n")
+        f.write(union_geom.wkt)
+    print("✅ Saved: results/boundary_summary.txt")
+    return union_geom
+
+
+def main():
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Connect to MonkDB
+    metrics.instrument_database()
+    conn = connect()
+    cursor = conn.cursor()
+    try:
+        layer_statistics(cursor)
+        layer_percentiles(cursor)
+        if sample_intersection(cursor) is None:
+            return 1
+        boundary_summary(cursor)
+    finally:
+        # Clean up
+        cursor.close()
+        conn.close()
+    metrics.export("geo_analytics_queries")
+    print("🎯 All analytics completed successfully. Outputs saved to 'results' directory.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,163 @@
+import os
+import math
+import argparse
+import configparser
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.enums import Resampling
+from dask import delayed, compute
+import dask.dataframe as dd
+
+# Load config
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+tile_dir = config["sentinel"]["sentinel_data_dir_v2"].rstrip("/")
+output_filename = config["paths"]["output_csv_v3"]
+export_format = config["metadata"].get("export_format", "csv").lower()
+
+# Same index file index_v3.py writes
+output_dir = os.path.join(tile_dir, "tile_index")
+index_file_path = os.path.join(output_dir, output_filename)
+
+preview_dir = config.get("previews", "preview_dir",
+                         fallback=os.path.join(tile_dir, "previews"))
+OVERVIEW_FACTOR = config.getint("previews", "overview_factor", fallback=8)
+OVERVIEW_LEVELS = [int(f) for f in config.get(
+    "previews", "overview_levels", fallback="2,4,8").split(",")]
+THUMBNAIL_SIZE = config.getint("previews", "thumbnail_size", fallback=256)
+
+
+def is_current(output, source):
+    return os.path.exists(output) and os.path.getmtime(output) >= os.path.getmtime(source)
+
+
+@delayed
+def build_previews(path):
+    """
+    Write a decimated overview GeoTIFF and a PNG thumbnail for one tile.
+
+    The source is read once at 1/OVERVIEW_FACTOR resolution; GDAL serves
+    that from the nearest internal overview when the GeoTIFF has one, so
+    the full-resolution band is never decoded. The thumbnail and the
+    overview pyramid are derived from that small array. Tiles whose
+    previews are newer than the source are skipped.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    overview_path = os.path.join(preview_dir, f"{stem}_overview.tif")
+    thumbnail_path = os.path.join(preview_dir, f"{stem}_thumb.png")
+    if is_current(overview_path, path) and is_current(thumbnail_path, path):
+        return {"path": path, "overview_path": overview_path,
+                "thumbnail_path": thumbnail_path, "generated": False}
+
+    try:
+        with rasterio.open(path) as src:
+            height = max(1, math.ceil(src.height / OVERVIEW_FACTOR))
+            width = max(1, math.ceil(src.width / OVERVIEW_FACTOR))
+            data = src.read(1, out_shape=(height, width),
+                            resampling=Resampling.average)
+            transform = src.transform * src.transform.scale(
+                src.width / width, src.height / height)
+            profile = {
+                "driver": "GTiff", "height": height, "width": width,
+                "count": 1, "dtype": data.dtype, "crs": src.crs,
+                "transform": transform, "nodata": src.nodata,
+                "tiled": True, "blockxsize": 256, "blockysize": 256,
+                "compress": "deflate",
+            }
+            nodata = src.nodata
+
+        with rasterio.open(overview_path, "w", **profile) as dst:
+            dst.write(data, 1)
+            dst.build_overviews(OVERVIEW_LEVELS, Resampling.average)
+            dst.update_tags(ns="rio_overview", resampling="average")
+
+        write_thumbnail(data, nodata, thumbnail_path)
+        return {"path": path, "overview_path": overview_path,
+                "thumbnail_path": thumbnail_path, "generated": True}
+
+    except Exception as e:
+        print(f"Failed to build previews for {path}: {e}")
+        return None
+
+
+def write_thumbnail(data, nodata, thumbnail_path):
+    import matplotlib.pyplot as plt
+
+    step = max(1, math.ceil(max(data.shape) / THUMBNAIL_SIZE))
+    small = data[::step, ::step].astype(np.float32)
+    if nodata is None:
+        valid = np.ones(small.shape, bool)
+    elif np.isnan(nodata):
+        # NaN never equals itself
+        valid = ~np.isnan(small)
+    else:
+        valid = small != nodata
+    if valid.any():
+        lo, hi = np.percentile(small[valid], (2, 98))
+        small = np.clip((small - lo) / max(hi - lo, 1e-6), 0, 1)
+    rgba = plt.get_cmap("gray")(small)
+    rgba[..., 3] = valid
+    plt.imsave(thumbnail_path, rgba)
+
+
+def update_database(records):
+    """
+    Copy freshly generated preview paths onto the matching MonkDB rows.
+    """
+    from footprints import connect, DB_SCHEMA, RASTER_TABLE
+
+    conn = connect()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(
+            f"""UPDATE {DB_SCHEMA}.{RASTER_TABLE}
+                SET thumbnail_path = ?, overview_path = ?
+                WHERE path = ?""",
+            [(r["thumbnail_path"], r["overview_path"], r["path"]) for r in records]
+        )
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate thumbnails and overviews for indexed tiles.")
+    parser.add_argument("--no-db", action="store_true",
+                        help="Only update the tile index, not MonkDB rows")
+    args = parser.parse_args(argv)
+
+    if export_format == "parquet":
+        index_df = pd.read_parquet(index_file_path)
+    else:
+        index_df = pd.read_csv(index_file_path)
+    os.makedirs(preview_dir, exist_ok=True)
+
+    print(f"Building previews for {len(index_df)} tiles into: {preview_dir}")
+    tasks = [build_previews(p) for p in index_df["path"].unique()]
+    results = [r for r in compute(*tasks, scheduler="processes") if r is not None]
+    generated = [r for r in results if r["generated"]]
+    print(f"Generated {len(generated)} new previews, "
+          f"{len(results) - len(generated)} already up to date.")
+
+    previews = pd.DataFrame(results, columns=[
+        "path", "overview_path", "thumbnail_path", "generated"]).drop(columns="generated")
+    index_df = index_df.drop(columns=["overview_path", "thumbnail_path"],
+                             errors="ignore").merge(previews, on="path", how="left")
+    df = dd.from_pandas(index_df, npartitions=1)
+    if export_format == "parquet":
+        df.to_parquet(index_file_path, write_index=False, overwrite=True)
+    else:
+        df.to_csv(index_file_path, index=False, single_file=True)
+    print(f"Tile index updated: {index_file_path}")
+
+    if generated and not args.no_db:
+        update_database(generated)
+        print(f"Updated preview paths for {len(generated)} tiles in MonkDB.")
+
+
+if __name__ == "__main__":
+    main()
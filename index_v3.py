@@ -1,11 +1,17 @@
 import os
 import configparser
 import rasterio
-from shapely.geometry import box
+import shapely
+from rasterio import features
+from rasterio.transform import Affine
+from shapely.geometry import box, shape
+from shapely.ops import unary_union
 from dask import delayed, compute
 import dask.dataframe as dd
 import pandas as pd
 import re
+import time
+import metrics
 
 # Load config
 config = configparser.ConfigParser()
@@ -15,18 +21,77 @@ tile_dir = config["sentinel"]["sentinel_data_dir_v2"].rstrip("/")
 output_filename = config["paths"]["output_csv_v3"]
 export_format = config["metadata"].get("export_format", "csv").lower()
 
+# Valid-data outline: the nodata mask is read at most this many pixels on
+# a side (from overviews when present) and vectorized
+OUTLINE_MAX_PIXELS = config.getint("metadata", "outline_max_pixels", fallback=512)
+# Simplification tolerances in CRS units (meters for UTM). The detailed
+# level uses at least one decimated pixel, below which it would only keep
+# the pixel staircase. The coarse level is buffered by its tolerance first
+# so it always contains the valid data and can be used as a conservative
+# filter.
+OUTLINE_DETAIL_TOLERANCE = config.getfloat("metadata", "outline_detail_tolerance", fallback=20.0)
+OUTLINE_COARSE_TOLERANCE = config.getfloat("metadata", "outline_coarse_tolerance", fallback=500.0)
+# Pixel value treated as nodata when the file declares none (Sentinel-2
+# uses 0)
+OUTLINE_NODATA = config.getint("metadata", "outline_nodata", fallback=0)
+
 # Set output path: tile_dir/tile_index/output_filename
 output_dir = os.path.join(tile_dir, "tile_index")
 os.makedirs(output_dir, exist_ok=True)
 output_file_path = os.path.join(output_dir, output_filename)
 
-
-@delayed
-def extract_tile_metadata(fname):
+files_total = metrics.counter("index_files_total", "Raster files seen by the indexer")
+file_seconds = metrics.histogram("index_file_seconds", "Time to read one raster header")
+bytes_total = metrics.counter("index_bytes_total", "Size of indexed raster files")
+outline_vertices = metrics.histogram("index_outline_vertices", "Vertices per stored outline level",
+                                     buckets=(5, 10, 25, 50, 100, 250, 500, 1000, 2500))
+
+
+def valid_outline(src, max_pixels=OUTLINE_MAX_PIXELS):
+    """
+    (polygon, pixel size) in the raster's CRS around the pixels that hold
+    data, or None if the whole raster is nodata.
+
+    The mask is read decimated to at most `max_pixels` per side, which
+    GDAL serves from the closest overview, so the cost doesn't depend on
+    the full resolution. Edges are accurate to one decimated pixel.
+    """
+    scale = max(src.width / max_pixels, src.height / max_pixels, 1.0)
+    height, width = max(1, round(src.height / scale)), max(1, round(src.width / scale))
+    if src.nodata is None and OUTLINE_NODATA is not None:
+        data = src.read(1, out_shape=(height, width))
+        mask = (data != OUTLINE_NODATA).astype("uint8")
+    else:
+        mask = (src.dataset_mask(out_shape=(height, width)) > 0).astype("uint8")
+    if not mask.any():
+        return None
+    transform = src.transform * Affine.scale(src.width / width, src.height / height)
+    polygons = [shape(geom) for geom, value in
+                features.shapes(mask, mask=mask.astype(bool), transform=transform) if value]
+    return unary_union(polygons), max(abs(transform.a), abs(transform.e))
+
+
+def outline_levels(outline, pixel_size=0.0):
+    """
+    (detailed, coarse) simplifications of a valid-data outline.
+    """
+    detail = outline.simplify(max(OUTLINE_DETAIL_TOLERANCE, pixel_size), preserve_topology=True)
+    coarse = outline.buffer(OUTLINE_COARSE_TOLERANCE, join_style=2).simplify(
+        OUTLINE_COARSE_TOLERANCE, preserve_topology=True).buffer(0)
+    for level, geom in (("detail", detail), ("coarse", coarse)):
+        outline_vertices.observe(len(shapely.get_coordinates(geom)), level=level)
+    return detail, coarse
+
+
+def tile_metadata(fname, directory=tile_dir):
+    """
+    Index record for one GeoTIFF in `directory`, or None if the filename
+    doesn't match the Sentinel-2 pattern or the file can't be opened.
+    """
     if not fname.endswith(".tif"):
         return None
 
-    path = os.path.join(tile_dir, fname)
+    path = os.path.join(directory, fname)
     tile_id = os.path.splitext(fname)[0]
 
     # Regex match filename pattern
@@ -34,16 +99,23 @@ def extract_tile_metadata(fname):
         r"(T[0-9]{2}[A-Z]{3})_(\d{8}T\d{6})_([A-Z0-9]+_\d+m)_R\d+m", tile_id)
     if not match:
         print(f"Skipping unrecognized filename format: {fname}")
+        files_total.inc(status="skipped")
         return None
 
     utm_tile, timestamp, band = match.groups()
     resolution = band.split("_")[-1]
 
+    start = time.perf_counter()
     try:
         with rasterio.open(path) as src:
             bounds = src.bounds
             polygon_wkt = box(bounds.left, bounds.bottom,
                               bounds.right, bounds.top).wkt
+            outline = valid_outline(src)
+        detail, coarse = outline_levels(*outline) if outline is not None else (None, None)
+        file_seconds.observe(time.perf_counter() - start)
+        files_total.inc(status="indexed")
+        bytes_total.inc(os.path.getsize(path))
 
         return {
             "tile_id": tile_id,
@@ -52,36 +124,55 @@ def extract_tile_metadata(fname):
             "layer": band,
             "resolution": resolution,
             "bbox": polygon_wkt,
+            "outline": detail.wkt if detail is not None else None,
+            "outline_coarse": coarse.wkt if coarse is not None else None,
             "path": os.path.abspath(path),
         }
 
     except Exception as e:
         print(f"Failed to read {fname}: {e}")
+        files_total.inc(status="failed")
         return None
 
 
+extract_tile_metadata = delayed(tile_metadata)
+
+
 def main():
+    try:
+        build_index()
+    finally:
+        metrics.export("index_v3")
+
+
+def build_index():
     print(f"Indexing raster tiles from: {tile_dir}")
 
-    tasks = [extract_tile_metadata(f) for f in os.listdir(
-        tile_dir) if f.endswith(".tif")]
-    results = compute(*tasks)
-    records = [r for r in results if r is not None]
+    with metrics.span("index.scan", tile_dir=tile_dir) as attrs:
+        start = time.perf_counter()
+        tasks = [extract_tile_metadata(f) for f in os.listdir(
+            tile_dir) if f.endswith(".tif")]
+        results = compute(*tasks)
+        records = [r for r in results if r is not None]
+        attrs["files"] = len(tasks)
+        metrics.gauge("index_files_per_second", "Indexing throughput of the last run").set(
+            len(tasks) / max(time.perf_counter() - start, 1e-9))
 
     if not records:
         print("No valid tiles found.")
         return
 
-    df = dd.from_pandas(pd.DataFrame(records), npartitions=1)
-
-    if export_format == "csv":
-        df.to_csv(output_file_path, index=False, single_file=True)
-        print(f"Tile index written to: {output_file_path}")
-    elif export_format == "parquet":
-        df.to_parquet(output_file_path, index=False)
-        print(f"Tile index written to: {output_file_path} (Parquet)")
-    else:
-        print(f"Unsupported export_format: {export_format}")
+    with metrics.span("index.write", format=export_format, records=len(records)):
+        df = dd.from_pandas(pd.DataFrame(records), npartitions=1)
+
+        if export_format == "csv":
+            df.to_csv(output_file_path, index=False, single_file=True)
+            print(f"Tile index written to: {output_file_path}")
+        elif export_format == "parquet":
+            df.to_parquet(output_file_path, index=False)
+            print(f"Tile index written to: {output_file_path} (Parquet)")
+        else:
+            print(f"Unsupported export_format: {export_format}")
 
 
 if __name__ == "__main__":
@@ -2,114 +2,292 @@ import csv
 import configparser
 import os
 import random
+import threading
+import time
 from shapely import wkt
 from shapely.geometry import Polygon
 from shapely.affinity import translate
 from shapely.ops import transform as shapely_transform
 from pyproj import Geod, Transformer
 from datetime import datetime, timedelta
-from monkdb import client
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from database import connect, last_request_bytes, DB_SCHEMA, RASTER_TABLE
+from tile_embeddings import EMBEDDING_DIMS
+import metrics
 
 # --- Config ---
 config = configparser.ConfigParser()
 config.read("config.ini", encoding="utf-8")
 
-DB_HOST = config['database']['DB_HOST']
-DB_PORT = config['database']['DB_PORT']
-DB_USER = config['database']['DB_USER']
-DB_PASSWORD = config['database']['DB_PASSWORD']
-DB_SCHEMA = config['database']['DB_SCHEMA']
-RASTER_TABLE = config['database']['RASTER_GEO_SHAPE_TABLE_V2']
+# Optional: one partition per acquisition month so time-window queries
+# only touch the months they ask for
+PARTITION_BY_MONTH = config.getboolean(
+    'database', 'PARTITION_BY_MONTH', fallback=False)
+# Batches written in parallel, each on its own pooled connection
+INSERT_WORKERS = config.getint('database', 'INSERT_WORKERS', fallback=4)
 
 tile_dir = config['sentinel']['sentinel_data_dir_v2']
 output_filename = config['paths']['output_csv_v3']
 output_dir = os.path.join(tile_dir, "tile_index")
 TILE_INDEX_CSV = os.path.join(output_dir, output_filename)
 
+TOTAL_MIN_ROWS = 100_000
+BATCH_SIZE = 500
+
 # --- Geo & DB Setup ---
 geod = Geod(ellps="WGS84")
 transformer = Transformer.from_crs("EPSG:32630", "EPSG:4326", always_xy=True)
 
-conn = client.connect(
-    f"http://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}",
-    username=DB_USER
-)
-cursor = conn.cursor()
-print("Connected to MonkDB.")
-
-# --- Drop and Recreate Table ---
-cursor.execute(f"DROP TABLE IF EXISTS {DB_SCHEMA}.{RASTER_TABLE}")
-cursor.execute(f"""
-CREATE TABLE IF NOT EXISTS {DB_SCHEMA}.{RASTER_TABLE} (
-    tile_id TEXT,
-    area GEO_SHAPE,
-    path TEXT,
-    layer TEXT,
-    resolution TEXT,
-    centroid GEO_POINT,
-    area_km DOUBLE,
-    geohash3 TEXT GENERATED ALWAYS AS substr(geohash(centroid), 1, 3)
-)
-CLUSTERED BY (layer) INTO 12 SHARDS
-WITH (number_of_replicas = 0);
-""")
-print(f"Created table {DB_SCHEMA}.{RASTER_TABLE}.")
+rows_total = metrics.counter("ingest_rows_total", "Rows sent to MonkDB")
+bytes_total = metrics.counter("ingest_bytes_sent_total", "Request body bytes sent to MonkDB")
+batch_bytes = metrics.histogram("ingest_batch_bytes", "Request body bytes per insert batch",
+                                buckets=metrics.BYTES_BUCKETS)
+batch_seconds = metrics.histogram("ingest_batch_seconds", "Time to insert one batch")
+rows_per_second = metrics.gauge("ingest_rows_per_second", "Rows inserted per second so far")
+
+# Rows written since the first batch started, for rows_per_second
+_progress = {"start": None, "rows": 0}
+_progress_lock = threading.Lock()
+
+
+# --- Table ---
+
+# Columns added after the first release of the table. create_table adds
+# any an existing table lacks, so older catalogs keep working.
+ADDED_COLUMNS = {
+    "outline_coarse": "GEO_SHAPE",
+    "outline": "GEO_SHAPE",
+    "thumbnail_path": "TEXT",
+    "overview_path": "TEXT",
+    "acquired_at": "TIMESTAMP WITH TIME ZONE",
+    "acquired_month": "TIMESTAMP WITH TIME ZONE GENERATED ALWAYS AS date_trunc('month', acquired_at)",
+    "embedding": f"FLOAT_VECTOR({EMBEDDING_DIMS})",
+}
+
+
+def create_table(cursor, drop=True):
+    """
+    (Re)create the raster footprint table. With drop=False an existing
+    table and its rows are kept, and columns it lacks are added.
+    """
+    partition_clause = "PARTITIONED BY (acquired_month)" if PARTITION_BY_MONTH else ""
+    if drop:
+        cursor.execute(f"DROP TABLE IF EXISTS {DB_SCHEMA}.{RASTER_TABLE}")
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {DB_SCHEMA}.{RASTER_TABLE} (
+        tile_id TEXT,
+        area GEO_SHAPE,
+        path TEXT,
+        layer TEXT,
+        resolution TEXT,
+        centroid GEO_POINT,
+        area_km DOUBLE,
+        geohash3 TEXT GENERATED ALWAYS AS substr(geohash(centroid), 1, 3),
+        {", ".join(f"{name} {definition}" for name, definition in ADDED_COLUMNS.items())}
+    )
+    CLUSTERED BY (layer) INTO 12 SHARDS
+    {partition_clause}
+    WITH (number_of_replicas = 0);
+    """)
+    print(f"Created table {DB_SCHEMA}.{RASTER_TABLE}"
+          f"{' (partitioned by acquisition month)' if PARTITION_BY_MONTH else ''}.")
+    if not drop:
+        add_missing_columns(cursor)
+
+
+def add_missing_columns(cursor):
+    """
+    ALTER an existing raster table to add any of ADDED_COLUMNS it lacks.
+    Rows already in the table get NULL in the new columns.
+    """
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = ? AND table_name = ?
+    """, (DB_SCHEMA, RASTER_TABLE))
+    existing = {row[0] for row in cursor.fetchall()}
+    for name, definition in ADDED_COLUMNS.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {DB_SCHEMA}.{RASTER_TABLE} ADD COLUMN {name} {definition}")
+            print(f"Added column {name} to {DB_SCHEMA}.{RASTER_TABLE}.")
 
 # --- Insert Function ---
 
 
 def insert_batch(batch):
-    cursor.executemany(
-        f"""INSERT INTO {DB_SCHEMA}.{RASTER_TABLE}
-            (tile_id, area, path, layer, resolution, centroid, area_km)
-            VALUES (?, ?, ?, ?, ?, ?, ?)""",
-        batch
-    )
+    start = time.perf_counter()
+    with connect() as batch_conn:
+        batch_cursor = batch_conn.cursor()
+        batch_cursor.executemany(
+            f"""INSERT INTO {DB_SCHEMA}.{RASTER_TABLE}
+                (tile_id, area, path, layer, resolution, centroid, area_km, acquired_at,
+                 thumbnail_path, overview_path, outline_coarse, outline)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            batch
+        )
+        batch_cursor.close()
+    # Size of the body the client actually sent, taken in database.py
+    size = last_request_bytes()
+    done = time.perf_counter()
+    batch_seconds.observe(done - start)
+    if size is not None:
+        batch_bytes.observe(size)
+        bytes_total.inc(size)
+    rows_total.inc(len(batch))
+    with _progress_lock:
+        if _progress["start"] is None:
+            _progress["start"] = start
+        _progress["rows"] += len(batch)
+        rows_per_second.set(_progress["rows"] / (done - _progress["start"]))
+
+
+class BatchWriter:
+    """
+    Writes batches on INSERT_WORKERS threads, keeping at most two batches
+    per worker in flight so producers can't run arbitrarily far ahead of
+    the database.
+    """
+
+    def __init__(self, workers=INSERT_WORKERS):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = set()
+
+    def submit(self, batch):
+        if len(self.pending) >= self.workers * 2:
+            done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+        future = self.executor.submit(insert_batch, list(batch))
+        self.pending.add(future)
+        return future
+
+    def close(self):
+        for future in self.pending:
+            future.result()
+        self.pending = set()
+        self.executor.shutdown()
 
 
 # --- Load Real Tiles ---
-real_tiles = []
-with open(TILE_INDEX_CSV, "r", encoding="utf-8") as f:
-    reader = csv.reader(f)
-    header = next(reader)
-    for row in reader:
-        if len(row) != 7:
-            continue
-        tile_id, utm_tile, timestamp, layer, resolution, bbox, path = row
-        try:
-            geom_utm = wkt.loads(bbox)
-            if geom_utm.is_valid:
-                real_tiles.append({
-                    "tile_id": tile_id,
-                    "timestamp": timestamp,
-                    "layer": layer,
-                    "resolution": resolution,
-                    "bbox": geom_utm,
-                    "path": path
-                })
-        except Exception:
-            continue
 
-if not real_tiles:
-    print("No valid tiles found. Aborting.")
-    exit()
 
-# --- Generate and Insert Records ---
-TOTAL_MIN_ROWS = 100_000
-batch = []
-inserted_count = 0
-skipped_count = 0
-BATCH_SIZE = 500
-synth_index = 0
+def _optional_geometry(value):
+    # Missing outlines are empty CSV cells, NaN from pandas or None
+    if isinstance(value, str) and value:
+        geom = wkt.loads(value)
+        return geom if geom.is_valid and not geom.is_empty else None
+    return value if getattr(value, "geom_type", None) else None
+
+
+def tile_record(row):
+    """
+    Tile dict from one tile index row (CSV dict or index_v3 record), or
+    None if its footprint is unusable.
+    """
+    bbox = row["bbox"]
+    geom_utm = wkt.loads(bbox) if isinstance(bbox, str) else bbox
+    if not geom_utm.is_valid:
+        return None
+    return {
+        "tile_id": row["tile_id"],
+        "timestamp": row["timestamp"],
+        "layer": row["layer"],
+        "resolution": row["resolution"],
+        "bbox": geom_utm,
+        "outline": _optional_geometry(row.get("outline")),
+        "outline_coarse": _optional_geometry(row.get("outline_coarse")),
+        "path": row["path"],
+        "thumbnail_path": row.get("thumbnail_path") or None,
+        "overview_path": row.get("overview_path") or None
+    }
+
+
+def load_real_tiles(path=TILE_INDEX_CSV):
+    real_tiles = []
+    with open(path, "r", encoding="utf-8") as f:
+        # Read by header: index_previews.py appends preview path columns
+        reader = csv.DictReader(f)
+        for row in reader:
+            try:
+                tile = tile_record(row)
+                if tile is not None:
+                    real_tiles.append(tile)
+            except Exception:
+                continue
+    return real_tiles
+
+# --- Generate Records ---
+
+
+def acquisition_time(timestamp):
+    # Filename timestamps (20250612T112131) are UTC sensing times
+    return datetime.strptime(timestamp, "%Y%m%dT%H%M%S")
+
+
+def outline_levels(base_tile, xoff=0.0, yoff=0.0):
+    """
+    WGS84 (coarse, detailed) valid-data outlines of a tile, shifted like
+    its footprint; None for a level the index doesn't have.
+    """
+    levels = []
+    for key in ("outline_coarse", "outline"):
+        geom = base_tile.get(key)
+        if geom is not None:
+            if xoff or yoff:
+                geom = translate(geom, xoff=xoff, yoff=yoff)
+            geom = shapely_transform(transformer.transform, geom)
+        levels.append(geom if geom is not None and geom.is_valid else None)
+    return tuple(levels)
+
+
+def coverage_km(geom_wgs84, outline):
+    # Real coverage: the valid-data outline when known, else the footprint
+    area_m2, _ = geod.geometry_area_perimeter(outline if outline is not None else geom_wgs84)
+    return round(abs(area_m2) / 1e6, 3)
+
+
+def _wkt(geom):
+    return geom.wkt if geom is not None else None
+
+
+def real_row(base_tile):
+    """
+    Insert tuple for the tile's own footprint, or None if it is invalid
+    after reprojection.
+    """
+    geom_wgs84 = shapely_transform(
+        transformer.transform, base_tile["bbox"])
+    if not geom_wgs84.is_valid:
+        return None
+
+    centroid_coords = list(geom_wgs84.centroid.coords)[0]
+    centroid = [round(centroid_coords[0], 6), round(centroid_coords[1], 6)]
+    outline_coarse, outline = outline_levels(base_tile)
+    area_km = coverage_km(geom_wgs84, outline)
+
+    return (
+        f"{base_tile['tile_id']}_real",
+        geom_wgs84.wkt,
+        base_tile["path"],
+        base_tile["layer"],
+        base_tile["resolution"],
+        centroid,
+        area_km,
+        acquisition_time(base_tile["timestamp"]).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        base_tile["thumbnail_path"],
+        base_tile["overview_path"],
+        _wkt(outline_coarse),
+        _wkt(outline)
+    )
 
 
 def generate_variants(base_tile, num_variants):
     variants = []
-    base_ts = datetime.strptime(base_tile["timestamp"], "%Y%m%dT%H%M%S")
+    base_ts = acquisition_time(base_tile["timestamp"])
     for i in range(num_variants):
         try:
             new_tile_id = f"{base_tile['tile_id']}_synth_{i+1}"
-            new_ts = (base_ts + timedelta(days=i)).strftime("%Y%m%dT%H%M%S")
+            new_ts = (base_ts + timedelta(days=i)).strftime("%Y-%m-%dT%H:%M:%SZ")
             offset_x = random.uniform(50, 500)
             offset_y = random.uniform(50, 500)
             shifted_geom = translate(
@@ -122,8 +300,8 @@ def generate_variants(base_tile, num_variants):
             centroid_coords = list(geom_wgs84.centroid.coords)[0]
             centroid = [round(centroid_coords[0], 6),
                         round(centroid_coords[1], 6)]
-            area_m2, _ = geod.geometry_area_perimeter(geom_wgs84)
-            area_km = round(abs(area_m2) / 1e6, 3)
+            outline_coarse, outline = outline_levels(base_tile, offset_x, offset_y)
+            area_km = coverage_km(geom_wgs84, outline)
 
             variants.append((
                 new_tile_id,
@@ -132,62 +310,81 @@ def generate_variants(base_tile, num_variants):
                 base_tile["layer"],
                 base_tile["resolution"],
                 centroid,
-                area_km
+                area_km,
+                new_ts,
+                base_tile["thumbnail_path"],
+                base_tile["overview_path"],
+                _wkt(outline_coarse),
+                _wkt(outline)
             ))
         except Exception:
             continue
     return variants
 
 
-print(f"Generating synthetic data to reach at least {TOTAL_MIN_ROWS} rows...")
+def main():
+    metrics.instrument_database()
 
-while inserted_count < TOTAL_MIN_ROWS:
-    for base_tile in real_tiles:
-        real_id = f"{base_tile['tile_id']}_real"
-        geom_wgs84 = shapely_transform(
-            transformer.transform, base_tile["bbox"])
-        if not geom_wgs84.is_valid:
-            continue
+    conn = connect()
+    cursor = conn.cursor()
+    print("Connected to MonkDB.")
+
+    # --- Drop and Recreate Table ---
+    create_table(cursor)
+
+    with metrics.span("ingest.load_index", path=TILE_INDEX_CSV):
+        real_tiles = load_real_tiles()
+
+    if not real_tiles:
+        print("No valid tiles found. Aborting.")
+        return
+
+    # --- Generate and Insert Records ---
+    batch = []
+    inserted_count = 0
+    skipped_count = 0
+    writer = BatchWriter()
+
+    print(f"Generating synthetic data to reach at least {TOTAL_MIN_ROWS} rows...")
+
+    with metrics.span("ingest.insert", batch_size=BATCH_SIZE, workers=INSERT_WORKERS):
+        while inserted_count < TOTAL_MIN_ROWS:
+            for base_tile in real_tiles:
+                row = real_row(base_tile)
+                if row is None:
+                    continue
+                batch.append(row)
 
-        centroid_coords = list(geom_wgs84.centroid.coords)[0]
-        centroid = [round(centroid_coords[0], 6), round(centroid_coords[1], 6)]
-        area_m2, _ = geod.geometry_area_perimeter(geom_wgs84)
-        area_km = round(abs(area_m2) / 1e6, 3)
-
-        batch.append((
-            real_id,
-            geom_wgs84.wkt,
-            base_tile["path"],
-            base_tile["layer"],
-            base_tile["resolution"],
-            centroid,
-            area_km
-        ))
-
-        # Create ~10 variants per real row (adjustable)
-        synth = generate_variants(base_tile, num_variants=10)
-        batch.extend(synth)
-
-        if len(batch) >= BATCH_SIZE:
-            insert_batch(batch)
+                # Create ~10 variants per real row (adjustable)
+                synth = generate_variants(base_tile, num_variants=10)
+                batch.extend(synth)
+
+                if len(batch) >= BATCH_SIZE:
+                    writer.submit(batch)
+                    inserted_count += len(batch)
+                    print(f"Inserted: {inserted_count}")
+                    batch.clear()
+
+        # Final insert
+        if batch:
+            writer.submit(batch)
             inserted_count += len(batch)
-            print(f"Inserted: {inserted_count}")
-            batch.clear()
-
-# Final insert
-if batch:
-    insert_batch(batch)
-    inserted_count += len(batch)
-
-# --- Summary ---
-cursor.execute(f"SELECT COUNT(*) FROM {DB_SCHEMA}.{RASTER_TABLE}")
-total_rows = cursor.fetchone()[0]
-
-print("\n📊 Summary:")
-print(f"✅ Total rows in table: {total_rows}")
-print(f"✅ Successful inserts: {inserted_count}")
-print(f"⚠️ Skipped or failed inserts: {skipped_count}")
-
-cursor.close()
-conn.close()
-print("🔌 Disconnected from MonkDB.")
+        writer.close()
+
+    # --- Summary ---
+    cursor.execute(f"SELECT COUNT(*) FROM {DB_SCHEMA}.{RASTER_TABLE}")
+    total_rows = cursor.fetchone()[0]
+
+    print("\n📊 Summary:")
+    print(f"✅ Total rows in table: {total_rows}")
+    print(f"✅ Successful inserts: {inserted_count}")
+    print(f"⚠️ Skipped or failed inserts: {skipped_count}")
+
+    cursor.close()
+    conn.close()
+    print("🔌 Disconnected from MonkDB.")
+    metrics.export("insert_v2")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+# === Cache settings (read from .env / environment) ===
+INSIGHT_CACHE_SIZE = int(os.getenv("INSIGHT_CACHE_SIZE", "256"))
+INSIGHT_CACHE_TTL = float(os.getenv("INSIGHT_CACHE_TTL", "600"))
+
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_TABLES = re.compile(r"\b(?:from|join)\s+((?:\"[^\"]+\"|\w+)(?:\.(?:\"[^\"]+\"|\w+))?)",
+                     re.IGNORECASE)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Canonical form of a statement for cache keys.
+
+    Whitespace is collapsed, keywords and identifiers outside quotes are
+    lower-cased and a trailing semicolon is dropped; quoted literals are
+    kept verbatim because their case matters.
+    """
+    parts = []
+    for i, part in enumerate(_QUOTED.split(sql.strip().rstrip(";"))):
+        if i % 2:
+            parts.append(part)
+        else:
+            parts.append(re.sub(r"\s+", " ", part).lower())
+    return "".join(parts).strip()
+
+
+def referenced_tables(sql: str) -> list[tuple[str, str]]:
+    """
+    (schema, table) pairs named after FROM / JOIN, with `doc` as the
+    default schema.
+    """
+    tables = set()
+    for name in _TABLES.findall(sql):
+        # Unquoted identifiers are case-insensitive (stored lower-case)
+        parts = [p.strip('"') if p.startswith('"') else p.lower()
+                 for p in name.split(".")]
+        schema, table = parts if len(parts) == 2 else ("doc", parts[0])
+        tables.add((schema, table))
+    return sorted(tables)
+
+
+def table_version(run_query, sql: str):
+    """
+    Version token for the tables a statement reads, or None if unknown.
+
+    Sums the primary shards' max sequence numbers from `sys.shards`, which
+    advance on every write, so any insert/update/delete invalidates cached
+    answers. One cheap metadata query instead of re-running the model.
+    """
+    tables = referenced_tables(sql)
+    if not tables:
+        return None
+    versions = []
+    for schema, table in tables:
+        escaped_schema = schema.replace("'", "''")
+        escaped_table = table.replace("'", "''")
+        try:
+            result = run_query(
+                f"""SELECT SUM(seq_no_stats['max_seq_no']) AS version, SUM(num_docs) AS docs
+                    FROM sys.shards
+                    WHERE "primary" = true
+                    AND schema_name = '{escaped_schema}'
+                    AND table_name = '{escaped_table}'""")
+        except Exception:
+            return None
+        if not isinstance(result, list) or not result:
+            return None
+        row = result[0]
+        versions.append((schema, table, row.get("version"), row.get("docs")))
+    return tuple(versions)
+
+
+class InsightCache:
+    """
+    Thread-safe LRU of finished replies with a per-entry time-to-live.
+
+    Keys are whatever the caller passes, typically (normalized SQL, table
+    version). Entries older than `ttl` seconds are treated as misses so
+    answers still expire when no table version is available.
+    """
+
+    def __init__(self, max_size: int = INSIGHT_CACHE_SIZE, ttl: float = INSIGHT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits,
+                    "misses": self.misses}
@@ -0,0 +1,353 @@
+import os
+import copy
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# === Backend settings (read from .env / environment) ===
+MODEL_ID = os.getenv("LLM_MODEL_ID", "TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+GGUF_PATH = os.getenv("LLM_GGUF_PATH", "")
+GGUF_REPO = os.getenv("LLM_GGUF_REPO", "TheBloke/TinyLlama-1.1B-Chat-v1.0-GGUF")
+GGUF_FILE = os.getenv("LLM_GGUF_FILE", "tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf")
+N_CTX = int(os.getenv("LLM_N_CTX", "2048"))
+N_THREADS = int(os.getenv("LLM_N_THREADS", str(os.cpu_count() or 4)))
+
+
+class TransformersBackend:
+    """
+    Hugging Face `transformers` text-generation pipeline (GPU or bf16 CPU).
+    """
+
+    name = "transformers"
+
+    def __init__(self, model_id: str = MODEL_ID):
+        import torch
+        from transformers import pipeline
+
+        start = time.perf_counter()
+        self.pipe = pipeline(
+            "text-generation",
+            model=model_id,
+            torch_dtype=torch.bfloat16,
+            device_map="auto",
+        )
+        self.tokenizer = self.pipe.tokenizer
+        self.load_seconds = time.perf_counter() - start
+        self._prefix_cache = {}
+
+    def prefix_state(self, messages: list[dict], input_ids):
+        """
+        KV cache for the leading system message, or None if it can't be used.
+
+        The system prompt is encoded once per distinct text and reused for
+        every request whose token ids start with it, so only the user turn
+        is prefilled. A copy is handed out because `generate` extends the
+        cache in place.
+        """
+        import torch
+
+        if not messages or messages[0]["role"] != "system":
+            return None
+        prefix = self.tokenizer.apply_chat_template(messages[:1], tokenize=False)
+        entry = self._prefix_cache.get(prefix)
+        if entry is None:
+            prefix_ids = self.tokenizer(prefix, return_tensors="pt")["input_ids"].to(
+                self.pipe.model.device)
+            with torch.no_grad():
+                output = self.pipe.model(prefix_ids, use_cache=True)
+            entry = (prefix_ids, output.past_key_values)
+            self._prefix_cache[prefix] = entry
+            logger.info("Cached system prompt prefix (%d tokens)", prefix_ids.shape[1])
+        prefix_ids, past = entry
+        length = prefix_ids.shape[1]
+        if input_ids.shape[1] <= length or not torch.equal(input_ids[0, :length], prefix_ids[0]):
+            return None
+        return copy.deepcopy(past)
+
+    def build_prompt(self, messages: list[dict]) -> str:
+        return self.tokenizer.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=True)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def stream(self, messages: list[dict], max_new_tokens: int = 512,
+               temperature: float = 0.7, top_p: float = 0.95, stats: dict = None):
+        """
+        Yield decoded text chunks as the model produces them.
+
+        Generation runs on a worker thread feeding a TextIteratorStreamer,
+        starting from the cached system prompt state when it applies.
+        Template and tokenizer seconds and token counts go into `stats`.
+        """
+        import torch
+        from transformers import TextIteratorStreamer
+
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        prompt = self.build_prompt(messages)
+        templated = time.perf_counter()
+        input_ids = self.tokenizer(prompt, return_tensors="pt")[
+            "input_ids"].to(self.pipe.model.device)
+        stats.update(chat_template=templated - start,
+                     tokenize=time.perf_counter() - templated,
+                     prompt_tokens=input_ids.shape[1])
+        streamer = TextIteratorStreamer(
+            self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        kwargs = dict(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=self.prefix_state(messages, input_ids),
+            max_new_tokens=max_new_tokens,
+            do_sample=True,
+            temperature=temperature,
+            top_p=top_p,
+            eos_token_id=self.tokenizer.eos_token_id,
+            streamer=streamer,
+        )
+        errors = []
+
+        def run():
+            # A failed generate never ends the streamer itself; end it here
+            # so the consumer doesn't block, then re-raise on its side
+            try:
+                output = self.pipe.model.generate(**kwargs)
+                stats["generated_tokens"] = output.shape[1] - input_ids.shape[1]
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        yield from streamer
+        worker.join()
+        if errors:
+            raise errors[0]
+
+    def generate(self, messages: list[dict], **kwargs) -> str:
+        return "".join(self.stream(messages, **kwargs)).strip()
+
+    def stream_batch(self, batch: list[list[dict]], max_new_tokens: int = 512,
+                     temperature: float = 0.7, top_p: float = 0.95,
+                     stats: list[dict] = None):
+        """
+        Generate for several conversations in one padded `generate` call.
+
+        Yields (index, text chunk) pairs as tokens are produced for each
+        row of the batch. A batch of one goes through `stream` so it can
+        reuse the cached system prompt state; left padding would shift the
+        prefix for larger batches. `stats` holds one dict per row for the
+        same figures `stream` records; rows share the batch's template and
+        tokenizer time.
+        """
+        stats = stats or [{} for _ in batch]
+        if len(batch) == 1:
+            for chunk in self.stream(batch[0], max_new_tokens=max_new_tokens,
+                                     temperature=temperature, top_p=top_p,
+                                     stats=stats[0]):
+                yield 0, chunk
+            return
+        tokenizer = self.tokenizer
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+        start = time.perf_counter()
+        prompts = [self.build_prompt(m) for m in batch]
+        templated = time.perf_counter()
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(
+            self.pipe.model.device)
+        tokenized = time.perf_counter()
+        for row, prompt_tokens in zip(stats, inputs["attention_mask"].sum(dim=1).tolist()):
+            row.update(chat_template=templated - start, tokenize=tokenized - templated,
+                       prompt_tokens=prompt_tokens)
+        streamer = _BatchStreamer(tokenizer, len(batch))
+        kwargs = dict(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            do_sample=True,
+            temperature=temperature,
+            top_p=top_p,
+            eos_token_id=tokenizer.eos_token_id,
+            pad_token_id=tokenizer.pad_token_id,
+            streamer=streamer,
+        )
+        worker = threading.Thread(target=streamer.run, args=(self.pipe.model.generate, kwargs),
+                                  daemon=True)
+        worker.start()
+        yield from streamer
+        worker.join()
+        for row, tokens in zip(stats, streamer.tokens):
+            row["generated_tokens"] = len(tokens)
+
+
+class _BatchStreamer:
+    """
+    Streamer for batched `generate`: splits each step's tokens by row.
+
+    `transformers` calls put() first with the prompt ids, then once per
+    decoding step with one new token per row. Text is re-decoded per row
+    so multi-token characters are only emitted once complete.
+    """
+
+    def __init__(self, tokenizer, batch_size: int):
+        import queue
+
+        self.tokenizer = tokenizer
+        self.tokens = [[] for _ in range(batch_size)]
+        self.sent = [""] * batch_size
+        self.finished = [False] * batch_size
+        self.prompt_seen = False
+        self.error = None
+        self.queue = queue.Queue()
+
+    def put(self, value):
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            return
+        rows = value.reshape(len(self.tokens), -1).tolist()
+        for i, row in enumerate(rows):
+            if self.finished[i]:
+                continue
+            for token in row:
+                if token == self.tokenizer.eos_token_id:
+                    self.finished[i] = True
+                    break
+                self.tokens[i].append(token)
+            text = self.tokenizer.decode(self.tokens[i], skip_special_tokens=True)
+            if len(text) > len(self.sent[i]) and not text.endswith("\ufffd"):
+                self.queue.put((i, text[len(self.sent[i]):]))
+                self.sent[i] = text
+
+    def end(self):
+        self.queue.put(None)
+
+    def run(self, generate, kwargs):
+        try:
+            generate(**kwargs)
+        except Exception as e:
+            self.error = e
+            self.end()
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield item
+
+
+class LlamaCppBackend:
+    """
+    Quantized GGUF model on `llama-cpp-python`, the fast path on CPU hosts.
+
+    Uses LLM_GGUF_PATH when set, otherwise downloads LLM_GGUF_FILE from
+    LLM_GGUF_REPO on the Hugging Face Hub (Q4_K_M TinyLlama by default).
+    """
+
+    name = "llamacpp"
+
+    def __init__(self, model_path: str = GGUF_PATH):
+        from llama_cpp import Llama
+
+        start = time.perf_counter()
+        options = dict(n_ctx=N_CTX, n_threads=N_THREADS, verbose=False)
+        if model_path:
+            self.llm = Llama(model_path=model_path, **options)
+        else:
+            self.llm = Llama.from_pretrained(
+                repo_id=GGUF_REPO, filename=GGUF_FILE, **options)
+        self.load_seconds = time.perf_counter() - start
+        self._prefix_states = {}
+
+    def restore_prefix(self, messages: list[dict]):
+        """
+        Load the saved llama.cpp state for the leading system message.
+
+        The state is evaluated and saved once per distinct system prompt.
+        After loading it, llama-cpp-python matches the new prompt against
+        the tokens already in the context and only evaluates the rest.
+        """
+        if not messages or messages[0]["role"] != "system":
+            return
+        prefix = self.build_prompt(messages[:1]).rsplit("<|assistant|>", 1)[0]
+        state = self._prefix_states.get(prefix)
+        if state is None:
+            tokens = self.llm.tokenize(prefix.encode("utf-8"), add_bos=True)
+            self.llm.reset()
+            self.llm.eval(tokens)
+            state = self.llm.save_state()
+            self._prefix_states[prefix] = state
+            logger.info("Cached system prompt prefix (%d tokens)", len(tokens))
+        self.llm.load_state(state)
+
+    def build_prompt(self, messages: list[dict]) -> str:
+        # Zephyr-style template used by TinyLlama-Chat
+        parts = [f"<|{m['role']}|>\n{m['content']}</s>" for m in messages]
+        return "\n".join(parts) + "\n<|assistant|>\n"
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def stream(self, messages: list[dict], max_new_tokens: int = 512,
+               temperature: float = 0.7, top_p: float = 0.95, stats: dict = None):
+        """
+        Yield text chunks from llama.cpp's native token streaming.
+
+        The prompt is tokenized here (as llama.cpp would) so template and
+        tokenizer seconds and token counts can go into `stats`; llama.cpp
+        streams one chunk per generated token.
+        """
+        stats = {} if stats is None else stats
+        self.restore_prefix(messages)
+        start = time.perf_counter()
+        prompt = self.build_prompt(messages)
+        templated = time.perf_counter()
+        tokens = self.llm.tokenize(prompt.encode("utf-8"), add_bos=True, special=True)
+        stats.update(chat_template=templated - start,
+                     tokenize=time.perf_counter() - templated,
+                     prompt_tokens=len(tokens), generated_tokens=0)
+        for chunk in self.llm(
+            tokens,
+            max_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            stop=["</s>"],
+            stream=True,
+        ):
+            stats["generated_tokens"] += 1
+            yield chunk["choices"][0]["text"]
+
+    def generate(self, messages: list[dict], **kwargs) -> str:
+        return "".join(self.stream(messages, **kwargs)).strip()
+
+    def stream_batch(self, batch: list[list[dict]], stats: list[dict] = None, **kwargs):
+        """
+        llama-cpp-python decodes one sequence at a time, so a batch is
+        served back to back; it still saves the per-request queueing.
+        """
+        stats = stats or [{} for _ in batch]
+        for i, messages in enumerate(batch):
+            for chunk in self.stream(messages, stats=stats[i], **kwargs):
+                yield i, chunk
+
+
+BACKENDS = {
+    TransformersBackend.name: TransformersBackend,
+    LlamaCppBackend.name: LlamaCppBackend,
+}
+
+
+def load_backend(name: str):
+    """
+    Instantiate a backend by name ("transformers" or "llamacpp").
+    """
+    try:
+        backend_cls = BACKENDS[name.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unknown LLM backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    return backend_cls()
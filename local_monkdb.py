@@ -0,0 +1,817 @@
+import re
+import json
+import math
+import time
+import random
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from shapely import wkt
+from shapely.geometry import Point, shape, mapping
+from shapely.prepared import prep
+
+# Column type ids reported in `col_types` (same numbering as MonkDB)
+TYPE_IDS = {"null": 0, "boolean": 3, "text": 4, "double": 6, "bigint": 10,
+            "timestamp": 11, "object": 12, "geo_point": 13, "geo_shape": 14}
+
+EARTH_RADIUS_M = 6371008.7714
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_TABLE_REF = re.compile(
+    r"\b(FROM|JOIN|INTO|UPDATE|TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?)\s+"
+    r"((?:\"[^\"]+\"|\w+)(?:\.(?:\"[^\"]+\"|\w+))?)", re.IGNORECASE)
+_ARRAY = re.compile(r"\[\s*(-?[\d.]+(?:\s*,\s*-?[\d.]+)*)\s*\]")
+_CAST = re.compile(r"(\?|\b\w+)::(TIMESTAMP\s+WITH\s+TIME\s+ZONE|TIMESTAMP|TEXT|DOUBLE|BIGINT|INTEGER)",
+                   re.IGNORECASE)
+_SPATIAL = re.compile(
+    r"\b(intersects|within)\(\s*(\"?\w+\"?)\s*,\s*('(?:[^']|'')*'|\?)\s*\)", re.IGNORECASE)
+_KNN = re.compile(
+    r"\bknn_match\(\s*(\"?\w+\"?)\s*,\s*('(?:[^']|'')*'|\?|\[[^\]]*\])\s*,\s*(\d+)\s*\)",
+    re.IGNORECASE)
+_NOOP = re.compile(r"^\s*(REFRESH|OPTIMIZE|SET|ANALYZE)\b", re.IGNORECASE)
+
+
+class SQLError(Exception):
+    pass
+
+
+# === Geo helpers (registered as SQL functions) ===
+
+
+@lru_cache(maxsize=4096)
+def _geometry(value):
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith("["):
+            lon, lat = json.loads(text)
+            return Point(lon, lat)
+        if text.startswith("{"):
+            return shape(json.loads(text))
+        return wkt.loads(text)
+    raise SQLError(f"Cannot use {value!r} as a geometry")
+
+
+@lru_cache(maxsize=256)
+def _prepared(value):
+    return prep(_geometry(value))
+
+
+def _point(value):
+    geom = _geometry(value)
+    return geom.x, geom.y
+
+
+def sql_intersects(a, b):
+    if a is None or b is None:
+        return None
+    return int(_prepared(b).intersects(_geometry(a)))
+
+
+def sql_within(a, b):
+    if a is None or b is None:
+        return None
+    return int(_prepared(b).contains(_geometry(a)))
+
+
+def sql_distance(a, b):
+    # Haversine on a sphere, in meters
+    if a is None or b is None:
+        return None
+    lon1, lat1 = map(math.radians, _point(a))
+    lon2, lat2 = map(math.radians, _point(b))
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+
+def sql_geohash(value, precision=12):
+    if value is None:
+        return None
+    lon, lat = _point(value)
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    code, bits, bit_count, even = [], 0, 0, True
+    while len(code) < precision:
+        target, span = (lon, lon_range) if even else (lat, lat_range)
+        mid = (span[0] + span[1]) / 2
+        bits <<= 1
+        if target >= mid:
+            bits |= 1
+            span[0] = mid
+        else:
+            span[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            code.append(_GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(code)
+
+
+def sql_latitude(value):
+    return None if value is None else _point(value)[1]
+
+
+def sql_longitude(value):
+    return None if value is None else _point(value)[0]
+
+
+# === Vectors: FLOAT_VECTOR values are stored as JSON arrays ===
+
+
+@lru_cache(maxsize=64)
+def _vector(text):
+    return json.loads(text)
+
+
+def sql_knn_distance(stored, query):
+    # Squared Euclidean distance, as MonkDB uses for FLOAT_VECTOR
+    if stored is None or query is None:
+        return None
+    return sum((a - b) ** 2 for a, b in zip(json.loads(stored), _vector(query)))
+
+
+def sql_knn_score(stored, query):
+    distance = sql_knn_distance(stored, query)
+    return None if distance is None else 1.0 / (1.0 + distance)
+
+
+# === Timestamps: stored as ISO-8601 UTC text, returned as epoch millis ===
+
+
+def to_timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        moment = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    elif isinstance(value, (int, float)):
+        moment = datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+    else:
+        text = str(value).strip().replace(" ", "T")
+        if text.endswith("Z"):
+            text = text[:-1] + "+00:00"
+        moment = datetime.fromisoformat(text)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def epoch_millis(text):
+    if text is None:
+        return None
+    moment = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    return int(moment.timestamp() * 1000)
+
+
+def sql_date_trunc(unit, value):
+    text = to_timestamp(value)
+    if text is None:
+        return None
+    moment = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    unit = unit.lower()
+    fields = {"year": dict(month=1, day=1, hour=0, minute=0, second=0, microsecond=0),
+              "month": dict(day=1, hour=0, minute=0, second=0, microsecond=0),
+              "day": dict(hour=0, minute=0, second=0, microsecond=0),
+              "hour": dict(minute=0, second=0, microsecond=0)}
+    if unit not in fields:
+        raise SQLError(f"Unsupported date_trunc unit: {unit}")
+    return to_timestamp(moment.replace(**fields[unit]))
+
+
+# === Aggregates ===
+
+
+class _Distinct:
+    # Exact count standing in for hyperloglog_distinct
+    def __init__(self):
+        self.values = set()
+
+    def step(self, value):
+        if value is not None:
+            self.values.add(value)
+
+    def finalize(self):
+        return len(self.values)
+
+
+class _StdDev:
+    # Population standard deviation, like MonkDB's stddev
+    def __init__(self):
+        self.values = []
+
+    def step(self, value):
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        if not self.values:
+            return None
+        mean = sum(self.values) / len(self.values)
+        return math.sqrt(sum((v - mean) ** 2 for v in self.values) / len(self.values))
+
+
+class _Percentile:
+    def __init__(self):
+        self.values = []
+        self.fraction = None
+
+    def step(self, value, fraction):
+        self.fraction = fraction
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        if not self.values:
+            return None
+        values = sorted(self.values)
+        position = (len(values) - 1) * self.fraction
+        low, high = math.floor(position), math.ceil(position)
+        return values[low] + (values[high] - values[low]) * (position - low)
+
+
+# === Throttling ===
+
+
+class TokenBucket:
+    """
+    Blocks callers so that at most `rate` units per second pass on average.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.available = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.available = min(self.rate, self.available + (now - self.updated) * self.rate)
+            self.updated = now
+            self.available -= amount
+            wait = -self.available / self.rate if self.available < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+# === Engine ===
+
+
+def _type_name(declared: str) -> str:
+    declared = declared.upper()
+    if declared.startswith("GEO_SHAPE"):
+        return "geo_shape"
+    if declared.startswith("GEO_POINT"):
+        return "geo_point"
+    if declared.startswith("TIMESTAMP"):
+        return "timestamp"
+    if declared.startswith(("DOUBLE", "REAL", "FLOAT ", "FLOAT")) and "VECTOR" not in declared:
+        return "double"
+    if declared.startswith(("INT", "BIGINT", "LONG", "SMALLINT", "SHORT", "BYTE")):
+        return "bigint"
+    if declared.startswith("BOOLEAN"):
+        return "boolean"
+    if declared.startswith(("OBJECT", "ARRAY", "FLOAT_VECTOR")):
+        return "object"
+    return "text"
+
+
+_SQLITE_TYPES = {"double": "REAL", "bigint": "INTEGER", "boolean": "INTEGER"}
+
+
+def _split_top_level(text: str) -> list[str]:
+    parts, depth, current, quoted = [], 0, [], False
+    for char in text:
+        if char == "'":
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        if char == "," and depth == 0 and not quoted:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    if "".join(current).strip():
+        parts.append("".join(current).strip())
+    return parts
+
+
+def _unquote(name: str) -> str:
+    return name[1:-1] if name.startswith('"') else name.lower()
+
+
+class Engine:
+    """
+    SQLite-backed executor for the MonkDB SQL subset this repo uses.
+
+    Tables live in one SQLite database as `"schema.table"`, with a hidden
+    integer key that also backs the `_id` system column. GEO_SHAPE values
+    are stored as WKT and GEO_POINT values as `[lon, lat]` JSON; each geo
+    column has an R*Tree of bounding boxes, and `intersects` / `within`
+    against a literal or parameter are rewritten into an R*Tree prefilter
+    followed by the exact shapely predicate. One lock serializes access,
+    like a single-node cluster.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        self.db.execute("PRAGMA case_sensitive_like = ON")
+        self.db.execute("PRAGMA journal_mode = WAL" if path != ":memory:" else "PRAGMA journal_mode = MEMORY")
+        for name, arity, func in (
+                ("intersects", 2, sql_intersects), ("within", 2, sql_within),
+                ("distance", 2, sql_distance), ("geohash", 1, sql_geohash),
+                ("latitude", 1, sql_latitude), ("longitude", 1, sql_longitude),
+                ("date_trunc", 2, sql_date_trunc), ("_to_timestamp", 1, to_timestamp),
+                ("_knn_distance", 2, sql_knn_distance), ("_knn_score", 2, sql_knn_score)):
+            self.db.create_function(name, arity, func, deterministic=True)
+        self.db.create_aggregate("hyperloglog_distinct", 1, _Distinct)
+        self.db.create_aggregate("stddev", 1, _StdDev)
+        self.db.create_aggregate("percentile", 2, _Percentile)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS _catalog (
+            table_key TEXT, position INTEGER, column_name TEXT, column_type TEXT)""")
+        # Enough of information_schema.columns to check for a column
+        self.db.execute("""CREATE VIEW IF NOT EXISTS "information_schema.columns" AS
+            SELECT substr(table_key, 1, instr(table_key, '.') - 1) AS table_schema,
+                   substr(table_key, instr(table_key, '.') + 1) AS table_name,
+                   column_name, position + 1 AS ordinal_position, column_type AS data_type
+            FROM _catalog""")
+        self.tables = {}
+        for key, column, kind in self.db.execute(
+                "SELECT table_key, column_name, column_type FROM _catalog ORDER BY table_key, position"):
+            self.tables.setdefault(key, {"columns": {}})["columns"][column] = kind
+        for key, table in self.tables.items():
+            table["next_id"] = self.db.execute(
+                f'SELECT COALESCE(MAX(_rowid), 0) + 1 FROM "{key}"').fetchone()[0]
+
+    # --- Statement rewriting ---
+
+    def _table_key(self, name: str) -> str:
+        parts = [_unquote(p) for p in re.findall(r'"[^"]+"|\w+', name)]
+        return ".".join(parts) if len(parts) == 2 else f"doc.{parts[0]}"
+
+    def _rewrite_segment(self, segment: str) -> str:
+        segment = _ARRAY.sub(lambda m: "'[" + m.group(1) + "]'", segment)
+
+        def cast(match):
+            target = match.group(2).upper()
+            if target.startswith("TIMESTAMP"):
+                return f"_to_timestamp({match.group(1)})"
+            sqlite_type = {"TEXT": "TEXT", "DOUBLE": "REAL"}.get(target, "INTEGER")
+            return f"CAST({match.group(1)} AS {sqlite_type})"
+
+        segment = _CAST.sub(cast, segment)
+
+        def table(match):
+            name = match.group(2)
+            # Already rewritten (e.g. the R*Tree prefilter's own table)
+            if re.fullmatch(r'"[^"]*[.#][^"]*"', name):
+                return match.group(0)
+            return f'{match.group(1)} "{self._table_key(name)}"'
+
+        return _TABLE_REF.sub(table, segment)
+
+    def _rewrite(self, sql: str, params) -> str:
+        sql = self._spatial_prefilter(sql, params)
+        parts = _LITERAL.split(sql)
+        return "".join(p if i % 2 else self._rewrite_segment(p) for i, p in enumerate(parts))
+
+    def _knn_match(self, sql: str, params):
+        """
+        Rewrite `knn_match(col, vector, k)` into an exact top-k subquery and
+        `_score` into 1 / (1 + squared distance). The query vector is inlined
+        as a literal, so its placeholder is dropped from `params`.
+        """
+        match = _KNN.search(sql)
+        if not match:
+            return sql, params
+        table = next((m.group(2) for m in _TABLE_REF.finditer(sql)
+                      if m.group(1).upper() == "FROM"), None)
+        if table is None:
+            raise SQLError("knn_match needs a FROM clause")
+        column, argument, k = match.group(1), match.group(2), int(match.group(3))
+        params = list(params or [])
+        if argument == "?":
+            before = "".join(p for i, p in enumerate(_LITERAL.split(sql[:match.start()]))
+                             if i % 2 == 0)
+            if before.count("?") >= len(params):
+                raise SQLError("knn_match vector parameter is missing")
+            vector = params.pop(before.count("?"))
+        elif argument.startswith("'"):
+            vector = json.loads(argument[1:-1].replace("''", "'"))
+        else:
+            vector = json.loads(argument)
+        literal = "'" + json.dumps([float(v) for v in vector]) + "'"
+        sql = (sql[:match.start()]
+               + f"_rowid IN (SELECT _rowid FROM {table} WHERE {column} IS NOT NULL "
+                 f"ORDER BY _knn_distance({column}, {literal}) LIMIT {k})"
+               + sql[match.end():])
+        parts = _LITERAL.split(sql)
+        sql = "".join(p if i % 2 else re.sub(r"\b_score\b", f"_knn_score({column}, {literal})", p)
+                      for i, p in enumerate(parts))
+        return sql, params
+
+    def _spatial_prefilter(self, sql: str, params) -> str:
+        tables = {self._table_key(m.group(2)) for m in _TABLE_REF.finditer(sql)
+                  if m.group(1).upper() == "FROM"}
+        if len(tables) != 1 or re.search(r"\bJOIN\b", sql, re.IGNORECASE):
+            return sql
+        key = tables.pop()
+        columns = self.tables.get(key, {}).get("columns", {})
+
+        def replace(match):
+            column = _unquote(match.group(2))
+            if columns.get(column) not in ("geo_shape", "geo_point"):
+                return match.group(0)
+            argument = match.group(3)
+            if argument == "?":
+                # Position of this placeholder among those outside literals
+                before = "".join(p for i, p in enumerate(_LITERAL.split(sql[:match.start()]))
+                                 if i % 2 == 0)
+                index = before.count("?")
+                if params is None or index >= len(params):
+                    return match.group(0)
+                value = params[index]
+            else:
+                value = argument[1:-1].replace("''", "'")
+            try:
+                minx, miny, maxx, maxy = _geometry(_shape_text(value)).bounds
+            except Exception:
+                return match.group(0)
+            return (f"({match.group(0)} AND _rowid IN (SELECT id FROM \"{key}#{column}\" "
+                    f"WHERE max_x >= {minx!r} AND min_x <= {maxx!r} "
+                    f"AND max_y >= {miny!r} AND min_y <= {maxy!r}))")
+
+        return _SPATIAL.sub(replace, sql)
+
+    # --- DDL ---
+
+    def _create_table(self, sql: str):
+        match = re.match(r"\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?([\w.\"]+)\s*\(",
+                         sql, re.IGNORECASE)
+        if not match:
+            raise SQLError("Unsupported CREATE TABLE statement")
+        key = self._table_key(match.group(2))
+        if key in self.tables:
+            if match.group(1):
+                return
+            raise SQLError(f"RelationAlreadyExists[Relation '{key}' already exists.]")
+        depth, end = 0, None
+        for i in range(match.end() - 1, len(sql)):
+            depth += {"(": 1, ")": -1}.get(sql[i], 0)
+            if depth == 0:
+                end = i
+                break
+        columns, definitions = {}, ["_rowid INTEGER PRIMARY KEY", "_id TEXT"]
+        for part in _split_top_level(sql[match.end():end]):
+            if re.match(r"(PRIMARY\s+KEY|INDEX|CONSTRAINT|CHECK)\b", part, re.IGNORECASE):
+                continue
+            name, kind, definition = self._column_definition(part, "STORED")
+            columns[name] = kind
+            definitions.append(definition)
+        self.db.execute(f'CREATE TABLE "{key}" ({", ".join(definitions)})')
+        self.db.execute(f'CREATE INDEX "{key}#_id" ON "{key}" (_id)')
+        for name, kind in columns.items():
+            if kind in ("geo_shape", "geo_point"):
+                self.db.execute(f'CREATE VIRTUAL TABLE "{key}#{name}" '
+                                f'USING rtree(id, min_x, max_x, min_y, max_y)')
+        self.db.executemany("INSERT INTO _catalog VALUES (?, ?, ?, ?)",
+                            [(key, i, n, k) for i, (n, k) in enumerate(columns.items())])
+        self.tables[key] = {"columns": columns, "next_id": 1}
+
+    def _column_definition(self, part: str, generated_storage: str):
+        col = re.match(r"(\"[^\"]+\"|\w+)\s+(.*?)(?:\s+GENERATED\s+ALWAYS\s+AS\s+(.*))?$",
+                       part.strip(), re.IGNORECASE | re.DOTALL)
+        if not col:
+            raise SQLError(f"Unsupported column definition: {part.strip()}")
+        name, declared, generated = _unquote(col.group(1)), col.group(2), col.group(3)
+        declared = re.sub(r"\s+(PRIMARY\s+KEY|NOT\s+NULL)\b.*$", "", declared,
+                          flags=re.IGNORECASE)
+        kind = _type_name(declared)
+        definition = f'"{name}" {_SQLITE_TYPES.get(kind, "TEXT")}'
+        if generated:
+            definition += (f" GENERATED ALWAYS AS ({self._rewrite(generated, None)}) "
+                           f"{generated_storage}")
+        return name, kind, definition
+
+    def _alter_table(self, sql: str):
+        match = re.match(r"\s*ALTER\s+TABLE\s+([\w.\"]+)\s+ADD\s+(?:COLUMN\s+)?(.*?);?\s*$",
+                         sql, re.IGNORECASE | re.DOTALL)
+        if not match:
+            raise SQLError("Only ALTER TABLE t ADD COLUMN is supported")
+        key = self._table_key(match.group(1))
+        if key not in self.tables:
+            raise SQLError(f"RelationUnknown[Relation '{key}' unknown]")
+        columns = self.tables[key]["columns"]
+        # SQLite can only add generated columns as VIRTUAL
+        name, kind, definition = self._column_definition(match.group(2), "VIRTUAL")
+        if name in columns:
+            raise SQLError(f"ColumnAlreadyExistsException[Column '{name}' already exists]")
+        self.db.execute(f'ALTER TABLE "{key}" ADD COLUMN {definition}')
+        if kind in ("geo_shape", "geo_point"):
+            self.db.execute(f'CREATE VIRTUAL TABLE "{key}#{name}" '
+                            f'USING rtree(id, min_x, max_x, min_y, max_y)')
+        self.db.execute("INSERT INTO _catalog VALUES (?, ?, ?, ?)",
+                        (key, len(columns), name, kind))
+        columns[name] = kind
+
+    def _drop_table(self, sql: str):
+        match = re.match(r"\s*DROP\s+TABLE\s+(IF\s+EXISTS\s+)?([\w.\"]+)", sql, re.IGNORECASE)
+        if not match:
+            raise SQLError("Unsupported DROP statement")
+        key = self._table_key(match.group(2))
+        if key not in self.tables:
+            if match.group(1):
+                return
+            raise SQLError(f"RelationUnknown[Relation '{key}' unknown]")
+        for name, kind in self.tables.pop(key)["columns"].items():
+            if kind in ("geo_shape", "geo_point"):
+                self.db.execute(f'DROP TABLE IF EXISTS "{key}#{name}"')
+        self.db.execute(f'DROP TABLE "{key}"')
+        self.db.execute("DELETE FROM _catalog WHERE table_key = ?", (key,))
+
+    # --- DML ---
+
+    def _insert(self, sql: str, rows: list) -> list[int]:
+        match = re.match(r"\s*INSERT\s+INTO\s+([\w.\"]+)\s*\(([^)]*)\)\s*VALUES\s*\(([^)]*)\)\s*;?\s*$",
+                         sql, re.IGNORECASE | re.DOTALL)
+        if not match:
+            raise SQLError("Only INSERT INTO t (cols) VALUES (?, ...) is supported")
+        key = self._table_key(match.group(1))
+        if key not in self.tables:
+            raise SQLError(f"RelationUnknown[Relation '{key}' unknown]")
+        table = self.tables[key]
+        names = [_unquote(c.strip()) for c in match.group(2).split(",")]
+        kinds = [table["columns"].get(n, "text") for n in names]
+        column_list = ", ".join(f'"{n}"' for n in names)
+        statement = (f'INSERT INTO "{key}" (_rowid, _id, {column_list}) '
+                     f'VALUES ({", ".join("?" * (len(names) + 2))})')
+        counts = []
+        self.db.execute("BEGIN")
+        try:
+            for row in rows:
+                values = [_store(value, kind) for value, kind in zip(row, kinds)]
+                row_id = table["next_id"]
+                self.db.execute(statement, [row_id, f"{row_id:016d}", *values])
+                table["next_id"] += 1
+                for name, kind, value in zip(names, kinds, values):
+                    if kind in ("geo_shape", "geo_point") and value is not None:
+                        minx, miny, maxx, maxy = _geometry(value).bounds
+                        self.db.execute(f'INSERT INTO "{key}#{name}" VALUES (?, ?, ?, ?, ?)',
+                                        (row_id, minx, maxx, miny, maxy))
+                counts.append(1)
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        return counts
+
+    # --- Entry point ---
+
+    def execute(self, sql: str, args=None, bulk_args=None) -> dict:
+        """
+        Run one request body and return the response payload
+        (`cols`/`rows`/`rowcount`, or `results` for bulk requests).
+        """
+        with self.lock:
+            try:
+                return self._execute(sql, args, bulk_args)
+            except SQLError:
+                raise
+            except (sqlite3.Error, ValueError, TypeError) as e:
+                raise SQLError(str(e)) from e
+
+    def _execute(self, sql, args, bulk_args):
+        verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+        if _NOOP.match(sql):
+            return {"cols": [], "rows": [], "rowcount": 0}
+        if verb == "CREATE":
+            self._create_table(sql)
+            return {"cols": [], "rows": [], "rowcount": 1}
+        if verb == "ALTER":
+            self._alter_table(sql)
+            return {"cols": [], "rows": [], "rowcount": 1}
+        if verb == "DROP":
+            self._drop_table(sql)
+            return {"cols": [], "rows": [], "rowcount": 1}
+        if verb == "INSERT":
+            if bulk_args is not None:
+                return {"cols": [], "results": [{"rowcount": c} for c in self._insert(sql, bulk_args)]}
+            return {"cols": [], "rows": [], "rowcount": sum(self._insert(sql, [args or []]))}
+        if bulk_args is not None:
+            results = []
+            for params in bulk_args:
+                statement, params = self._knn_match(sql, params)
+                cursor = self.db.execute(self._rewrite(statement, params), _bind(params))
+                results.append({"rowcount": cursor.rowcount})
+            return {"cols": [], "results": results}
+
+        statement, params = self._knn_match(sql, list(args or []))
+        cursor = self.db.execute(self._rewrite(statement, params), _bind(params))
+        if cursor.description is None:
+            return {"cols": [], "rows": [], "rowcount": cursor.rowcount}
+        return self._result(sql, cursor)
+
+    def _result(self, sql, cursor):
+        names = ["_score" if d[0].startswith("_knn_score(") else d[0]
+                 for d in cursor.description]
+        known = {}
+        for match in _TABLE_REF.finditer(sql):
+            known.update(self.tables.get(self._table_key(match.group(2)), {}).get("columns", {}))
+        keep = [i for i, n in enumerate(names)
+                if n != "_rowid" and (n != "_id" or re.search(r"\b_id\b", sql))]
+        kinds = [known.get(names[i], "_id" if names[i] == "_id" else None) for i in keep]
+        rows = []
+        for row in cursor.fetchall():
+            rows.append([_load(row[i], kind) for i, kind in zip(keep, kinds)])
+        col_types = []
+        for position, kind in enumerate(kinds):
+            if kind in TYPE_IDS:
+                col_types.append(TYPE_IDS[kind])
+                continue
+            sample = next((r[position] for r in rows if r[position] is not None), None)
+            col_types.append(TYPE_IDS["double"] if isinstance(sample, float)
+                             else TYPE_IDS["bigint"] if isinstance(sample, int)
+                             else TYPE_IDS["text"] if sample is not None else TYPE_IDS["null"])
+        return {"cols": [names[i] for i in keep], "col_types": col_types,
+                "rows": rows, "rowcount": len(rows)}
+
+
+def _bind(params):
+    # Arrays and objects (e.g. FLOAT_VECTOR values in UPDATE) go in as JSON
+    return [json.dumps(p) if isinstance(p, (list, tuple, dict)) else p
+            for p in params or []]
+
+
+def _shape_text(value):
+    if isinstance(value, dict):
+        return json.dumps(value)
+    if isinstance(value, (list, tuple)):
+        return json.dumps(list(value))
+    return value
+
+
+def _store(value, kind):
+    if value is None:
+        return None
+    if kind == "geo_shape":
+        return _geometry(_shape_text(value)).wkt
+    if kind == "geo_point":
+        if isinstance(value, (list, tuple)):
+            return json.dumps([float(value[0]), float(value[1])])
+        x, y = _point(_shape_text(value))
+        return json.dumps([x, y])
+    if kind == "timestamp":
+        return to_timestamp(value)
+    if kind == "object":
+        return json.dumps(value)
+    if kind == "boolean":
+        return int(bool(value))
+    return value
+
+
+def _load(value, kind):
+    if value is None:
+        return None
+    if kind == "geo_shape":
+        return mapping(_geometry(value))
+    if kind == "geo_point":
+        return json.loads(value)
+    if kind == "timestamp":
+        return epoch_millis(value)
+    if kind == "object":
+        return json.loads(value)
+    if kind == "boolean":
+        return bool(value)
+    return value
+
+
+# === HTTP endpoint ===
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    `POST /_sql` with `stmt` plus `args` or `bulk_args`, and `GET /` for
+    the node banner the client checks on connect.
+    """
+
+    engine = None
+    latency = 0.0
+    jitter = 0.0
+    rows_bucket = None
+    bytes_bucket = None
+    seed = 0
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send(200, {"ok": True, "status": 200, "name": "local-monkdb",
+                         "cluster_name": "local",
+                         "version": {"number": "5.10.0", "build_snapshot": False}})
+
+    def do_POST(self):
+        if not self.path.startswith("/_sql"):
+            self._send(404, {"error": {"message": f"No handler for {self.path}", "code": 4040}})
+            return
+        start = time.perf_counter()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.bytes_bucket.consume(len(body))
+        if self.latency or self.jitter:
+            # Jitter is drawn from the seed and the request body, not a
+            # shared generator, so it doesn't depend on which thread runs
+            # first when batches arrive concurrently
+            rng = random.Random(b"%d:" % self.seed + body)
+            time.sleep(self.latency + rng.uniform(0, self.jitter))
+        try:
+            request = json.loads(body or b"{}")
+            bulk_args = request.get("bulk_args")
+            if bulk_args is not None:
+                self.rows_bucket.consume(len(bulk_args))
+            result = self.engine.execute(request["stmt"], request.get("args"), bulk_args)
+        except (SQLError, KeyError, json.JSONDecodeError) as e:
+            self._send(400, {"error": {"message": f"SQLParseException[{e}]", "code": 4000}})
+            return
+        except Exception as e:
+            # Always answer: a dropped connection looks like a transient
+            # network error to the client, which would retry it
+            self._send(500, {"error": {"message": f"{type(e).__name__}[{e}]", "code": 5000}})
+            return
+        result["duration"] = round((time.perf_counter() - start) * 1000, 3)
+        self._send(200, result)
+
+
+def make_server(host="127.0.0.1", port=4200, path=":memory:", latency_ms=0.0,
+                jitter_ms=0.0, max_rows_per_sec=0.0, max_bytes_per_sec=0.0, seed=0):
+    """
+    Build (but don't start) a stand-in server. Port 0 picks a free port;
+    `server.server_address` has the one actually bound.
+    """
+    handler = type("Handler", (StandInHandler,), {
+        "engine": Engine(path),
+        "latency": latency_ms / 1000,
+        "jitter": jitter_ms / 1000,
+        "rows_bucket": TokenBucket(max_rows_per_sec),
+        "bytes_bucket": TokenBucket(max_bytes_per_sec),
+        "seed": seed,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_in_background(**kwargs):
+    """
+    Start a stand-in on a daemon thread; returns (server, "host:port").
+    """
+    kwargs.setdefault("port", 0)
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="local-monkdb", daemon=True).start()
+    host, port = server.server_address
+    return server, f"{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local MonkDB stand-in: HTTP /_sql endpoint backed by SQLite.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4200)
+    parser.add_argument("--db", default=":memory:", help="SQLite file (default: in memory)")
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="Fixed delay added to every request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0,
+                        help="Extra uniform random delay per request (seeded by --seed and the request body)")
+    parser.add_argument("--max-rows-per-sec", type=float, default=0.0,
+                        help="Throttle bulk inserts to this many rows/sec (0 = unlimited)")
+    parser.add_argument("--max-bytes-per-sec", type=float, default=0.0,
+                        help="Throttle request bodies to this many bytes/sec (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.db, args.latency_ms, args.jitter_ms,
+                         args.max_rows_per_sec, args.max_bytes_per_sec, args.seed)
+    print(f"🧪 Local MonkDB stand-in listening on http://{args.host}:{args.port} ({args.db})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
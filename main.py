@@ -1,26 +1,63 @@
+import os
+import logging
+from collections import deque
+
 import gradio as gr
-from agent import generate_response
+from agent import generate_response, warm_up, get_scheduler, StageTimings
+from chat_scheduler import MAX_QUEUE_DEPTH
+
+# Turns (user + assistant pairs) kept per browser session
+HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "10"))
+# Show per-stage timings and token counts under each answer
+DEBUG_PANEL = os.getenv("CHAT_DEBUG", "").lower() in ("1", "true", "yes")
+
 
-chat_history = []
+def render(history):
+    messages = [f"**{role}:** {text}" for role, text in history]
+    return "\n\n".join(messages)
 
 
-def chat(user_input):
-    chat_history.append(("User", user_input))
+def chat(user_input, history):
+    # Each session gets its own bounded history via gr.State; partial
+    # replies are streamed so the first token is what the user waits for
+    if history is None:
+        history = deque(maxlen=HISTORY_TURNS * 2)
+    history.append(("User", user_input))
+    timings = StageTimings()
+    bot_reply = ""
     try:
-        bot_reply = generate_response(user_input)
+        for bot_reply in generate_response(user_input, timings):
+            yield outputs(render(list(history) + [("Assistant", bot_reply)]), history, timings)
     except Exception as e:
         bot_reply = f"Error: {e}"
-    chat_history.append(("Assistant", bot_reply))
-    messages = [f"**{role}:** {text}" for role, text in chat_history]
-    return "\n\n".join(messages)
+    history.append(("Assistant", bot_reply))
+    logging.info("Scheduler stats: %s", get_scheduler().stats())
+    yield outputs(render(history), history, timings)
 
 
-if __name__ == "__main__":
-    gr.Interface(
+def outputs(markdown, history, timings):
+    if DEBUG_PANEL:
+        return markdown, history, timings.as_dict()
+    return markdown, history
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    # Load the model in the background so the UI is up immediately
+    warm_up(background=True)
+    demo = gr.Interface(
         fn=chat,
-        inputs=gr.Textbox(
+        inputs=[gr.Textbox(
             lines=2, placeholder="Ask something like: Show tiles with highest area in Himalayas..."),
-        outputs="markdown",
+            "state"],
+        outputs=["markdown", "state"] + (["json"] if DEBUG_PANEL else []),
         title="MonkDB Geospatial Chat",
         description="Chat-based natural language interface for MonkDB raster tile analytics with TinyLlama."
-    ).launch()
+    )
+    # Let concurrent sessions reach the scheduler so they can be batched
+    demo.queue(default_concurrency_limit=MAX_QUEUE_DEPTH)
+    demo.launch()
+
+
+if __name__ == "__main__":
+    main()
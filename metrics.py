@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import threading
+import configparser
+from contextlib import contextmanager
+
+# Load config
+config = configparser.ConfigParser()
+config.read("config.ini", encoding="utf-8")
+
+METRICS_DIR = config.get("metrics", "metrics_dir",
+                         fallback=os.path.join(os.getcwd(), "results", "v3", "metrics"))
+METRICS_ENABLED = config.getboolean("metrics", "enabled", fallback=True)
+
+# Seconds; covers a single-row lookup up to a full-table scan
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 5e7)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple) -> str:
+    if not key:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, v in key)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(key, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+    def snapshot(self):
+        with self._lock:
+            return {_format_labels(k) or "": v for k, v in self.values.items()}
+
+    def clear(self):
+        with self._lock:
+            self.values = {}
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self.values[_label_key(labels)] = value
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with a running sum and count per label set.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts, total, count = self.values.get(
+                key, ([0] * len(self.buckets), 0.0, 0))
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(counts):
+                counts[index] += 1
+            self.values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        rows = []
+        with self._lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    rows.append((f"{self.name}_bucket", key + (("le", f"{bound:g}"),), cumulative))
+                rows.append((f"{self.name}_bucket", key + (("le", "+Inf"),), count))
+                rows.append((f"{self.name}_sum", key, total))
+                rows.append((f"{self.name}_count", key, count))
+        return rows
+
+    def snapshot(self):
+        with self._lock:
+            return {_format_labels(k) or "": {"count": c, "sum": round(t, 6),
+                                              "mean": round(t / c, 6) if c else None}
+                    for k, (_, t, c) in self.values.items()}
+
+    def clear(self):
+        with self._lock:
+            self.values = {}
+
+
+class Registry:
+    """
+    In-process metrics and spans for one pipeline run.
+
+    Counters, gauges and histograms are exported as a Prometheus
+    text-format file (overwritten per run, for node_exporter's textfile
+    collector or a quick diff); finished spans and a final metrics
+    snapshot are appended to a JSON-lines file so runs can be compared
+    over time.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.trace_id = uuid.uuid4().hex
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, **kwargs)
+                self.metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str = "") -> Counter:
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str = "") -> Gauge:
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str = "", buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Time a block as a span (nested spans record their parent) and
+        observe its duration in the `span_seconds` histogram.
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        span_id = uuid.uuid4().hex[:16]
+        parent_id = stack[-1] if stack else None
+        stack.append(span_id)
+        started_at = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield attributes
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            self.histogram("span_seconds", "Duration of traced pipeline stages").observe(
+                duration, span=name)
+            with self._lock:
+                self.spans.append({
+                    "type": "span", "trace_id": self.trace_id, "span_id": span_id,
+                    "parent_id": parent_id, "name": name, "start": started_at,
+                    "duration_sec": round(duration, 6), "attributes": attributes,
+                    "error": error,
+                })
+
+    def prometheus_text(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                value = int(value) if float(value).is_integer() else value
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """
+        Zero every metric and drop recorded spans, starting a new trace.
+        Metric objects stay registered, so module-level handles keep working.
+        """
+        with self._lock:
+            metrics = list(self.metrics.values())
+            self.spans = []
+            self.trace_id = uuid.uuid4().hex
+        for metric in metrics:
+            metric.clear()
+
+    def export(self, job: str, directory: str = METRICS_DIR):
+        """
+        Write `<job>.prom` and append this run's spans plus a metrics
+        snapshot to `<job>.jsonl`. Returns the two paths.
+
+        The registry is then reset, so several jobs run in one process
+        (e.g. `cli.py query all`) each export only their own metrics.
+        """
+        if not METRICS_ENABLED:
+            self.reset()
+            return None
+        os.makedirs(directory, exist_ok=True)
+        prom_path = os.path.join(directory, f"{job}.prom")
+        jsonl_path = os.path.join(directory, f"{job}.jsonl")
+        with open(prom_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        with self._lock:
+            spans, self.spans = self.spans, []
+        with open(jsonl_path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span, default=str) + "\n")
+            f.write(json.dumps({
+                "type": "metrics", "trace_id": self.trace_id, "job": job,
+                "time": time.time(),
+                "metrics": {m.name: m.snapshot() for m in list(self.metrics.values())},
+            }, default=str) + "\n")
+        self.reset()
+        return prom_path, jsonl_path
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+span = REGISTRY.span
+export = REGISTRY.export
+
+
+_database_hook = None
+_database_hook_lock = threading.Lock()
+
+
+def instrument_database():
+    """
+    Record every pooled MonkDB statement: latency by statement type,
+    affected rows and errors.
+
+    Idempotent: the hook is registered once per process however many jobs
+    call this.
+    """
+    global _database_hook
+    import database
+
+    with _database_hook_lock:
+        if _database_hook is not None:
+            return _database_hook
+
+        latency = histogram("monkdb_statement_seconds", "MonkDB statement latency")
+        rows = counter("monkdb_statement_rows_total", "Rows returned or affected by MonkDB statements")
+        errors = counter("monkdb_statement_errors_total", "Failed MonkDB statement attempts")
+
+        def hook(sql, seconds, rowcount, error):
+            words = sql.split(None, 1)
+            statement = words[0].upper() if words else "UNKNOWN"
+            latency.observe(seconds, statement=statement)
+            if error is not None:
+                errors.inc(statement=statement, error=type(error).__name__)
+            elif rowcount and rowcount > 0:
+                rows.inc(rowcount, statement=statement)
+
+        database.add_statement_hook(hook)
+        _database_hook = hook
+        return hook
@@ -0,0 +1,265 @@
+import os
+import time
+import queue
+import argparse
+import threading
+import configparser
+
+import pandas as pd
+
+import metrics
+
+# Load config
+config = configparser.ConfigParser()
+config.read("config.ini", encoding="utf-8")
+
+tile_dir = config["sentinel"]["sentinel_data_dir_v2"].rstrip("/")
+
+CONVERT_WORKERS = config.getint("pipeline", "convert_workers", fallback=4)
+INDEX_WORKERS = config.getint("pipeline", "index_workers", fallback=2)
+QUEUE_SIZE = config.getint("pipeline", "queue_size", fallback=32)
+BATCH_SIZE = config.getint("pipeline", "batch_size", fallback=500)
+# A partial batch is written once its oldest row has waited this long, so
+# a lone new granule doesn't wait for BATCH_SIZE rows
+FLUSH_SECONDS = config.getfloat("pipeline", "flush_seconds", fallback=1.0)
+
+RESOLUTIONS = ("R10m", "R20m", "R60m")
+
+_DONE = object()
+
+stage_seconds = metrics.histogram("pipeline_stage_seconds", "Time spent per tile in each stage")
+items_total = metrics.counter("pipeline_items_total", "Tiles processed per stage and outcome")
+tile_latency = metrics.histogram("pipeline_tile_latency_seconds",
+                                 "Discovery-to-insert latency per tile")
+queue_depth = metrics.gauge("pipeline_queue_depth", "Items waiting in front of each stage")
+
+
+def discover(img_data_dirs):
+    """
+    Yield (jp2 path, resolution folder) for every band image, in the same
+    R10m / R20m / R60m layout to_tiff.sh walks.
+    """
+    for img_data in img_data_dirs:
+        for res in RESOLUTIONS:
+            res_dir = os.path.join(img_data, res)
+            if not os.path.isdir(res_dir):
+                print(f"Folder not found: {res_dir} (skipping)")
+                continue
+            for root, _, files in os.walk(res_dir):
+                for name in sorted(files):
+                    if name.endswith(".jp2"):
+                        yield os.path.join(root, name), res
+
+
+def convert(jp2_path, res, output_dir):
+    """
+    JPEG2000 band -> GeoTIFF named like to_tiff.sh output
+    (`<name>_<res>.tif`). Up-to-date outputs are reused.
+    """
+    import rasterio.shutil
+
+    stem = os.path.splitext(os.path.basename(jp2_path))[0]
+    tif_path = os.path.join(output_dir, f"{stem}_{res}.tif")
+    if not (os.path.exists(tif_path)
+            and os.path.getmtime(tif_path) >= os.path.getmtime(jp2_path)):
+        # Equivalent of `gdal_translate -of GTiff`
+        rasterio.shutil.copy(jp2_path, tif_path, driver="GTiff")
+    return tif_path
+
+
+class Stage:
+    """
+    A pool of worker threads between two bounded queues.
+
+    `func(item)` returns the item for the next stage or None to drop it.
+    When every worker has seen the end marker, the stage forwards one end
+    marker per downstream worker.
+    """
+
+    def __init__(self, name, func, inbox, outbox, workers, downstream_workers=1):
+        self.name = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.downstream_workers = downstream_workers
+        self._running = workers
+        self._lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True)
+                        for i in range(workers)]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                break
+            queue_depth.set(self.inbox.qsize(), stage=self.name)
+            start = time.perf_counter()
+            try:
+                result = self.func(item)
+                items_total.inc(stage=self.name, status="ok" if result else "skipped")
+            except Exception as e:
+                print(f"❌ {self.name} failed for {item[0]}: {e}")
+                items_total.inc(stage=self.name, status="failed")
+                result = None
+            stage_seconds.observe(time.perf_counter() - start, stage=self.name)
+            if result is not None:
+                self.outbox.put(result)
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            for _ in range(self.downstream_workers):
+                self.outbox.put(_DONE)
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+
+def run(img_data_dirs, output_dir=tile_dir, recreate_table=False, write_index=False):
+    """
+    Convert, index and ingest tiles as one overlapping stream.
+
+    discover -> convert (CONVERT_WORKERS) -> index (INDEX_WORKERS) ->
+    batch writer, connected by queues of QUEUE_SIZE. Rows go to MonkDB as
+    soon as a batch fills up or its oldest row is FLUSH_SECONDS old, so a
+    tile is queryable about one conversion after its JP2 appears instead
+    of after the whole granule set has been converted and indexed.
+    """
+    # Import lazily: both modules read config and set up metrics on import
+    import index_v3
+    import insert_v2
+    from database import connect
+
+    os.makedirs(output_dir, exist_ok=True)
+    metrics.instrument_database()
+
+    conn = connect()
+    cursor = conn.cursor()
+    insert_v2.create_table(cursor, drop=recreate_table)
+    cursor.close()
+    conn.close()
+
+    to_convert = queue.Queue(QUEUE_SIZE)
+    to_index = queue.Queue(QUEUE_SIZE)
+    to_ingest = queue.Queue(QUEUE_SIZE)
+    records = []
+
+    def convert_item(item):
+        jp2_path, res, discovered = item
+        return convert(jp2_path, res, output_dir), discovered
+
+    def index_item(item):
+        tif_path, discovered = item
+        record = index_v3.tile_metadata(os.path.basename(tif_path), output_dir)
+        if record is None:
+            return None
+        records.append(record)
+        tile = insert_v2.tile_record(record)
+        row = insert_v2.real_row(tile) if tile is not None else None
+        return (row, discovered) if row is not None else None
+
+    stages = [
+        Stage("convert", convert_item, to_convert, to_index, CONVERT_WORKERS, INDEX_WORKERS),
+        Stage("index", index_item, to_index, to_ingest, INDEX_WORKERS, 1),
+    ]
+    for stage in stages:
+        stage.start()
+
+    def produce():
+        for jp2_path, res in discover(img_data_dirs):
+            to_convert.put((jp2_path, res, time.perf_counter()))
+        for _ in range(CONVERT_WORKERS):
+            to_convert.put(_DONE)
+
+    producer = threading.Thread(target=produce, name="discover", daemon=True)
+    producer.start()
+
+    writer = insert_v2.BatchWriter()
+    inserted = 0
+    batch, discovered_at = [], []
+
+    def flush():
+        future = writer.submit(batch)
+        starts = list(discovered_at)
+
+        # Latency is measured once the batch holding the tile is written
+        def written(future):
+            if future.exception() is None:
+                now = time.perf_counter()
+                for start in starts:
+                    tile_latency.observe(now - start)
+
+        future.add_done_callback(written)
+        batch.clear()
+        discovered_at.clear()
+
+    with metrics.span("pipeline.run", inputs=len(img_data_dirs)) as attrs:
+        batch_started = None
+        while True:
+            timeout = FLUSH_SECONDS
+            if batch:
+                timeout = max(0.0, batch_started + FLUSH_SECONDS - time.perf_counter())
+            try:
+                item = to_ingest.get(timeout=timeout)
+            except queue.Empty:
+                if batch:
+                    flush()
+                continue
+            if item is _DONE:
+                break
+            row, discovered = item
+            if not batch:
+                batch_started = time.perf_counter()
+            batch.append(row)
+            discovered_at.append(discovered)
+            inserted += 1
+            if len(batch) >= BATCH_SIZE or time.perf_counter() - batch_started >= FLUSH_SECONDS:
+                flush()
+        if batch:
+            flush()
+        writer.close()
+        producer.join()
+        for stage in stages:
+            stage.join()
+        attrs["tiles"] = inserted
+
+    print(f"✅ Ingested {inserted} tiles into MonkDB.")
+
+    if write_index and records:
+        index_path = os.path.join(output_dir, "tile_index", index_v3.output_filename)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        df = pd.DataFrame(records)
+        if index_v3.export_format == "parquet":
+            df.to_parquet(index_path, index=False)
+        else:
+            df.to_csv(index_path, index=False)
+        print(f"Tile index written to: {index_path}")
+    return inserted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert, index and ingest Sentinel-2 granules in one streaming run.")
+    parser.add_argument("img_data", nargs="+",
+                        help="IMG_DATA directories (…/GRANULE/<id>/IMG_DATA)")
+    parser.add_argument("--output-dir", default=tile_dir,
+                        help="Where converted GeoTIFFs are written")
+    parser.add_argument("--recreate-table", action="store_true",
+                        help="Drop and recreate the MonkDB table first")
+    parser.add_argument("--write-index", action="store_true",
+                        help="Also write the tile index file for downstream tools")
+    args = parser.parse_args(argv)
+
+    try:
+        run(args.img_data, args.output_dir, args.recreate_table, args.write_index)
+    finally:
+        metrics.export("pipeline")
+
+
+if __name__ == "__main__":
+    main()
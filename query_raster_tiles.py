@@ -1,32 +1,13 @@
-import configparser
 import pandas as pd
-from monkdb import client
+from database import connect, DB_SCHEMA, RASTER_TABLE
+import metrics
 import os
 import time
 
-# Load configuration
-config = configparser.ConfigParser()
-config.read("config.ini", encoding="utf-8")
-
-DB_HOST = config['database']['DB_HOST']
-DB_PORT = config['database']['DB_PORT']
-DB_USER = config['database']['DB_USER']
-DB_PASSWORD = config['database']['DB_PASSWORD']
-DB_SCHEMA = config['database']['DB_SCHEMA']
-RASTER_TABLE = config['database']['RASTER_GEO_SHAPE_TABLE_V2']
-
 # Output file path in 'results' directory
 results_dir = os.path.join(os.getcwd(), "results", "v3")
-os.makedirs(results_dir, exist_ok=True)
 output_path = os.path.join(results_dir, "core_query_results.txt")
 
-# Establish MonkDB connection
-conn = client.connect(
-    f"http://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}",
-    username=DB_USER
-)
-cursor = conn.cursor()
-
 # Define queries
 queries = {
     "Centroids within bounding box (Lat -10 to 10, Lon 100 to 120)": f"""
@@ -85,21 +66,37 @@ queries = {
     """
 }
 
-# Run and log queries
-with open(output_path, "w", encoding="utf-8") as output_file:
-    for name, sql in queries.items():
-        output_file.write(f"\n\n### {name}\n")
-        start = time.perf_counter()
-        try:
-            cursor.execute(sql)
-            results = cursor.fetchall()
-            df = pd.DataFrame(results)
-            output_file.write(df.to_string(index=False))
-        except Exception as e:
-            output_file.write(f"Query failed: {e}\n")
-        end = time.perf_counter()
-        output_file.write(f"\n⏱️ Query Time: {round(end - start, 3)} sec\n")
-
-cursor.close()
-conn.close()
-print(f"\n✅ Finished all queries. Results saved to {output_path}")
+
+def main():
+    os.makedirs(results_dir, exist_ok=True)
+
+    # Establish MonkDB connection
+    metrics.instrument_database()
+    conn = connect()
+    cursor = conn.cursor()
+
+    # Run and log queries
+    query_seconds = metrics.histogram("query_seconds", "End-to-end time per named query")
+    with open(output_path, "w", encoding="utf-8") as output_file, metrics.span("queries.core"):
+        for name, sql in queries.items():
+            output_file.write(f"\n\n### {name}\n")
+            start = time.perf_counter()
+            try:
+                cursor.execute(sql)
+                results = cursor.fetchall()
+                df = pd.DataFrame(results)
+                output_file.write(df.to_string(index=False))
+            except Exception as e:
+                output_file.write(f"Query failed: {e}\n")
+            end = time.perf_counter()
+            query_seconds.observe(end - start, query=name)
+            output_file.write(f"\n⏱️ Query Time: {round(end - start, 3)} sec\n")
+
+    cursor.close()
+    conn.close()
+    metrics.export("query_raster_tiles")
+    print(f"\n✅ Finished all queries. Results saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
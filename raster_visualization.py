@@ -1,7 +1,12 @@
 import os
+import time
+import configparser
+from functools import lru_cache
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import geopandas as gpd
+import shapely
 from shapely import wkt
 from shapely.errors import WKTReadingError
 
@@ -10,6 +15,21 @@ RESULTS_DIR = os.path.join(os.getcwd(), "results", "v3")
 STATS_PATH = os.path.join(RESULTS_DIR, "layer_statistics.csv")
 WKT_PATH = os.path.join(RESULTS_DIR, "wkt_intersection_results.csv")
 
+# Aggregated footprint map settings (optional [visualization] section)
+config = configparser.ConfigParser()
+config.read("config.ini", encoding="utf-8")
+AGGREGATE_SOURCE = config.get(
+    "visualization", "aggregate_source", fallback="db").lower()
+SHADING_MODES = ("count", "layer", "area")
+AGGREGATE_SHADING = [m.strip().lower() for m in config.get(
+    "visualization", "aggregate_shading", fallback="count,layer,area").split(",") if m.strip()]
+_unknown_shading = sorted(set(AGGREGATE_SHADING) - set(SHADING_MODES))
+if _unknown_shading:
+    raise ValueError(f"[visualization] aggregate_shading: unknown mode(s) "
+                     f"{', '.join(_unknown_shading)}; choose from {', '.join(SHADING_MODES)}")
+CANVAS_WIDTH = config.getint("visualization", "canvas_width", fallback=1600)
+CANVAS_HEIGHT = config.getint("visualization", "canvas_height", fallback=900)
+
 expected_stats_cols = ['layer', 'tile_count',
                        'min_area', 'max_area', 'mean_area', 'stddev_area']
 expected_wkt_cols = ['tile_id', 'layer', 'area_km', 'centroid']
@@ -39,44 +59,7 @@ def safe_wkt_load(x):
         return None
 
 
-# Load CSVs
-layer_stats = safe_read_csv(STATS_PATH, expected_stats_cols)
-wkt_tiles = safe_read_csv(WKT_PATH, expected_wkt_cols)
-
-print(f"✅ layer_statistics.csv columns: {list(layer_stats.columns)}")
-print(f"✅ wkt_intersection_results.csv columns: {list(wkt_tiles.columns)}")
-
-# Plot 1: Mean Area per Layer
-plt.figure(figsize=(12, 6))
-ax = plt.gca()
-ax.bar(layer_stats['layer'], layer_stats['mean_area'], color='steelblue')
-ax.set_xlabel("Layer")
-ax.set_ylabel("Mean Area (km²)")
-ax.set_title("Mean Area per Layer")
-plt.xticks(rotation=90)
-plt.tight_layout()
-plt.savefig(os.path.join(RESULTS_DIR, "mean_area_per_layer.png"))
-print("📊 Saved: mean_area_per_layer.png")
-
-# Plot 2: Top Intersected Tiles by Area
-wkt_tiles_sorted = wkt_tiles.sort_values(
-    by="area_km", ascending=False).head(20)
-plt.figure(figsize=(10, 8))
-ax = plt.gca()
-ax.barh(wkt_tiles_sorted["tile_id"],
-        wkt_tiles_sorted["area_km"], color="darkorange")
-ax.set_xlabel("Area (km²)")
-ax.set_ylabel("Tile ID")
-ax.set_title("Top 20 Intersected Tiles by Area")
-plt.tight_layout()
-plt.savefig(os.path.join(RESULTS_DIR, "top_intersected_tiles.png"))
-print("📊 Saved: top_intersected_tiles.png")
-
-# Optional GeoPandas Visualization
-print("🌍 Attempting GeoPandas plot...")
 # Convert centroid strings like "[-3.623748, 50.059421]" to WKT POINTs
-
-
 def coords_to_wkt_point(x):
     try:
         coords = x.strip("[]").split(",")
@@ -86,16 +69,229 @@ def coords_to_wkt_point(x):
         return None
 
 
-wkt_tiles["geometry"] = wkt_tiles["centroid"].apply(
-    coords_to_wkt_point).apply(safe_wkt_load)
-wkt_tiles = wkt_tiles.dropna(subset=["geometry"])
+def plot_query_results():
+    """
+    Charts from the CSVs written by geo_analytics_queries.py.
+    """
+    # Load CSVs
+    layer_stats = safe_read_csv(STATS_PATH, expected_stats_cols)
+    wkt_tiles = safe_read_csv(WKT_PATH, expected_wkt_cols)
+
+    print(f"✅ layer_statistics.csv columns: {list(layer_stats.columns)}")
+    print(f"✅ wkt_intersection_results.csv columns: {list(wkt_tiles.columns)}")
+
+    # Plot 1: Mean Area per Layer
+    plt.figure(figsize=(12, 6))
+    ax = plt.gca()
+    ax.bar(layer_stats['layer'], layer_stats['mean_area'], color='steelblue')
+    ax.set_xlabel("Layer")
+    ax.set_ylabel("Mean Area (km²)")
+    ax.set_title("Mean Area per Layer")
+    plt.xticks(rotation=90)
+    plt.tight_layout()
+    plt.savefig(os.path.join(RESULTS_DIR, "mean_area_per_layer.png"))
+    print("📊 Saved: mean_area_per_layer.png")
 
-if not wkt_tiles.empty:
-    gdf = gpd.GeoDataFrame(wkt_tiles, geometry="geometry", crs="EPSG:4326")
-    ax = gdf.plot(figsize=(10, 8), color='green', edgecolor='black', alpha=0.7)
-    ax.set_title("Spatial Distribution of Intersected Tiles")
+    # Plot 2: Top Intersected Tiles by Area
+    wkt_tiles_sorted = wkt_tiles.sort_values(
+        by="area_km", ascending=False).head(20)
+    plt.figure(figsize=(10, 8))
+    ax = plt.gca()
+    ax.barh(wkt_tiles_sorted["tile_id"],
+            wkt_tiles_sorted["area_km"], color="darkorange")
+    ax.set_xlabel("Area (km²)")
+    ax.set_ylabel("Tile ID")
+    ax.set_title("Top 20 Intersected Tiles by Area")
     plt.tight_layout()
-    plt.savefig(os.path.join(RESULTS_DIR, "tile_intersections_map.png"))
-    print("🗺️ Saved: tile_intersections_map.png")
-else:
-    print("⚠️ No valid geometries found to plot.")
+    plt.savefig(os.path.join(RESULTS_DIR, "top_intersected_tiles.png"))
+    print("📊 Saved: top_intersected_tiles.png")
+
+    # Optional GeoPandas Visualization
+    print("🌍 Attempting GeoPandas plot...")
+    wkt_tiles["geometry"] = wkt_tiles["centroid"].apply(
+        coords_to_wkt_point).apply(safe_wkt_load)
+    wkt_tiles = wkt_tiles.dropna(subset=["geometry"])
+
+    if not wkt_tiles.empty:
+        gdf = gpd.GeoDataFrame(wkt_tiles, geometry="geometry", crs="EPSG:4326")
+        ax = gdf.plot(figsize=(10, 8), color='green', edgecolor='black', alpha=0.7)
+        ax.set_title("Spatial Distribution of Intersected Tiles")
+        plt.tight_layout()
+        plt.savefig(os.path.join(RESULTS_DIR, "tile_intersections_map.png"))
+        print("🗺️ Saved: tile_intersections_map.png")
+    else:
+        print("⚠️ No valid geometries found to plot.")
+
+
+# Plot 4: Aggregated footprint map of the whole table
+# Footprints are streamed in chunks and binned onto a fixed pixel canvas
+# (datashader style), so memory depends on the canvas size, not row count.
+
+
+def iter_footprint_chunks(source):
+    """
+    Yield (bounds, layers, area_km) chunks from the database or tile index.
+    """
+    import footprints
+
+    if source == "index":
+        yield from index_footprint_chunks()
+        return
+
+    conn = footprints.connect()
+    cursor = conn.cursor()
+    try:
+        for batch in footprints.iter_footprint_batches(
+                cursor, columns=("layer", "area_km", "area")):
+            layers = np.array([row[0] for row in batch], dtype=object)
+            area_km = np.array([row[1] or 0.0 for row in batch], dtype=float)
+            yield footprints.footprint_bounds([row[2] for row in batch]), layers, area_km
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@lru_cache(maxsize=1)
+def index_footprint_chunks():
+    """
+    (bounds, layers, area_km) chunks of the tile index, read once.
+
+    The index is streamed in STREAM_BATCH_SIZE chunks and only these arrays
+    are kept, so the extent and the aggregation pass share a single read.
+    """
+    import footprints
+    from pyproj import Geod
+
+    geod = Geod(ellps="WGS84")
+    chunks = []
+    for df in footprints.iter_tile_index(chunksize=footprints.STREAM_BATCH_SIZE):
+        geoms = df["geometry"].to_numpy()
+        area_km = np.array([abs(geod.geometry_area_perimeter(g)[0]) / 1e6 for g in geoms])
+        chunks.append((shapely.bounds(geoms), df["layer"].to_numpy(), area_km))
+    return tuple(chunks)
+
+
+def footprint_extent(source):
+    """
+    (minx, miny, maxx, maxy) of all footprints, or None if there are none.
+    """
+    import footprints
+    from coverage_density import table_extent
+
+    if source == "index":
+        chunks = index_footprint_chunks()
+        if not chunks:
+            return None
+        minx, miny, maxx, maxy = np.vstack([bounds for bounds, _, _ in chunks]).T
+        return (minx.min(), miny.min(), maxx.max(), maxy.max())
+    conn = footprints.connect()
+    cursor = conn.cursor()
+    try:
+        return table_extent(cursor)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def aggregate_footprints(source, extent, width, height, shading):
+    """
+    Bin every footprint envelope onto a width x height canvas.
+
+    Returns {mode: canvas}; "layer" maps to a dict of per-layer canvases.
+    """
+    from coverage_density import accumulate_envelopes, difference_to_grid, grid_shape
+
+    res = max((extent[2] - extent[0]) / width, (extent[3] - extent[1]) / height)
+    ny, nx = grid_shape(extent, res)
+    counts = np.zeros((ny + 1, nx + 1), dtype=np.int64)
+    areas = np.zeros((ny + 1, nx + 1), dtype=np.float64) if "area" in shading else None
+    per_layer = {}
+    for bounds, layers, area_km in iter_footprint_chunks(source):
+        accumulate_envelopes(counts, bounds, extent, res)
+        if areas is not None:
+            accumulate_envelopes(areas, bounds, extent, res, weights=area_km)
+        if "layer" in shading:
+            for layer in np.unique(layers):
+                mask = layers == layer
+                if layer not in per_layer:
+                    per_layer[layer] = np.zeros((ny + 1, nx + 1), dtype=np.int32)
+                accumulate_envelopes(per_layer[layer], bounds[mask], extent, res)
+
+    canvases = {"count": difference_to_grid(counts)}
+    if areas is not None:
+        canvases["area"] = difference_to_grid(areas)
+    if per_layer:
+        canvases["layer"] = {k: difference_to_grid(v) for k, v in sorted(per_layer.items())}
+    return canvases
+
+
+def shade(canvases, mode):
+    """
+    Turn aggregated canvases into an RGBA image.
+    """
+    from matplotlib import colormaps
+
+    count = canvases["count"]
+    alpha = np.log1p(count) / max(np.log1p(count.max()), 1e-9)
+    if mode == "count":
+        rgba = colormaps["inferno"](alpha)
+    elif mode == "area":
+        mean_area = np.divide(canvases["area"], count,
+                              out=np.zeros(count.shape), where=count > 0)
+        rgba = colormaps["viridis"](mean_area / max(mean_area.max(), 1e-9))
+    elif mode == "layer":
+        palette = colormaps["tab20"]
+        rgb = np.zeros(count.shape + (3,))
+        for i, grid in enumerate(canvases["layer"].values()):
+            rgb += grid[..., None] * np.array(palette(i % 20)[:3])
+        rgba = np.dstack([rgb / np.maximum(count, 1)[..., None], np.ones(count.shape)])
+    else:
+        raise ValueError(f"Unknown shading mode {mode!r}; choose from {', '.join(SHADING_MODES)}")
+    rgba[..., 3] = np.where(count > 0, 0.25 + 0.75 * alpha, 0.0)
+    return rgba
+
+
+def render_footprint_map(source=AGGREGATE_SOURCE):
+    if source == "none":
+        return
+    print(f"🗺️ Rendering aggregated footprint map from {source}...")
+    try:
+        start = time.perf_counter()
+        extent = footprint_extent(source)
+        if extent is None:
+            print("⚠️ No footprints found; skipping the aggregated footprint map.")
+            return
+        canvases = aggregate_footprints(
+            source, extent, CANVAS_WIDTH, CANVAS_HEIGHT, AGGREGATE_SHADING)
+        for mode in AGGREGATE_SHADING:
+            plt.figure(figsize=(CANVAS_WIDTH / 100, CANVAS_HEIGHT / 100))
+            ax = plt.gca()
+            ax.set_facecolor("black")
+            ax.imshow(shade(canvases, mode), interpolation="nearest",
+                      extent=(extent[0], extent[2], extent[1], extent[3]))
+            ax.set_xlabel("Longitude")
+            ax.set_ylabel("Latitude")
+            ax.set_title(f"All Tile Footprints (shaded by {mode})")
+            if mode == "layer":
+                from matplotlib import colormaps
+                from matplotlib.patches import Patch
+                palette = colormaps["tab20"]
+                ax.legend(handles=[Patch(color=palette(i % 20), label=name)
+                                   for i, name in enumerate(canvases["layer"])],
+                          fontsize="small", loc="upper right", ncol=2)
+            plt.tight_layout()
+            plt.savefig(os.path.join(RESULTS_DIR, f"footprints_by_{mode}.png"))
+            plt.close()
+            print(f"🗺️ Saved: footprints_by_{mode}.png")
+        print(f"⏱️ Aggregated render: {round(time.perf_counter() - start, 3)} sec")
+    except Exception as e:
+        print(f"❌ Aggregated footprint map failed: {e}")
+
+
+def main():
+    plot_query_results()
+    render_footprint_map()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+import os
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+import shapely
+
+import footprints
+from footprints import config, DB_SCHEMA, RASTER_TABLE
+
+# knn_match asks for this many neighbours per requested result, so that
+# layer / AOI / time filters applied afterwards still leave k rows
+KNN_OVERSAMPLE = config.getint("embeddings", "knn_oversample", fallback=4)
+# Selective filters can leave fewer than k rows; the candidate count is
+# then multiplied by KNN_OVERSAMPLE and retried, up to this many
+KNN_MAX_CANDIDATES = config.getint("embeddings", "knn_max_candidates", fallback=10_000)
+
+# Local IVF index (fallback when the database can't serve kNN)
+ANN_INDEX_PATH = config.get("embeddings", "ann_index_path", fallback=os.path.join(
+    os.path.dirname(footprints.TILE_INDEX_PATH), "embeddings_ivf.npz"))
+# Inverted lists; 0 picks ~sqrt(n)
+ANN_LISTS = config.getint("embeddings", "ann_lists", fallback=0)
+# Lists scanned per query (widened automatically when filters leave < k)
+ANN_PROBES = config.getint("embeddings", "ann_probes", fallback=8)
+ANN_TRAIN_SAMPLE = config.getint("embeddings", "ann_train_sample", fallback=50_000)
+
+results_dir = os.path.join(os.getcwd(), "results", "v3")
+
+
+def _epoch_ms(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def _squared_distances(vectors, centroids):
+    return ((vectors ** 2).sum(axis=1)[:, None] - 2 * vectors @ centroids.T
+            + (centroids ** 2).sum(axis=1)[None, :])
+
+
+def _assign(vectors, centroids, chunk=65_536):
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for i in range(0, len(vectors), chunk):
+        labels[i:i + chunk] = _squared_distances(vectors[i:i + chunk], centroids).argmin(axis=1)
+    return labels
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index over tile embeddings, in plain NumPy.
+
+    Vectors are clustered with k-means into `n_lists` lists stored
+    contiguously (CSR style). A query scans only the `probes` lists whose
+    centroids are nearest, then ranks those candidates exactly, so a
+    search touches roughly probes / n_lists of the catalog. Layer, AOI
+    and time filters are applied to the candidates; tile outlines are kept
+    as ragged coordinate arrays and only turned into geometries for AOI
+    queries. `version` records the source data the index was built from.
+    """
+
+    def __init__(self, centroids, offsets, vectors, tile_ids, layers, paths, bounds, acquired,
+                 outlines, version=""):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.vectors = vectors
+        self.tile_ids = tile_ids
+        self.layers = layers
+        self.paths = paths
+        self.bounds = bounds
+        self.acquired = acquired
+        self.outlines = outlines
+        self.version = version
+        self._outline_geoms = None
+
+    @classmethod
+    def build(cls, vectors, tile_ids, layers, paths, bounds, acquired, outlines,
+              version="", n_lists=ANN_LISTS, iterations=10, seed=0):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), ANN_TRAIN_SAMPLE),
+                                    replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = _assign(sample, centroids)
+            for c in range(n_lists):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+
+        labels = _assign(vectors, centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.searchsorted(labels[order], np.arange(n_lists + 1))
+        return cls(centroids, offsets, vectors[order], np.asarray(tile_ids)[order],
+                   np.asarray(layers)[order], np.asarray(paths)[order],
+                   np.asarray(bounds, dtype=np.float64)[order],
+                   np.asarray(acquired, dtype=np.float64)[order],
+                   shapely.to_ragged_array(np.asarray(outlines, dtype=object)[order]),
+                   version)
+
+    def save(self, path=ANN_INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        geom_type, coords, geom_offsets = self.outlines
+        np.savez(path, centroids=self.centroids, offsets=self.offsets, vectors=self.vectors,
+                 tile_ids=self.tile_ids.astype(str), layers=self.layers.astype(str),
+                 paths=self.paths.astype(str),
+                 bounds=self.bounds, acquired=self.acquired,
+                 outline_type=int(geom_type), outline_coords=coords,
+                 **{f"outline_offsets{i}": o for i, o in enumerate(geom_offsets)},
+                 version=self.version)
+
+    @classmethod
+    def load(cls, path=ANN_INDEX_PATH):
+        with np.load(path) as data:
+            geom_offsets = tuple(data[f"outline_offsets{i}"] for i in range(3)
+                                 if f"outline_offsets{i}" in data)
+            outlines = (shapely.GeometryType(int(data["outline_type"])),
+                        data["outline_coords"], geom_offsets)
+            return cls(data["centroids"], data["offsets"], data["vectors"], data["tile_ids"],
+                       data["layers"], data["paths"], data["bounds"], data["acquired"],
+                       outlines, str(data["version"]))
+
+    def outline_geometries(self):
+        """
+        Shapely outline of every indexed tile, built on first use.
+        """
+        if self._outline_geoms is None:
+            self._outline_geoms = shapely.from_ragged_array(*self.outlines)
+        return self._outline_geoms
+
+    def lookup(self, tile_id):
+        """
+        (vector, layer, path) of an indexed tile, or None.
+        """
+        hits = np.flatnonzero(self.tile_ids == tile_id)
+        if not len(hits):
+            return None
+        i = hits[0]
+        return self.vectors[i], str(self.layers[i]), str(self.paths[i])
+
+    def search(self, vector, k=10, layer=None, aoi=None, start_ms=None, end_ms=None,
+               exclude_path=None, probes=ANN_PROBES):
+        """
+        [(tile_id, layer, path, distance)] of the k nearest tiles passing
+        the filters, one per raster path. `aoi` is a WGS84 shapely geometry:
+        tile bounds are checked first, then the tile outline, as search_db
+        does. Rows of `exclude_path` (the query raster and its synthetic
+        variants) are skipped.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        if aoi is not None:
+            bbox = aoi.bounds
+            shapely.prepare(aoi)
+        ranked = np.argsort(((self.centroids - vector) ** 2).sum(axis=1))
+        probes = min(probes, len(ranked))
+        while True:
+            idx = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1])
+                                  for c in ranked[:probes]])
+            keep = np.ones(len(idx), dtype=bool)
+            if layer:
+                keep &= self.layers[idx] == layer
+            if aoi is not None:
+                b = self.bounds[idx]
+                keep &= ((b[:, 0] <= bbox[2]) & (b[:, 2] >= bbox[0])
+                         & (b[:, 1] <= bbox[3]) & (b[:, 3] >= bbox[1]))
+            if start_ms is not None:
+                keep &= self.acquired[idx] >= start_ms
+            if end_ms is not None:
+                keep &= self.acquired[idx] < end_ms
+            if exclude_path is not None:
+                keep &= self.paths[idx] != exclude_path
+            if aoi is not None:
+                hits = np.flatnonzero(keep)
+                keep[hits] = shapely.intersects(aoi, self.outline_geometries()[idx[hits]])
+            idx = idx[keep]
+            # Selective filters: scan more lists until k rasters remain
+            if len(np.unique(self.paths[idx])) >= k or probes >= len(ranked):
+                break
+            probes = min(probes * 2, len(ranked))
+
+        distances = ((self.vectors[idx] - vector) ** 2).sum(axis=1)
+        # Synthetic variants share their raster's embedding: keep the best
+        # row per path so k results are k different rasters
+        order = np.argsort(distances)
+        _, first = np.unique(self.paths[idx[order]], return_index=True)
+        top = order[np.sort(first)][:k]
+        return [(str(self.tile_ids[idx[i]]), str(self.layers[idx[i]]),
+                 str(self.paths[idx[i]]), float(np.sqrt(distances[i]))) for i in top]
+
+
+def load_embeddings(source="db"):
+    """
+    (vectors, tile_ids, layers, paths, bounds, acquired_ms, outlines) for
+    every embedded tile, streamed from MonkDB or read from the tile index.
+    Outlines are the detailed valid-data outlines in MonkDB and the
+    footprint boxes in the index.
+    """
+    if source == "index":
+        df = footprints.load_tile_index()
+        df = df[df["embedding"].notna()]
+        vectors = np.array([json.loads(e) for e in df["embedding"]], dtype=np.float32)
+        bounds = np.array([g.bounds for g in df["geometry"]])
+        # Filename timestamps (20250612T112131) are UTC sensing times
+        acquired = [datetime.strptime(str(t), "%Y%m%dT%H%M%S").replace(
+            tzinfo=timezone.utc).timestamp() * 1000 for t in df["timestamp"]]
+        return (vectors, df["tile_id"].to_numpy(), df["layer"].to_numpy(),
+                df["path"].to_numpy(), bounds, acquired, df["geometry"].to_numpy())
+
+    vectors, tile_ids, layers, paths, bounds, acquired, outlines = [], [], [], [], [], [], []
+    conn = footprints.connect()
+    cursor = conn.cursor()
+    try:
+        for batch in footprints.iter_footprint_batches(
+                cursor, columns=("tile_id", "layer", "path", "embedding", "area", "acquired_at",
+                                 "outline"),
+                where="embedding IS NOT NULL"):
+            tile_ids += [row[0] for row in batch]
+            layers += [row[1] for row in batch]
+            paths += [row[2] for row in batch]
+            vectors.append(np.array([row[3] for row in batch], dtype=np.float32))
+            bounds.append(footprints.footprint_bounds([row[4] for row in batch]))
+            acquired += [_epoch_ms(row[5]) for row in batch]
+            outlines.append(footprints.detailed_geometries([row[6] for row in batch],
+                                                           [row[4] for row in batch]))
+    finally:
+        cursor.close()
+        conn.close()
+    if not vectors:
+        raise RuntimeError("No tile embeddings found; run tile_embeddings.py first")
+    return (np.vstack(vectors), tile_ids, layers, paths, np.vstack(bounds), acquired,
+            np.concatenate(outlines))
+
+
+def source_version(source="db"):
+    """
+    Fingerprint of the embeddings a local index is built from: the tile
+    index file's mtime and size, or the number of embedded rows in MonkDB.
+    """
+    if source == "index":
+        stat = os.stat(footprints.TILE_INDEX_PATH)
+        return f"index:{stat.st_mtime_ns}:{stat.st_size}"
+    conn = footprints.connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT COUNT(*) FROM {DB_SCHEMA}.{RASTER_TABLE} "
+                       "WHERE embedding IS NOT NULL")
+        return f"db:{cursor.fetchone()[0]}"
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def local_index(rebuild=False, source="db", path=ANN_INDEX_PATH):
+    """
+    The saved local IVF index, rebuilt when it is missing, from an older
+    format, or built from another version of `source`. When the source
+    can't be reached to check, the saved index is used as is.
+    """
+    try:
+        version = source_version(source)
+    except Exception as e:
+        print(f"⚠️ Can't check the {source} embeddings ({e}); not checking the local ANN index")
+        version = None
+    if not rebuild and os.path.exists(path):
+        try:
+            index = IVFIndex.load(path)
+        except KeyError:
+            print("🧭 Local ANN index is from an older version; rebuilding")
+        else:
+            if version is None or index.version == version:
+                return index
+            print("🧭 Embeddings changed since the local ANN index was built; rebuilding")
+    start = time.perf_counter()
+    index = IVFIndex.build(*load_embeddings(source), version=version or "")
+    index.save(path)
+    print(f"🧭 Built local ANN index ({len(index.vectors)} tiles, "
+          f"{len(index.centroids)} lists) in {round(time.perf_counter() - start, 2)} sec")
+    return index
+
+
+def search_db(cursor, vector, k=10, layer=None, aoi=None, start=None, end=None,
+              exclude_path=None):
+    """
+    kNN in MonkDB with knn_match on the `embedding` FLOAT_VECTOR column.
+
+    Returns [(tile_id, layer, path, acquired_at, score)], best first and
+    one per raster path (synthetic variants share an embedding). An
+    AOI (shapely geometry) uses the coarse outline filter in SQL and the
+    detailed outline to refine. Rows of `exclude_path` (the query raster
+    and its synthetic variants, which share its embedding) are skipped.
+
+    knn_match picks its candidates before the other filters apply, so when
+    they leave fewer than k rows the candidate count grows by
+    KNN_OVERSAMPLE per attempt, up to KNN_MAX_CANDIDATES.
+    """
+    clauses, params = [], ()
+    if layer:
+        clauses.append("layer = ?")
+        params += (layer,)
+    if exclude_path:
+        clauses.append("path <> ?")
+        params += (exclude_path,)
+    if aoi is not None:
+        where, where_params = footprints.intersects_filter(aoi.wkt)
+        clauses.append(where)
+        params += where_params
+    window, window_params = footprints.time_window_filter(start, end)
+    if window:
+        clauses.append(window)
+        params += window_params
+
+    candidates = k * KNN_OVERSAMPLE
+    while True:
+        cursor.execute(f"""
+            SELECT tile_id, layer, path, acquired_at, _score, outline, area
+            FROM {DB_SCHEMA}.{RASTER_TABLE}
+            WHERE {" AND ".join([f"knn_match(embedding, ?, {int(candidates)})"] + clauses)}
+            ORDER BY _score DESC
+            LIMIT {int(candidates)}
+        """, (list(map(float, vector)),) + params)
+        rows = cursor.fetchall()
+        if aoi is not None:
+            rows = footprints.refine_intersecting(aoi, rows, 5, 6)
+        seen = set()
+        rows = [row for row in rows if not (row[2] in seen or seen.add(row[2]))]
+        if len(rows) >= k or candidates >= KNN_MAX_CANDIDATES:
+            return [tuple(row[:5]) for row in rows[:k]]
+        candidates = min(candidates * KNN_OVERSAMPLE, KNN_MAX_CANDIDATES)
+
+
+def _similar_in_db(tile_id, vector, k, layer, aoi, start, end, any_layer):
+    conn = footprints.connect()
+    cursor = conn.cursor()
+    exclude_path = None
+    try:
+        if vector is None:
+            cursor.execute(f"""
+                SELECT embedding, layer, path FROM {DB_SCHEMA}.{RASTER_TABLE}
+                WHERE tile_id = ? AND embedding IS NOT NULL
+                LIMIT 1
+            """, (tile_id,))
+            found = cursor.fetchone()
+            if not found:
+                raise LookupError(f"No embedding stored for tile {tile_id}")
+            vector, tile_layer, exclude_path = found
+            if not layer and not any_layer:
+                layer = tile_layer
+        rows = search_db(cursor, vector, k, layer, aoi, start, end, exclude_path)
+    finally:
+        cursor.close()
+        conn.close()
+    return [{"tile_id": r[0], "layer": r[1], "path": r[2], "acquired_at": r[3], "score": r[4]}
+            for r in rows]
+
+
+def similar_tiles(tile_id=None, vector=None, k=10, layer=None, aoi=None,
+                  start=None, end=None, local=False, rebuild=False, source="db",
+                  any_layer=False):
+    """
+    Tiles whose spectral signature is closest to `tile_id`'s (or to an
+    explicit `vector`). Uses MonkDB knn_match, falling back to the local
+    IVF index when `local` is set or the database query fails.
+
+    With a `tile_id`, results default to that tile's layer (embeddings of
+    different bands aren't comparable; `any_layer` lifts this) and never
+    include tiles cut from the same raster.
+
+    Returns (rows, backend) with rows as dicts.
+    """
+    if not local:
+        try:
+            return _similar_in_db(tile_id, vector, k, layer, aoi, start, end,
+                                  any_layer), "monkdb"
+        except LookupError:
+            raise
+        except Exception as e:
+            print(f"⚠️ MonkDB kNN unavailable ({e}); using local ANN index")
+
+    index = local_index(rebuild, source)
+    exclude_path = None
+    if vector is None:
+        found = index.lookup(tile_id)
+        if found is None:
+            raise LookupError(f"Tile {tile_id} is not in the local ANN index")
+        vector, tile_layer, exclude_path = found
+        if not layer and not any_layer:
+            layer = tile_layer
+    hits = index.search(vector, k, layer, aoi, _epoch_ms(start), _epoch_ms(end),
+                        exclude_path)
+    rows = [{"tile_id": t, "layer": lyr, "path": p, "distance": round(d, 6)}
+            for t, lyr, p, d in hits]
+    return rows, "local-ivf"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Find tiles with a similar spectral signature.")
+    parser.add_argument("tile_id", nargs="?", help="Tile to match (as stored in MonkDB)")
+    parser.add_argument("--vector", help="Explicit embedding as a JSON list")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--layer", help="Only tiles of this layer (default: the query tile's)")
+    parser.add_argument("--any-layer", action="store_true",
+                        help="Compare against every layer, not just the query tile's")
+    parser.add_argument("--aoi", help="Only tiles whose valid data intersects this WKT")
+    parser.add_argument("--start", help="Acquired at or after (ISO-8601)")
+    parser.add_argument("--end", help="Acquired before (ISO-8601)")
+    parser.add_argument("--local", action="store_true",
+                        help="Use the local ANN index instead of MonkDB")
+    parser.add_argument("--rebuild-index", action="store_true",
+                        help="Rebuild the local ANN index first")
+    parser.add_argument("--source", choices=["db", "index"], default="db",
+                        help="Where the local ANN index reads embeddings from")
+    args = parser.parse_args(argv)
+    if not args.tile_id and not args.vector:
+        parser.error("give a tile_id or --vector")
+
+    import pandas as pd
+
+    aoi = shapely.from_wkt(args.aoi) if args.aoi else None
+    started = time.perf_counter()
+    rows, backend = similar_tiles(
+        args.tile_id, json.loads(args.vector) if args.vector else None, args.k,
+        args.layer, aoi, args.start, args.end, args.local, args.rebuild_index, args.source,
+        args.any_layer)
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    df = pd.DataFrame(rows)
+    print(df.to_string(index=False) if not df.empty else "No similar tiles found.")
+    print(f"⏱️ {len(rows)} neighbours via {backend} in {elapsed_ms} ms")
+    os.makedirs(results_dir, exist_ok=True)
+    out_path = os.path.join(results_dir, "similar_tiles.csv")
+    df.to_csv(out_path, index=False)
+    print(f"✅ Results saved to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
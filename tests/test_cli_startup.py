@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("pandas", "shapely", "rasterio", "dask", "torch")
+
+
+def run(*args):
+    return subprocess.run([sys.executable, *args], cwd=ROOT,
+                          capture_output=True, text=True, timeout=120)
+
+
+def test_startup_check_passes():
+    result = run("cli.py", "startup-check")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "Startup within budget" in result.stdout
+
+
+def test_help_stays_under_budget():
+    sys.path.insert(0, ROOT)
+    try:
+        from cli import STARTUP_BUDGET_SEC
+    finally:
+        sys.path.remove(ROOT)
+    run("cli.py", "--help")  # warm the bytecode cache
+    start = time.perf_counter()
+    result = run("cli.py", "--help")
+    elapsed = time.perf_counter() - start
+    assert result.returncode == 0, result.stderr
+    assert elapsed < STARTUP_BUDGET_SEC
+
+
+def test_parsing_imports_no_heavy_modules():
+    result = run("-c",
+                 "import sys, json, cli; "
+                 "cli.build_parser().parse_args(['query', 'core']); "
+                 "print(json.dumps(sorted(sys.modules)))")
+    assert result.returncode == 0, result.stderr
+    loaded = set(json.loads(result.stdout.strip().splitlines()[-1]))
+    assert not loaded & set(HEAVY), sorted(loaded & set(HEAVY))
@@ -0,0 +1,152 @@
+import os
+import math
+import json
+import argparse
+import configparser
+
+import numpy as np
+
+# Load config
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+tile_dir = config["sentinel"]["sentinel_data_dir_v2"].rstrip("/")
+output_filename = config["paths"]["output_csv_v3"]
+export_format = config["metadata"].get("export_format", "csv").lower()
+
+# Same index file index_v3.py writes
+index_file_path = os.path.join(tile_dir, "tile_index", output_filename)
+
+# Bands are read at 1/OVERVIEW_FACTOR resolution (served from overviews)
+OVERVIEW_FACTOR = config.getint("embeddings", "overview_factor", fallback=16)
+QUANTILES = [float(q) for q in config.get(
+    "embeddings", "quantiles", fallback="0.02,0.1,0.25,0.5,0.75,0.9,0.98").split(",")]
+HISTOGRAM_BINS = config.getint("embeddings", "histogram_bins", fallback=8)
+# Sentinel-2 L2A digital numbers are reflectance x 10000; values are
+# divided by this and histogrammed over [0, HISTOGRAM_MAX]
+REFLECTANCE_SCALE = config.getfloat("embeddings", "reflectance_scale", fallback=10000.0)
+HISTOGRAM_MAX = config.getfloat("embeddings", "histogram_max", fallback=0.6)
+# Pixel value treated as nodata when the file declares none
+NODATA = config.getint("embeddings", "nodata", fallback=0)
+
+# quantiles + histogram + valid-data fraction
+EMBEDDING_DIMS = len(QUANTILES) + HISTOGRAM_BINS + 1
+
+
+def signature(data, nodata=NODATA):
+    """
+    Embedding of one band: reflectance quantiles, a normalised histogram
+    and the share of valid pixels, as a float32 vector of EMBEDDING_DIMS.
+
+    Histogram bins sum to 1 and quantiles are in reflectance units, so
+    tiles of any size or nodata share are comparable by Euclidean
+    distance.
+    """
+    if nodata is None:
+        valid = np.ones(data.shape, bool)
+    elif np.isnan(nodata):
+        valid = ~np.isnan(data)
+    else:
+        valid = data != nodata
+    vector = np.zeros(EMBEDDING_DIMS, dtype=np.float32)
+    vector[-1] = valid.mean() if valid.size else 0.0
+    values = data[valid].astype(np.float32) / REFLECTANCE_SCALE
+    if values.size == 0:
+        return vector
+    vector[:len(QUANTILES)] = np.quantile(values, QUANTILES)
+    hist, _ = np.histogram(np.clip(values, 0, HISTOGRAM_MAX), bins=HISTOGRAM_BINS,
+                           range=(0, HISTOGRAM_MAX))
+    vector[len(QUANTILES):-1] = hist / values.size
+    return vector
+
+
+def tile_embedding(path):
+    """
+    {"path", "embedding"} for one GeoTIFF, or None if it can't be read.
+
+    The band is read once at 1/OVERVIEW_FACTOR resolution with nearest
+    resampling, so nodata pixels stay nodata and GDAL serves the read
+    from the closest internal overview.
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+
+    try:
+        with rasterio.open(path) as src:
+            height = max(1, math.ceil(src.height / OVERVIEW_FACTOR))
+            width = max(1, math.ceil(src.width / OVERVIEW_FACTOR))
+            data = src.read(1, out_shape=(height, width), resampling=Resampling.nearest)
+            nodata = src.nodata if src.nodata is not None else NODATA
+        return {"path": path, "embedding": signature(data, nodata).astype(float).round(5).tolist()}
+    except Exception as e:
+        print(f"Failed to embed {path}: {e}")
+        return None
+
+
+def update_database(records):
+    """
+    Write embeddings onto the matching MonkDB rows (synthetic variants
+    share their source raster's path, and so its embedding), adding the
+    `embedding` column first if the table predates it.
+    """
+    from footprints import connect, DB_SCHEMA, RASTER_TABLE
+    from insert_v2 import add_missing_columns
+
+    conn = connect()
+    cursor = conn.cursor()
+    try:
+        # Tables created before embeddings existed lack the column
+        add_missing_columns(cursor)
+        cursor.executemany(
+            f"""UPDATE {DB_SCHEMA}.{RASTER_TABLE}
+                SET embedding = ?
+                WHERE path = ?""",
+            [(r["embedding"], r["path"]) for r in records]
+        )
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def main(argv=None):
+    import pandas as pd
+    import dask.dataframe as dd
+    from dask import delayed, compute
+
+    parser = argparse.ArgumentParser(
+        description="Compute per-tile spectral embeddings for similarity search.")
+    parser.add_argument("--no-db", action="store_true",
+                        help="Only update the tile index, not MonkDB rows")
+    args = parser.parse_args(argv)
+
+    if export_format == "parquet":
+        index_df = pd.read_parquet(index_file_path)
+    else:
+        index_df = pd.read_csv(index_file_path)
+
+    paths = index_df["path"].unique()
+    print(f"Embedding {len(paths)} tiles ({EMBEDDING_DIMS} dims, 1/{OVERVIEW_FACTOR} reads)...")
+    tasks = [delayed(tile_embedding)(p) for p in paths]
+    results = [r for r in compute(*tasks, scheduler="processes") if r is not None]
+    print(f"Embedded {len(results)} tiles, {len(paths) - len(results)} failed.")
+
+    # The index keeps embeddings as JSON so the local ANN index can be
+    # built without a database
+    embeddings = pd.DataFrame({"path": [r["path"] for r in results],
+                               "embedding": [json.dumps(r["embedding"]) for r in results]})
+    index_df = index_df.drop(columns=["embedding"], errors="ignore").merge(
+        embeddings, on="path", how="left")
+    df = dd.from_pandas(index_df, npartitions=1)
+    if export_format == "parquet":
+        df.to_parquet(index_file_path, write_index=False, overwrite=True)
+    else:
+        df.to_csv(index_file_path, index=False, single_file=True)
+    print(f"Tile index updated: {index_file_path}")
+
+    if results and not args.no_db:
+        update_database(results)
+        print(f"Updated embeddings for {len(results)} tiles in MonkDB.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import io
+import os
+import re
+import math
+import time
+import glob
+import shutil
+import hashlib
+import argparse
+import threading
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import shapely
+from shapely import STRtree
+from shapely.geometry import box
+
+import footprints
+from footprints import config
+
+SOURCE = config.get("tile_server", "source", fallback="db").lower()
+HOST = config.get("tile_server", "host", fallback="127.0.0.1")
+PORT = config.getint("tile_server", "port", fallback=8080)
+TILE_CACHE_SIZE = config.getint("tile_server", "cache_size", fallback=4096)
+PYRAMID_MAX_ZOOM = config.getint("tile_server", "pyramid_max_zoom", fallback=6)
+PYRAMID_DIR = config.get("tile_server", "pyramid_dir",
+                         fallback=os.path.join(os.getcwd(), "results", "v3", "tile_pyramid"))
+OUTLINE_MIN_ZOOM = config.getint("tile_server", "outline_min_zoom", fallback=9)
+
+TILE_SIZE = 256
+EARTH_RADIUS = 6378137.0
+ORIGIN_SHIFT = math.pi * EARTH_RADIUS
+MAX_LAT = 85.05112878
+MAX_ZOOM = 22
+
+TILE_PATH = re.compile(r"^/(\d+)/(\d+)/(\d+)(?:\.png)?$")
+
+# Populated by load_footprints()
+FOOTPRINTS = {"geoms": None, "layers": None, "layer_names": frozenset(), "tree": None,
+              "pyramid_dir": None}
+_pyramid_lock = threading.Lock()
+
+INDEX_HTML = """<!DOCTYPE html>
+<html><head><title>MonkDB Tile Footprints</title>
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>html, body, #map { height: 100%; margin: 0; }</style></head>
+<body><div id="map"></div><script>
+var map = L.map('map').setView([50, -3.6], 6);
+L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png',
+            {attribution: '&copy; OpenStreetMap contributors'}).addTo(map);
+L.tileLayer('/{z}/{x}/{y}.png', {opacity: 0.8}).addTo(map);
+</script></body></html>
+"""
+
+
+def to_mercator(coords):
+    """
+    Vectorised lon/lat (degrees) -> Web Mercator (metres).
+    """
+    lon = np.radians(coords[:, 0])
+    lat = np.radians(np.clip(coords[:, 1], -MAX_LAT, MAX_LAT))
+    return np.column_stack([EARTH_RADIUS * lon,
+                            EARTH_RADIUS * np.log(np.tan(math.pi / 4 + lat / 2))])
+
+
+def tile_bounds(z, x, y):
+    """
+    Web Mercator bounds (minx, miny, maxx, maxy) of an XYZ tile.
+    """
+    size = 2 * ORIGIN_SHIFT / (1 << z)
+    minx = -ORIGIN_SHIFT + x * size
+    maxy = ORIGIN_SHIFT - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def _update_version(digest, layers, geoms):
+    digest.update("\0".join(map(str, layers)).encode("utf-8"))
+    for wkb in shapely.to_wkb(np.array(geoms, dtype=object)):
+        digest.update(wkb)
+
+
+def load_footprints(source=SOURCE):
+    """
+    Load every footprint once, project it to Web Mercator and index it.
+
+    The on-disk pyramid lives under PYRAMID_DIR/<source>-<data version>,
+    where the version is a digest of the loaded layers and footprints, so
+    a changed table or index never serves tiles rendered from older data.
+    Pyramids of older versions of the same source are removed.
+    """
+    start = time.perf_counter()
+    layers, geoms = [], []
+    version = hashlib.blake2b(digest_size=8)
+    if source == "index":
+        df = footprints.load_tile_index()
+        layers = df["layer"].tolist()
+        geoms = list(df["geometry"])
+        _update_version(version, layers, geoms)
+    else:
+        conn = footprints.connect()
+        cursor = conn.cursor()
+        try:
+            for batch in footprints.iter_footprint_batches(
+                    cursor, columns=("layer", "area")):
+                batch_layers = [row[0] for row in batch]
+                batch_geoms = footprints.footprint_geometries(
+                    [row[1] for row in batch])
+                _update_version(version, batch_layers, batch_geoms)
+                layers.extend(batch_layers)
+                geoms.extend(batch_geoms)
+        finally:
+            cursor.close()
+            conn.close()
+
+    merc = shapely.transform(np.array(geoms, dtype=object), to_mercator)
+    FOOTPRINTS["geoms"] = merc
+    FOOTPRINTS["layers"] = np.array(layers, dtype=object)
+    FOOTPRINTS["layer_names"] = frozenset(layers)
+    FOOTPRINTS["tree"] = STRtree(merc)
+    pyramid_dir = os.path.join(PYRAMID_DIR, f"{source}-{version.hexdigest()}")
+    for stale in glob.glob(os.path.join(PYRAMID_DIR, f"{source}-*")):
+        if stale != pyramid_dir:
+            shutil.rmtree(stale, ignore_errors=True)
+    FOOTPRINTS["pyramid_dir"] = pyramid_dir
+    get_tile.cache_clear()
+    print(f"✅ Indexed {len(merc)} footprints from {source} in "
+          f"{round(time.perf_counter() - start, 3)} sec")
+
+
+def encode_png(rgba):
+    import matplotlib.pyplot as plt
+
+    buf = io.BytesIO()
+    plt.imsave(buf, rgba, format="png")
+    return buf.getvalue()
+
+
+def render_tile(z, x, y, layer=None):
+    """
+    Rasterize the footprints intersecting one tile into PNG bytes.
+
+    Cells are shaded by the number of overlapping footprints; outlines are
+    drawn from OUTLINE_MIN_ZOOM upwards, where individual tiles are legible.
+    """
+    from matplotlib import colormaps
+    from rasterio.features import rasterize
+    from rasterio.enums import MergeAlg
+    from rasterio.transform import from_bounds
+
+    bounds = tile_bounds(z, x, y)
+    idx = FOOTPRINTS["tree"].query(box(*bounds), predicate="intersects")
+    if layer:
+        idx = idx[FOOTPRINTS["layers"][idx] == layer]
+    rgba = np.zeros((TILE_SIZE, TILE_SIZE, 4))
+    if len(idx):
+        geoms = FOOTPRINTS["geoms"][idx]
+        transform = from_bounds(*bounds, TILE_SIZE, TILE_SIZE)
+        counts = rasterize(((g, 1) for g in geoms), out_shape=(TILE_SIZE, TILE_SIZE),
+                           transform=transform, merge_alg=MergeAlg.add,
+                           dtype="uint32")
+        shade = np.log1p(counts) / np.log1p(max(int(counts.max()), 1))
+        rgba = colormaps["inferno"](0.3 + 0.7 * shade)
+        rgba[..., 3] = np.where(counts > 0, 0.35 + 0.5 * shade, 0.0)
+        if z >= OUTLINE_MIN_ZOOM:
+            edges = rasterize(((g, 1) for g in shapely.boundary(geoms)),
+                              out_shape=(TILE_SIZE, TILE_SIZE),
+                              transform=transform, dtype="uint8")
+            rgba[edges > 0] = (1.0, 1.0, 1.0, 0.9)
+    return encode_png(rgba)
+
+
+@lru_cache(maxsize=TILE_CACHE_SIZE)
+def get_tile(z, x, y, layer=None):
+    """
+    Tile lookup: LRU memory cache, then the on-disk pyramid, then render.
+
+    Tiles up to PYRAMID_MAX_ZOOM are persisted in the pyramid directory of
+    the loaded data version so low-zoom views (which touch the most
+    footprints) are rendered at most once per version.
+    """
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise ValueError(f"Tile {z}/{x}/{y} is out of range")
+    if z > PYRAMID_MAX_ZOOM:
+        return render_tile(z, x, y, layer)
+    path = os.path.join(FOOTPRINTS["pyramid_dir"], layer or "all",
+                        str(z), str(x), f"{y}.png")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+    data = render_tile(z, x, y, layer)
+    with _pyramid_lock:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers check os.path.exists without the lock; never expose a
+        # half-written PNG
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return data
+
+
+def prerender_pyramid(max_zoom=PYRAMID_MAX_ZOOM, layer=None):
+    """
+    Render every non-empty tile from zoom 0 to max_zoom into PYRAMID_DIR.
+    """
+    minx, miny, maxx, maxy = shapely.total_bounds(FOOTPRINTS["geoms"])
+    rendered = 0
+    for z in range(max_zoom + 1):
+        size = 2 * ORIGIN_SHIFT / (1 << z)
+        x0, x1 = int((minx + ORIGIN_SHIFT) // size), int((maxx + ORIGIN_SHIFT) // size)
+        y0, y1 = int((ORIGIN_SHIFT - maxy) // size), int((ORIGIN_SHIFT - miny) // size)
+        for x in range(max(x0, 0), min(x1, (1 << z) - 1) + 1):
+            for y in range(max(y0, 0), min(y1, (1 << z) - 1) + 1):
+                get_tile(z, x, y, layer)
+                rendered += 1
+    print(f"✅ Pre-rendered {rendered} tiles up to zoom {max_zoom} into "
+          f"{FOOTPRINTS['pyramid_dir']}")
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path in ("/", "/index.html"):
+            return self._send(200, INDEX_HTML.encode("utf-8"), "text/html")
+        match = TILE_PATH.match(url.path)
+        if not match:
+            return self._send(404, b"Not found", "text/plain")
+        z, x, y = (int(v) for v in match.groups())
+        if z > MAX_ZOOM or x >= (1 << z) or y >= (1 << z):
+            return self._send(404, b"Tile out of range", "text/plain")
+        layer = parse_qs(url.query).get("layer", [None])[0]
+        # Only known layers: the name becomes a pyramid path and a cache key
+        if layer and layer not in FOOTPRINTS["layer_names"]:
+            return self._send(404, b"Unknown layer", "text/plain")
+        try:
+            data = get_tile(z, x, y, layer)
+        except Exception as e:
+            return self._send(500, f"Render failed: {e}".encode("utf-8"), "text/plain")
+        self._send(200, data, "image/png")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "public, max-age=300")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host=HOST, port=PORT):
+    return ThreadingHTTPServer((host, port), TileHandler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve footprint map tiles.")
+    parser.add_argument("--source", default=SOURCE, choices=["db", "index"])
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--prerender", action="store_true",
+                        help="Render the low-zoom pyramid before serving")
+    args = parser.parse_args(argv)
+
+    load_footprints(args.source)
+    if args.prerender:
+        prerender_pyramid()
+    server = make_server(args.host, args.port)
+    print(f"🗺️ Serving footprint tiles on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
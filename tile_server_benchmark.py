@@ -0,0 +1,90 @@
+import os
+import time
+import random
+import argparse
+import threading
+import statistics
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import shapely
+
+import tile_server
+
+results_dir = os.path.join(os.getcwd(), "results", "v3")
+
+
+def sample_tiles(count, min_zoom, max_zoom, seed=42):
+    """
+    Random XYZ tiles that fall inside the footprint extent.
+    """
+    rng = random.Random(seed)
+    minx, miny, maxx, maxy = shapely.total_bounds(tile_server.FOOTPRINTS["geoms"])
+    origin = tile_server.ORIGIN_SHIFT
+    tiles = []
+    for _ in range(count):
+        z = rng.randint(min_zoom, max_zoom)
+        size = 2 * origin / (1 << z)
+        x = int((rng.uniform(minx, maxx) + origin) // size)
+        y = int((origin - rng.uniform(miny, maxy)) // size)
+        tiles.append((z, min(max(x, 0), (1 << z) - 1), min(max(y, 0), (1 << z) - 1)))
+    return tiles
+
+
+def run_pass(base_url, tiles, concurrency):
+    def fetch(tile):
+        start = time.perf_counter()
+        with urllib.request.urlopen(f"{base_url}/{tile[0]}/{tile[1]}/{tile[2]}.png") as resp:
+            resp.read()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(fetch, tiles))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(tiles),
+        "req_per_sec": round(len(tiles) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the footprint tile server.")
+    parser.add_argument("--source", default=tile_server.SOURCE, choices=["db", "index"])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--min-zoom", type=int, default=4)
+    parser.add_argument("--max-zoom", type=int, default=12)
+    args = parser.parse_args()
+
+    tile_server.load_footprints(args.source)
+    server = tile_server.make_server("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    tiles = sample_tiles(args.requests, args.min_zoom, args.max_zoom)
+    print(f"🔍 Benchmarking {len(tiles)} tile requests "
+          f"(z{args.min_zoom}-z{args.max_zoom}, concurrency {args.concurrency})...")
+    cold = run_pass(base_url, tiles, args.concurrency)
+    warm = run_pass(base_url, tiles, args.concurrency)
+    server.shutdown()
+
+    cache = tile_server.get_tile.cache_info()
+    os.makedirs(results_dir, exist_ok=True)
+    output_path = os.path.join(results_dir, "tile_server_benchmark.txt")
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(f"Footprints indexed: {len(tile_server.FOOTPRINTS['geoms'])}\n")
+        f.write(f"Zoom range: {args.min_zoom}-{args.max_zoom}, "
+                f"concurrency: {args.concurrency}\n")
+        f.write(f"Cold cache: {cold}\n")
+        f.write(f"Warm cache: {warm}\n")
+        f.write(f"LRU cache: hits={cache.hits}, misses={cache.misses}, "
+                f"size={cache.currsize}/{cache.maxsize}\n")
+    print(f"Cold: {cold}\nWarm: {warm}")
+    print(f"✅ Saved: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
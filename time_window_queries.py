@@ -0,0 +1,131 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+import footprints
+from footprints import config, DB_SCHEMA, RASTER_TABLE
+
+# Window length and anchor; without an explicit end the window closes at
+# the newest acquisition in the table, so "last 30 days" means the last
+# 30 days of imagery rather than of wall-clock time
+WINDOW_DAYS = config.getint("queries", "time_window_days", fallback=30)
+WINDOW_END = config.get("queries", "time_window_end", fallback="")
+
+results_dir = os.path.join(os.getcwd(), "results", "v3")
+output_path = os.path.join(results_dir, "time_window_query_results.txt")
+
+
+def resolve_window(cursor):
+    """
+    (start, end) of the acquisition window as ISO-8601 strings, or None
+    when no end is configured and no row has an acquisition time.
+    """
+    if WINDOW_END:
+        end = datetime.fromisoformat(WINDOW_END.replace("Z", "+00:00"))
+    else:
+        cursor.execute(
+            f"SELECT MAX(acquired_at) FROM {DB_SCHEMA}.{RASTER_TABLE}")
+        latest = cursor.fetchone()[0]
+        if latest is None:
+            return None
+        # MonkDB returns timestamps as epoch milliseconds
+        end = (datetime.fromtimestamp(latest / 1000, tz=timezone.utc)
+               + timedelta(seconds=1))
+    start = end - timedelta(days=WINDOW_DAYS)
+    return start.strftime("%Y-%m-%dT%H:%M:%SZ"), end.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def build_queries(window, window_params, sample_wkt):
+    intersects = footprints.intersects_filter(sample_wkt)
+    return {
+        "Centroids within bounding box in window": (f"""
+            SELECT tile_id, centroid, acquired_at
+            FROM {DB_SCHEMA}.{RASTER_TABLE}
+            WHERE {window}
+              AND within(centroid, 'POLYGON ((-10 40, 10 40, 10 60, -10 60, -10 40))')
+            ORDER BY acquired_at DESC
+            LIMIT 100;
+        """, window_params),
+
+        "Tiles intersecting sample WKT in window": (f"""
+            SELECT tile_id, layer, area_km, acquired_at
+            FROM {DB_SCHEMA}.{RASTER_TABLE}
+            WHERE {window}
+              AND {intersects[0]}
+            ORDER BY acquired_at DESC
+            LIMIT 100;
+        """, window_params + intersects[1]),
+
+        "Centroids within 1000km of [-3.6, 50.05] in window": (f"""
+            SELECT tile_id, layer, acquired_at,
+                   distance(centroid, [-3.6, 50.05]) AS dist_m
+            FROM {DB_SCHEMA}.{RASTER_TABLE}
+            WHERE {window}
+              AND distance(centroid, [-3.6, 50.05]) < 1000000
+            ORDER BY dist_m ASC
+            LIMIT 20;
+        """, window_params),
+
+        "Latest acquisition per geohash region in window": (f"""
+            SELECT geohash3, MAX(acquired_at) AS latest, COUNT(*) AS tiles
+            FROM {DB_SCHEMA}.{RASTER_TABLE}
+            WHERE {window}
+            GROUP BY geohash3
+            ORDER BY latest DESC;
+        """, window_params),
+
+        "Tiles per acquisition month and layer": (f"""
+            SELECT acquired_month, layer, COUNT(*) AS tiles
+            FROM {DB_SCHEMA}.{RASTER_TABLE}
+            GROUP BY acquired_month, layer
+            ORDER BY acquired_month DESC, layer;
+        """, ()),
+    }
+
+
+def main():
+    os.makedirs(results_dir, exist_ok=True)
+    conn = footprints.connect()
+    cursor = conn.cursor()
+
+    window_bounds = resolve_window(cursor)
+    cursor.execute(f"SELECT area FROM {DB_SCHEMA}.{RASTER_TABLE} LIMIT 1")
+    sample_row = cursor.fetchone()
+    if sample_row is None or window_bounds is None:
+        cursor.close()
+        conn.close()
+        if sample_row is None:
+            print("❌ No geometries found in the database.")
+        else:
+            print("❌ No tile has an acquisition time (acquired_at); re-ingest with "
+                  "insert_v2.py or set [queries] time_window_end.")
+        return 1
+    start, end = window_bounds
+    window, window_params = footprints.time_window_filter(start, end)
+    sample_wkt = footprints.footprint_geometries([sample_row[0]])[0].wkt
+
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        output_file.write(f"Acquisition window: {start} → {end}\n")
+        for name, (sql, params) in build_queries(
+                window, window_params, sample_wkt).items():
+            output_file.write(f"\n\n### {name}\n")
+            started = time.perf_counter()
+            try:
+                cursor.execute(sql, params)
+                df = pd.DataFrame(cursor.fetchall())
+                output_file.write(df.to_string(index=False))
+            except Exception as e:
+                output_file.write(f"Query failed: {e}\n")
+            output_file.write(
+                f"\n⏱️ Query Time: {round(time.perf_counter() - started, 3)} sec\n")
+
+    cursor.close()
+    conn.close()
+    print(f"\n✅ Finished time-window queries. Results saved to {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())